@@ -0,0 +1,440 @@
+"""
+bench.py — FENUASIM
+Benchmark de bout en bout des synchros sur des jeux de données synthétiques.
+
+Pour chaque taille (1k, 10k, 100k, 1m lignes de commandes), bench.py :
+  1. génère orders, insurances, airalo_orders, airalo_packages et leads
+     (devises EUR / XPF mêlées, clients récurrents, codes promo, statuts variés) ;
+  2. les sert par un Supabase local (fake_supabase.py) et démarre un Odoo
+     factice vide (fake_odoo.py) ;
+  3. lance les scripts comme en production, chacun dans son propre process :
+     main_products.py, main_fast.py, sync_leads.py --bulk, puis billing.py
+     --batch après confirmation des devis (le paiement confirmé en production) ;
+  4. mesure pour chaque script : lignes traitées, durée, lignes/s, pic de
+     mémoire (RSS du script) et appels Odoo par ligne, détaillés par
+     fonction appelante (odoo_budget).
+
+--check compare les appels de chaque pipeline à son budget (RPC_BUDGETS) :
+commandes Stripe et assurances de main_fast.py sont comptées séparément,
+d'après la phase METRICS de chaque appel (odoo_budget). Un lookup par ligne
+ajouté dans une synchro fait échouer la CI et nomme la fonction en cause.
+Chaque passe part d'un fichier de marqueurs neuf (SYNC_STATE_FILE) : la
+2e passe relit toutes les lignes et mesure l'anti-doublon (aucun appel par
+ligne déjà synchronisée), pas seulement le saut par marqueur.
+
+Volumes par taille N : N commandes, N/5 assurances, N/5 commandes Airalo,
+N/10 offres Airalo, N/2 leads. Le jeu 1m demande plusieurs Go de mémoire
+(données + Odoo factice dans le process du benchmark) et un long moment.
+
+Usage :
+  python bench.py                                    # 1k et 10k, tous les scripts
+  python bench.py --sizes 1k,10k,100k,1m --latency 0.05 --json bench.json
+  python bench.py --sizes 10k --scripts main_fast,billing --rounds 2   # 2e passe : régime établi
+  python bench.py --sizes 10k --dump bench_data      # écrit les jeux en JSONL (fake_supabase.py --data)
+  python bench.py --sizes 1k --rounds 2 --check       # budgets d'appels Odoo (CI, rpc-budget.yml)
+
+Les variables d'environnement de l'appelant (SYNC_ENGINE, ODOO_CONCURRENCY,
+ODOO_BATCH_SIZE…) sont transmises aux scripts : c'est ainsi qu'on compare
+deux réglages.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from fake_odoo import FakeOdooServer
+from fake_supabase import FakeSupabaseServer
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+XPF_PER_EUR = 119.33
+PROMO_CODES = ("FIRST", "FENUA10", "WELCOME5", "BLACKFRIDAY")
+FIRST_NAMES = ("Hina", "Teva", "Moana", "Marie", "Jean", "Tiare", "Lucas", "Emma", "Manu", "Vaea")
+LAST_NAMES = ("Tehei", "Martin", "Bernard", "Teriierooiterai", "Dubois", "Tamarii", "Petit", "Wong")
+DESTINATIONS = ("France", "Japon", "États-Unis", "Nouvelle-Zélande", "Australie", "Europe", "Monde")
+REGIONS = ("EU", "ASIA", "OCEANIA", "AMERICAS", "GLOBAL")
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * factor)
+
+
+# ─── DONNÉES SYNTHÉTIQUES ─────────────────────────────────────────────────────
+def generate(size, seed=0):
+    """Tables Supabase synthétiques pour `size` commandes (déterministe pour une graine)."""
+    rng = random.Random(seed)
+    customers = max(10, size // 3)      # ~3 achats par client en moyenne, clients fidèles sur-représentés
+    year = 365 * 24 * 3600
+
+    def customer():
+        index = int(customers * rng.random() ** 2)
+        email = f"client{index}@example.com"
+        if rng.random() < 0.05:           # casse et espaces comme saisis par les clients
+            email = f" Client{index}@Example.com "
+        return email, FIRST_NAMES[index % len(FIRST_NAMES)], LAST_NAMES[index % len(LAST_NAMES)]
+
+    def created_at(i, count):
+        return (START + timedelta(seconds=year * i / max(1, count))).isoformat()
+
+    packages = []
+    for i in range(max(20, size // 10)):
+        amount = rng.choice((1, 3, 5, 10, 20, 50))
+        packages.append({
+            "id": f"bench-{i:06d}-{amount}gb",
+            "name": f"{rng.choice(DESTINATIONS)} {amount} GB",
+            "region": rng.choice(REGIONS),
+            "price": round(rng.uniform(4, 60), 2),
+            "data_amount": amount,
+        })
+
+    orders = []
+    for i in range(size):
+        email, first_name, last_name = customer()
+        package = rng.choice(packages)
+        currency = "XPF" if rng.random() < 0.35 else "EUR"
+        price = package["price"] * (0.9 if rng.random() < 0.15 else 1.0)
+        orders.append({
+            "id": i + 1,
+            "created_at": created_at(i, size),
+            "stripe_session_id": f"cs_bench_{i:08d}",
+            "status": rng.choices(("completed", "pending", "failed"), (92, 5, 3))[0],
+            "amount": round(price * XPF_PER_EUR) if currency == "XPF" else round(price * 100),
+            "currency": currency.lower() if rng.random() < 0.5 else currency,
+            "email": email,
+            "first_name": first_name,
+            "last_name": last_name,
+            "package_id": package["id"],
+            "package_name": package["name"],
+            "data_amount": package["data_amount"],
+            "data_unit": "GB",
+            "promo_code": rng.choice(PROMO_CODES) if rng.random() < 0.15 else None,
+            "destination_name": package["name"].rsplit(" ", 2)[0],
+        })
+
+    insurances = []
+    for i in range(size // 5):
+        email, first_name, last_name = customer()
+        start = START + timedelta(days=rng.randint(0, 365))
+        premium = round(rng.uniform(15, 120), 2)
+        insurances.append({
+            "id": i + 1,
+            "created_at": created_at(i, size // 5),
+            "adhesion_number": f"ADH-BENCH-{i:08d}",
+            "status": rng.choices(("paid", "active", "pending"), (60, 30, 10))[0],
+            "total_amount": round(premium + 5, 2),
+            "premium_ava": premium,
+            "frais_distribution": 5.0,
+            "product_type": rng.choice(("ava_tourist_card", "ava_carte_sante", "ava_pass")),
+            "user_email": email,
+            "subscriber_first_name": first_name,
+            "subscriber_last_name": last_name,
+            "start_date": start.date().isoformat(),
+            "end_date": (start + timedelta(days=rng.choice((7, 15, 30, 90)))).date().isoformat(),
+            "contract_number": f"C{i:08d}" if rng.random() < 0.5 else None,
+            "contract_link": None,
+        })
+
+    airalo_orders = []
+    for i in range(size // 5):
+        email, first_name, last_name = customer()
+        airalo_orders.append({
+            "id": i + 1,
+            "created_at": created_at(i, size // 5),
+            "order_id": f"AIR-{i:08d}",
+            "email": email,
+            "package_id": rng.choice(packages)["id"],
+            "prenom": first_name,
+            "nom": last_name,
+        })
+
+    leads = []
+    for i in range(size // 2):
+        # Un tiers des inscrits à la newsletter ont déjà acheté
+        email, first_name, last_name = customer() if rng.random() < 0.33 else (f"lead{i}@example.com", "", "")
+        leads.append({
+            "id": i + 1,
+            "created_at": created_at(i, size // 2),
+            "email": email,
+            "first_name": first_name or None,
+            "last_name": last_name or None,
+            "source": "popup_newsletter" if rng.random() < 0.9 else "footer",
+        })
+
+    for package in packages:
+        del package["data_amount"]
+    return {
+        "orders": orders,
+        "insurances": insurances,
+        "airalo_orders": airalo_orders,
+        "airalo_packages": packages,
+        "leads": leads,
+    }
+
+
+def dump(tables, path):
+    os.makedirs(path, exist_ok=True)
+    for name, rows in tables.items():
+        with open(os.path.join(path, f"{name}.jsonl"), "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+# ─── ÉTAPES MESURÉES ──────────────────────────────────────────────────────────
+def confirm_quotes(odoo):
+    """Confirme les devis du faux Odoo (hors comptage d'appels) ; retourne le nombre de commandes à facturer."""
+    with odoo.lock:
+        ids = [rec["id"] for rec in odoo.table("sale.order").values() if rec.get("state") == "draft"]
+        if ids:
+            odoo.rpc_action_confirm("sale.order", ids)
+        return sum(1 for rec in odoo.table("sale.order").values() if rec.get("invoice_status") == "to invoice")
+
+
+def _count(rows, **where):
+    return sum(1 for row in rows if all(row.get(k) in v for k, v in where.items()))
+
+
+# nom -> (ligne de commande, lignes sources traitées par pipeline {table: lignes})
+STEPS = {
+    "main_products": (["main_products.py"], lambda tables, odoo: {"airalo_packages": len(tables["airalo_packages"])}),
+    "main_fast": (["main_fast.py"], lambda tables, odoo: {
+        "orders": _count(tables["orders"], status={"completed"}),
+        "insurances": _count(tables["insurances"], status={"paid", "active"}),
+    }),
+    "sync_leads": (["sync_leads.py", "--bulk"], lambda tables, odoo: {
+        "leads": _count(tables["leads"], source={"popup_newsletter"}),
+    }),
+    "billing": (["billing.py", "--batch"], lambda tables, odoo: {"sale.order": confirm_quotes(odoo)}),
+}
+
+
+# Budgets d'appels Odoo : script -> pipeline -> {passe: (appels par ligne, appels fixes)}.
+# "new" : première passe sur un Odoo vide ; "synced" : passes suivantes, tout
+# est déjà synchronisé (0 appel par ligne : seuls les paquets de l'anti-doublon
+# et les index paginés, d'où un plafond de 1 appel pour 500 lignes). Les appels
+# fixes couvrent les références (catégories, compte, étiquette) et le
+# chargement paginé des index. "*" : appels hors de toute phase du pipeline.
+RPC_BUDGETS = {
+    "main_products": {
+        "airalo_packages": {"new": (0.03, 10), "synced": (0.005, 10)},
+    },
+    "main_fast": {
+        "orders": {"new": (0.35, 15), "synced": (0.002, 5)},
+        "insurances": {"new": (0.2, 15), "synced": (0.002, 5)},
+        "*": {"new": (0.0, 5), "synced": (0.0, 5)},
+    },
+    "sync_leads": {
+        "leads": {"new": (0.03, 10), "synced": (0.002, 5)},
+    },
+    "billing": {
+        "sale.order": {"new": (0.13, 10), "synced": (0.0, 5)},
+    },
+}
+# Phases METRICS rangées sous un pipeline dont le nom diffère (sinon : préfixe de la phase)
+PHASE_PIPELINES = {
+    "main_products": {"references": "airalo_packages", "catalog": "airalo_packages"},
+    "sync_leads": {"references": "leads", "opportunities": "leads", "partners": "leads"},
+    "billing": {"catchup": "sale.order"},
+}
+
+
+def pipeline_of(script, phase):
+    """Pipeline d'un appel Odoo d'après sa phase (orders.create -> orders), "*" si aucun."""
+    prefix = (phase or "").split(".")[0]
+    pipeline = PHASE_PIPELINES.get(script, {}).get(prefix, prefix)
+    return pipeline if pipeline in RPC_BUDGETS.get(script, {}) else "*"
+
+
+def check_budget(result):
+    """Messages d'erreur des pipelines du script qui dépassent leur budget d'appels."""
+    budgets = RPC_BUDGETS.get(result["script"])
+    if not budgets:
+        return []
+    phase = "new" if result["round"] == 1 else "synced"
+    messages = []
+    for pipeline, budget in budgets.items():
+        per_row, fixed = budget[phase]
+        rows = result["rows_by_pipeline"].get(pipeline, 0)
+        limit = per_row * rows + fixed
+        rpcs = result["rpc_pipelines"].get(pipeline, {})
+        total = sum(rpcs.values())
+        if total <= limit:
+            continue
+        callers = ", ".join(f"{caller} {n}" for caller, n in sorted(rpcs.items(), key=lambda item: -item[1])[:5])
+        messages.append(
+            f"{result['script']} / {pipeline} ({result['size']}, {phase}) : {total} appels Odoo pour "
+            f"{rows} lignes, budget {limit:.0f} ({per_row}/ligne + {fixed}) — {callers}"
+        )
+    return messages
+
+
+# Le script est lancé par un petit process intermédiaire : sous Linux, le
+# ru_maxrss d'un enfant garde la mémoire du parent au moment du fork, qui est
+# ici le benchmark avec tout le jeu de données.
+LAUNCHER = (
+    "import resource, subprocess, sys\n"
+    "code = subprocess.call(sys.argv[2:])\n"
+    "open(sys.argv[1], 'w').write(str(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))\n"
+    "sys.exit(code)\n"
+)
+
+
+def run_script(command, env, cwd, log_path, timeout=None):
+    """Lance un script ; retourne (code de sortie, durée s, pic RSS Mo)."""
+    rss_path = log_path + ".rss"
+    start = time.monotonic()
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-c", LAUNCHER, rss_path, sys.executable, os.path.join(REPO, command[0]), *command[1:]],
+            cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            code = process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            code = process.wait()
+    wall = time.monotonic() - start
+    try:
+        with open(rss_path) as f:
+            rss = int(f.read()) / 1024      # ru_maxrss : Ko sous Linux
+    except (OSError, ValueError):
+        rss = None
+    return code, wall, rss
+
+
+def rpc_report(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["calls"]
+
+
+def rpc_callers(calls):
+    """Appels par fonction appelante, d'après le rapport odoo_budget du script."""
+    counts = {}
+    for row in calls:
+        counts[row["caller"]] = counts.get(row["caller"], 0) + row["calls"]
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def rpc_pipelines(script, calls):
+    """{pipeline: {appelant: appels}} d'après la phase de chaque appel."""
+    counts = {}
+    for row in calls:
+        callers = counts.setdefault(pipeline_of(script, row.get("phase")), {})
+        callers[row["caller"]] = callers.get(row["caller"], 0) + row["calls"]
+    return counts
+
+
+def bench_size(label, size, steps, args):
+    print(f"\n🧪 Jeu {label} : génération…", flush=True)
+    tables = generate(size, args.seed)
+    print("   " + ", ".join(f"{name} {len(rows):,}".replace(",", " ") for name, rows in tables.items()), flush=True)
+    if args.dump:
+        dump(tables, os.path.join(args.dump, label))
+        print(f"   → {os.path.join(args.dump, label)}", flush=True)
+        return []
+
+    odoo = FakeOdooServer(port=0, latency=args.latency, record_latency=args.record_latency,
+                          fail_rate=args.fail_rate, fault_rate=args.fault_rate, seed=args.seed).start()
+    supabase = FakeSupabaseServer(tables, port=0).start()
+    workdir = tempfile.mkdtemp(prefix=f"fenuasim-bench-{label}-")
+    env = dict(os.environ, ODOO_URL=odoo.url, ODOO_DB="bench", ODOO_USER="bench", ODOO_PASSWORD="bench",
+               SUPABASE_URL=supabase.url, SUPABASE_KEY="bench", PYTHONUNBUFFERED="1")
+    if args.profile:
+        env["SYNC_PROFILE"] = "1"      # profils dans <dossier de travail>/profiles (sync_profile.py)
+    results = []
+    try:
+        for round_no in range(1, args.rounds + 1):
+            for name in steps:
+                command, source_rows = STEPS[name]
+                rows_by_pipeline = source_rows(tables, odoo.odoo)
+                rows = sum(rows_by_pipeline.values())
+                calls_before = sum(odoo.odoo.calls.values())
+                log_path = os.path.join(workdir, f"{name}-r{round_no}.log")
+                rpc_path = os.path.join(workdir, f"{name}-r{round_no}.rpc.json")
+                # Marqueurs neufs à chaque passe : la 2e relit tout et passe par l'anti-doublon
+                step_env = dict(env, ODOO_RPC_REPORT=rpc_path,
+                                SYNC_STATE_FILE=os.path.join(workdir, f"state-r{round_no}.json"))
+                code, wall, rss = run_script(command, step_env, workdir, log_path, args.timeout)
+                rpcs = sum(odoo.odoo.calls.values()) - calls_before
+                calls = rpc_report(rpc_path)
+                result = {
+                    "size": label, "round": round_no, "script": name, "exit_code": code,
+                    "rows": rows, "rows_by_pipeline": rows_by_pipeline, "wall_s": round(wall, 3),
+                    "rows_per_s": round(rows / wall, 1) if wall else None,
+                    "peak_rss_mb": round(rss, 1) if rss is not None else None,
+                    "rpcs": rpcs, "rpcs_per_row": round(rpcs / rows, 3) if rows else None,
+                    "rpc_callers": rpc_callers(calls), "rpc_pipelines": rpc_pipelines(name, calls),
+                    "log": log_path,
+                }
+                results.append(result)
+                report(result)
+                if code != 0:
+                    with open(log_path, encoding="utf-8", errors="replace") as f:
+                        tail = f.readlines()[-15:]
+                    print("   ❌ " + "   ".join(tail), flush=True)
+    finally:
+        odoo.stop()
+        supabase.stop()
+    return results
+
+
+def report(result):
+    rss = f"{result['peak_rss_mb']:.0f} Mo" if result["peak_rss_mb"] is not None else "?"
+    per_row = f"{result['rpcs_per_row']:.2f}" if result["rpcs_per_row"] is not None else "-"
+    status = "✅" if result["exit_code"] == 0 else f"❌ ({result['exit_code']})"
+    print(
+        f"{status} {result['size']:>5} r{result['round']} {result['script']:<14} "
+        f"{result['rows']:>9} lignes {result['wall_s']:>8.2f}s {result['rows_per_s'] or 0:>9.1f} lignes/s "
+        f"RSS {rss:>7}  {result['rpcs']:>7} RPC ({per_row}/ligne)",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des synchros sur données synthétiques")
+    parser.add_argument("--sizes", default="1k,10k", help="tailles séparées par des virgules (1k,10k,100k,1m)")
+    parser.add_argument("--scripts", default=",".join(STEPS), help=f"étapes à lancer, parmi {', '.join(STEPS)}")
+    parser.add_argument("--rounds", type=int, default=1, help="passes successives sur les mêmes données")
+    parser.add_argument("--latency", type=float, default=0.0, help="latence Odoo simulée par appel (s)")
+    parser.add_argument("--record-latency", type=float, default=0.0, help="latence Odoo par enregistrement écrit (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="part d'appels Odoo refusés en 503")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="part d'appels Odoo annulés (sérialisation)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--json", help="écrit les résultats dans ce fichier JSON")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile chaque script (SYNC_PROFILE=1) ; profils dans le dossier de travail")
+    parser.add_argument("--check", action="store_true",
+                        help="échoue si un pipeline dépasse son budget d'appels Odoo par ligne (RPC_BUDGETS)")
+    parser.add_argument("--dump", help="écrit les jeux de données en JSONL dans ce dossier, sans lancer les scripts")
+    args = parser.parse_args()
+
+    steps = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    unknown = [s for s in steps if s not in STEPS]
+    if unknown:
+        parser.error(f"étape(s) inconnue(s) : {', '.join(unknown)}")
+
+    all_results = []
+    for label in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        all_results += bench_size(label, parse_size(label), steps, args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\n📝 Résultats : {args.json}", flush=True)
+    over_budget = [message for result in all_results for message in check_budget(result)] if args.check else []
+    for message in over_budget:
+        print(f"🚨 Budget d'appels dépassé : {message}", flush=True)
+    if args.check and not over_budget:
+        print("✅ Budgets d'appels Odoo respectés.", flush=True)
+    if over_budget or any(r["exit_code"] != 0 for r in all_results):
+        raise SystemExit(1)
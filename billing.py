@@ -6,27 +6,49 @@ Complète main.py : confirme les commandes, crée et envoie les factures.
 Usage :
   - Importer dans main.py : from billing import auto_invoice_order
   - Ou lancer seul : python billing.py  (traite toutes les commandes confirmées sans facture)
+  - Mode lot : python billing.py --batch  (auto_invoice_orders : confirmation,
+    facturation et validation par paquets de BILLING_CHUNK commandes)
 
-Dépendances : aucune (utilise xmlrpc standard)
+Dépendances : requests (odoo_transport.py, odoo_pool.py du dépôt)
 """
 
+import argparse
 import os
-import xmlrpc.client
+
+from odoo_index import InvoiceOriginIndex, chunked
+from odoo_pool import OdooPool
+from odoo_refcache import RefCache
+from odoo_retry import classify
+from odoo_transport import server_proxy
+from sync_metrics import METRICS
+from sync_profile import profiled
+from sync_state import WatermarkStore
 
 # ─── CONFIG (mêmes variables que main.py) ─────────────────────────────────────
 ODOO_URL      = os.getenv("ODOO_URL")
 ODOO_DB       = os.getenv("ODOO_DB")
 ODOO_USER     = os.getenv("ODOO_USER")
 ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
+BILLING_CHUNK = int(os.getenv("BILLING_CHUNK", "50"))
+CATCHUP_PAGE = int(os.getenv("BILLING_CATCHUP_PAGE", "500"))
+CATCHUP_CURSOR = "billing_catchup"
+
+MENTION_293B = "TVA non applicable — article 293B du CGI."
 
 # ─── CONNEXION ────────────────────────────────────────────────────────────────
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common", allow_none=True)
+common = server_proxy(ODOO_URL, "common")
 uid    = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-m      = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object", allow_none=True)
+POOL   = OdooPool(ODOO_URL)
+m      = POOL.models  # un ServerProxy par thread
 
 def call(model, method, args, kw=None):
     return m.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
 
+# Factures existantes par nom de commande : chargé une fois (search_read paginé)
+INVOICES = InvoiceOriginIndex(call)
+# Modèle d'email de facture : id conservé sur disque (REFCACHE_FILE, REFCACHE_TTL)
+REF = RefCache(ODOO_URL, ODOO_DB, call)
+
 # ─── ÉTAPE 1 : CONFIRMER UNE COMMANDE ────────────────────────────────────────
 def confirm_order(order_id: int, expected_total: float = None) -> bool:
     """
@@ -54,24 +76,18 @@ def confirm_order(order_id: int, expected_total: float = None) -> bool:
 
 
 # ─── ÉTAPE 2 : CRÉER LA FACTURE ──────────────────────────────────────────────
-def create_invoice(order_id: int) -> int | None:
+def create_invoice(order_id: int, order_name: str = None) -> int | None:
     """
     Crée la facture client depuis une sale.order confirmée.
-    Retourne l'ID de la facture créée (account.move), ou None si déjà existante.
+    Retourne l'ID de la facture créée (account.move), ou celui de la facture existante.
     """
     try:
-        # Vérifier si une facture existe déjà
-        existing = call(
-            "account.move", "search",
-            [[
-                ("invoice_origin", "like", _get_order_name(order_id)),
-                ("move_type", "=", "out_invoice"),
-                ("state", "!=", "cancel")
-            ]]
-        )
+        # Vérifier si une facture existe déjà (index INVOICES, clé exacte)
+        order_name = order_name or _get_order_name(order_id)
+        existing = INVOICES.get(order_name)
         if existing:
-            print(f"  → Facture déjà existante pour commande {order_id} (invoice id={existing[0]})", flush=True)
-            return existing[0]
+            print(f"  → Facture déjà existante pour commande {order_id} (invoice id={existing})", flush=True)
+            return existing
 
         # Créer la facture via _create_invoices
         invoice_ids = call("sale.order", "_create_invoices", [[order_id]])
@@ -80,6 +96,8 @@ def create_invoice(order_id: int) -> int | None:
             return None
 
         invoice_id = invoice_ids[0]
+        INVOICES.add(order_name, invoice_id)
+        METRICS.count("records", len(invoice_ids), model="account.move", action="created")
         print(f"  ✓ Facture {invoice_id} créée pour commande {order_id}", flush=True)
         return invoice_id
 
@@ -111,11 +129,10 @@ def validate_invoice(invoice_id: int) -> bool:
             return True
 
         # Ajouter la mention légale 293B si absente
-        mention = "TVA non applicable — article 293B du CGI."
         narration = rec.get("narration") or ""
-        if mention not in (narration or ""):
+        if MENTION_293B not in (narration or ""):
             call("account.move", "write", [[invoice_id]], {
-                "vals": {"narration": f"{narration}\n{mention}".strip()}
+                "vals": {"narration": f"{narration}\n{MENTION_293B}".strip()}
             })
 
         # Valider la facture
@@ -151,17 +168,13 @@ def send_invoice_by_email(invoice_id: int) -> bool:
             return False
 
         # Récupérer le template email de facture
-        template_ids = call(
-            "mail.template", "search",
-            [[("model", "=", "account.move"), ("name", "ilike", "Invoice")]],
-            {"limit": 1}
-        )
+        template_id = _get_invoice_template_id()
 
-        if template_ids:
+        if template_id:
             # Envoi via le template standard
             call(
                 "mail.template", "send_mail",
-                [template_ids[0], invoice_id],
+                [template_id, invoice_id],
                 {"force_send": True}
             )
             print(f"  ✓ Facture {invoice_id} envoyée à {partner_email}", flush=True)
@@ -181,6 +194,18 @@ def send_invoice_by_email(invoice_id: int) -> bool:
         return False
 
 
+def _get_invoice_template_id() -> int | None:
+    """Modèle d'email de facture standard, mis en cache (REF) au lieu d'une recherche par facture."""
+    def lookup():
+        ids = call(
+            "mail.template", "search",
+            [[("model", "=", "account.move"), ("name", "ilike", "Invoice")]],
+            {"limit": 1}
+        )
+        return ids[0] if ids else None
+    return REF.resolve("mail.template:account.move/Invoice", lookup)
+
+
 def _get_partner_email(partner_id: int) -> str:
     try:
         rec = call("res.partner", "read", [[partner_id]], {"fields": ["email"]})[0]
@@ -190,7 +215,8 @@ def _get_partner_email(partner_id: int) -> str:
 
 
 # ─── PIPELINE COMPLET ─────────────────────────────────────────────────────────
-def auto_invoice_order(order_id: int, expected_total: float = None, send_email: bool = True) -> bool:
+def auto_invoice_order(order_id: int, expected_total: float = None, send_email: bool = True,
+                       order_name: str = None) -> bool:
     """
     Pipeline complet pour une commande :
       1. Confirme la commande
@@ -209,7 +235,7 @@ def auto_invoice_order(order_id: int, expected_total: float = None, send_email:
     if not confirm_order(order_id, expected_total):
         return False
 
-    invoice_id = create_invoice(order_id)
+    invoice_id = create_invoice(order_id, order_name)
     if not invoice_id:
         return False
 
@@ -222,56 +248,227 @@ def auto_invoice_order(order_id: int, expected_total: float = None, send_email:
     return True
 
 
+# ─── MODE LOT : CONFIRMATION → FACTURE → VALIDATION PAR PAQUETS ───────────────
+def _call_isolating(model, method, ids, kw=None):
+    """
+    Appelle `method` sur tous les ids en un seul RPC. Odoo annule l'appel
+    entier au premier enregistrement en erreur : le lot est alors coupé en
+    deux, récursivement, pour isoler les fautifs. Seule une erreur Odoo
+    définitive (Fault métier) est découpée : une panne incertaine (délai
+    dépassé, 502/504) remonte, l'appel a pu aboutir et un _create_invoices
+    rejoué laisserait une facture brouillon jamais validée.
+    Retourne (résultats des appels réussis, ids réussis, [(id, erreur)]).
+    """
+    if not ids:
+        return [], [], []
+    try:
+        return [call(model, method, [list(ids)], kw or {})], list(ids), []
+    except Exception as e:
+        if classify(e)[0] is not None:
+            raise
+        if len(ids) == 1:
+            return [], [], [(ids[0], e)]
+        middle = len(ids) // 2
+        left = _call_isolating(model, method, ids[:middle], kw)
+        right = _call_isolating(model, method, ids[middle:], kw)
+        return left[0] + right[0], left[1] + right[1], left[2] + right[2]
+
+
+def _invoice_chunk(item):
+    """Un paquet de commandes : ~6 RPC au total au lieu de 6+ par commande."""
+    order_ids, expected_totals = item
+    outcome = dict.fromkeys(order_ids)
+    print(f"\n📄 Facturation par lot : {len(order_ids)} commande(s)…", flush=True)
+
+    orders = {
+        o["id"]: o for o in call(
+            "sale.order", "read", [order_ids], {"fields": ["name", "state", "amount_total"]}
+        )
+    }
+
+    # 1. Confirmation des devis (les commandes déjà confirmées passent directement)
+    to_confirm, ready = [], []
+    for order_id in order_ids:
+        order = orders.get(order_id)
+        if not order:
+            print(f"  ✗ Commande {order_id} introuvable", flush=True)
+        elif order["state"] == "sale":
+            ready.append(order_id)
+        elif order["state"] not in ("draft", "sent"):
+            print(f"  ⚠ Commande {order_id} en état {order['state']} — skip", flush=True)
+        elif (expected_totals.get(order_id) is not None
+              and abs(float(order["amount_total"]) - expected_totals[order_id]) > 0.05):
+            print(f"  ⚠ Commande {order_id} : total Odoo={float(order['amount_total']):.2f} "
+                  f"vs attendu={expected_totals[order_id]:.2f} — skip", flush=True)
+        else:
+            to_confirm.append(order_id)
+
+    _, confirmed, failed = _call_isolating("sale.order", "action_confirm", to_confirm)
+    for order_id in confirmed:
+        print(f"  ✓ Commande {order_id} confirmée", flush=True)
+    for order_id, e in failed:
+        print(f"  ✗ Erreur confirmation commande {order_id} : {e}", flush=True)
+    ready = [order_id for order_id in order_ids if order_id in ready or order_id in confirmed]
+    if not ready:
+        return outcome
+
+    # 2. Factures : les existantes (index INVOICES) sont reprises, les autres
+    #    créées en un appel (grouped=True : une facture par commande, même client ou pas)
+    by_name = {orders[order_id]["name"]: order_id for order_id in ready}
+    INVOICES.prefetch(by_name)
+    invoice_of = {}
+    for name, order_id in by_name.items():
+        invoice_id = INVOICES.get(name)
+        if invoice_id:
+            invoice_of[order_id] = invoice_id
+            print(f"  → Facture déjà existante pour commande {order_id} (invoice id={invoice_id})", flush=True)
+
+    to_invoice = [order_id for order_id in ready if order_id not in invoice_of]
+    created, _, invoice_errors = _call_isolating("sale.order", "_create_invoices", to_invoice, {"grouped": True})
+    for order_id, e in invoice_errors:
+        print(f"  ✗ Erreur création facture pour commande {order_id} : {e}", flush=True)
+    new_ids = [invoice_id for ids in created for invoice_id in ids or []]
+    METRICS.count("records", len(new_ids), model="account.move", action="created")
+
+    moves = call(
+        "account.move", "read",
+        [new_ids + list(invoice_of.values())],
+        {"fields": ["invoice_origin", "state", "narration"]}
+    ) if new_ids or invoice_of else []
+    for move in moves:
+        order_id = by_name.get(move["invoice_origin"])
+        if move["id"] in new_ids and order_id:
+            invoice_of[order_id] = move["id"]
+            INVOICES.add(move["invoice_origin"], move["id"])
+            print(f"  ✓ Facture {move['id']} créée pour commande {order_id}", flush=True)
+    for order_id in to_invoice:
+        if order_id not in invoice_of and order_id not in dict(invoice_errors):
+            print(f"  ✗ Aucune facture créée pour commande {order_id}", flush=True)
+
+    # 3. Mention 293B (un write par texte identique) puis validation en un appel
+    stamps, drafts, posted = {}, [], set()
+    for move in moves:
+        if move["state"] == "posted":
+            posted.add(move["id"])
+            print(f"  → Facture {move['id']} déjà validée", flush=True)
+            continue
+        narration = move.get("narration") or ""
+        if MENTION_293B not in narration:
+            stamps.setdefault(f"{narration}\n{MENTION_293B}".strip(), []).append(move["id"])
+        drafts.append(move["id"])
+    for narration, ids in stamps.items():
+        _, _, failed = _call_isolating("account.move", "write", ids, {"vals": {"narration": narration}})
+        for invoice_id, e in failed:
+            print(f"  ✗ Erreur mention 293B facture {invoice_id} : {e}", flush=True)
+            drafts.remove(invoice_id)
+
+    _, validated, failed = _call_isolating("account.move", "action_post", drafts)
+    for invoice_id in validated:
+        posted.add(invoice_id)
+        print(f"  ✓ Facture {invoice_id} validée (posted)", flush=True)
+    for invoice_id, e in failed:
+        print(f"  ✗ Erreur validation facture {invoice_id} : {e}", flush=True)
+
+    for order_id in ready:
+        invoice_id = invoice_of.get(order_id)
+        if invoice_id in posted:
+            outcome[order_id] = invoice_id
+            print(f"  ✅ Commande {order_id} → facture {invoice_id} validée (en attente d'envoi)", flush=True)
+    return outcome
+
+
+def auto_invoice_orders(order_ids, expected_totals=None) -> dict:
+    """
+    Mode lot de auto_invoice_order : confirme, facture et valide `order_ids`
+    par paquets de BILLING_CHUNK (paquets en parallèle sur le pool).
+    action_confirm, _create_invoices et action_post sont appelés une fois par
+    paquet ; un enregistrement en erreur est isolé sans bloquer les autres.
+
+    Retourne {order_id: invoice_id validée, ou None en cas d'échec}.
+    """
+    expected_totals = expected_totals or {}
+    INVOICES.prefetch([])        # initialise l'index avant le pool (préchargé par paquet)
+    outcome = {}
+    for result in POOL.map(
+        _invoice_chunk,
+        [(chunk, expected_totals) for chunk in chunked(list(order_ids), BILLING_CHUNK)]
+    ):
+        outcome.update(result)
+    return outcome
+
+
 # ─── MODE RATTRAPAGE (lancer seul) ───────────────────────────────────────────
-def catchup_unfactured_orders():
+def catchup_unfactured_orders(batch: bool = False, restart: bool = False):
     """
     Traite toutes les commandes confirmées (state=sale) sans facture.
     Utile pour rattraper les commandes existantes.
-    Lance : python billing.py
+    Lance : python billing.py  (--batch : facturation par paquets)
+
+    Lecture par pages de BILLING_CATCHUP_PAGE commandes (pagination par id) ;
+    les commandes entièrement facturées sont exclues côté Odoo
+    (invoice_status), seules les factures de la page sont chargées : la
+    mémoire ne dépend pas de la taille de l'historique. Le curseur (dernier
+    id traité) est enregistré après chaque page dans SYNC_STATE_FILE : un run
+    interrompu reprend là où il s'était arrêté (restart=True : depuis le début).
     """
     print("\n🔍 Recherche des commandes confirmées sans facture…", flush=True)
 
-    # Commandes confirmées
-    confirmed_ids = call(
-        "sale.order", "search",
-        [[("state", "=", "sale")]],
-        {"order": "id asc"}
-    )
-
-    if not confirmed_ids:
-        print("  ℹ Aucune commande confirmée trouvée.", flush=True)
-        return
-
-    # Filtrer celles qui ont déjà une facture
-    orders_with_invoice = call(
-        "account.move", "search_read",
-        [[
-            ("move_type", "=", "out_invoice"),
-            ("state", "!=", "cancel"),
-            ("invoice_origin", "!=", False)
-        ]],
-        {"fields": ["invoice_origin"]}
-    )
-    invoiced_origins = {r["invoice_origin"] for r in orders_with_invoice}
-
-    # Noms des commandes confirmées
-    orders = call(
-        "sale.order", "read",
-        [confirmed_ids],
-        {"fields": ["id", "name", "partner_id", "amount_total", "origin"]}
-    )
-
-    to_process = [o for o in orders if o["name"] not in invoiced_origins]
-    print(f"  → {len(to_process)} commande(s) à facturer sur {len(orders)} confirmées\n", flush=True)
-
-    ok, ko = 0, 0
-    for order in to_process:
-        print(f"  Traitement : {order['name']} | {order['origin']} | {order['amount_total']:.2f} EUR", flush=True)
-        success = auto_invoice_order(order["id"], send_email=False)
-        if success:
-            ok += 1
+    state = WatermarkStore()
+    cursor = 0 if restart else state.cursor(CATCHUP_CURSOR)
+    if cursor:
+        print(f"  ↪ Reprise après la commande {cursor}", flush=True)
+
+    seen = ok = ko = 0
+    while True:
+        with METRICS.phase("catchup.read"):
+            orders = call(
+                "sale.order", "search_read",
+                [[("state", "=", "sale"), ("invoice_status", "!=", "invoiced"), ("id", ">", cursor)]],
+                {"fields": ["id", "name", "partner_id", "amount_total", "origin"],
+                 "limit": CATCHUP_PAGE, "order": "id asc"}
+            )
+            if not orders:
+                break
+            seen += len(orders)
+
+            # Factures existantes des seules commandes de la page (clé exacte)
+            INVOICES.clear().prefetch(o["name"] for o in orders)
+            to_process = [o for o in orders if o["name"] not in INVOICES]
+        METRICS.count("rows_skipped", len(orders) - len(to_process), table="sale.order", reason="already_invoiced")
+        print(f"  → {len(to_process)} commande(s) à facturer sur {len(orders)} "
+              f"(ids {orders[0]['id']}–{orders[-1]['id']})\n", flush=True)
+
+        if batch:
+            with METRICS.phase("catchup.invoice"):
+                outcome = auto_invoice_orders([order["id"] for order in to_process])
+            page_ok = sum(1 for invoice_id in outcome.values() if invoice_id)
+            page_ko = len(outcome) - page_ok
         else:
-            ko += 1
+            def process(order):
+                print(f"  Traitement : {order['name']} | {order['origin']} | {order['amount_total']:.2f} EUR", flush=True)
+                return auto_invoice_order(order["id"], send_email=False, order_name=order["name"])
+
+            # Commandes indépendantes : facturées en parallèle (ODOO_CONCURRENCY), logs dans l'ordre
+            with METRICS.phase("catchup.invoice"):
+                results = POOL.map(process, to_process)
+            page_ok = sum(1 for success in results if success)
+            page_ko = len(results) - page_ok
+        ok += page_ok
+        ko += page_ko
+
+        cursor = orders[-1]["id"]
+        state.set_cursor(CATCHUP_CURSOR, cursor)
+        state.save()
+        if len(orders) < CATCHUP_PAGE:
+            break
+
+    # Parcours complet : le prochain run repart du début
+    state.set_cursor(CATCHUP_CURSOR, None)
+    state.save()
+
+    if not seen:
+        print("  ℹ Aucune commande confirmée à facturer.", flush=True)
+        return
 
     print(f"\n{'═'*50}", flush=True)
     print(f"  Résultat : {ok} facturées ✓   {ko} échecs ✗", flush=True)
@@ -280,6 +477,15 @@ def catchup_unfactured_orders():
 
 # ─── LANCEMENT STANDALONE ─────────────────────────────────────────────────────
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Facturation des commandes confirmées sans facture")
+    parser.add_argument("--batch", action="store_true",
+                        help="confirme, facture et valide par paquets de BILLING_CHUNK commandes")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore le curseur de reprise et reparcourt toutes les commandes")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile le run (cProfile + piles par phase dans SYNC_PROFILE_DIR, voir sync_profile.py)")
+    args = parser.parse_args()
+
     if not all([ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD]):
         print("❌ Variables d'environnement Odoo manquantes.")
         raise SystemExit(1)
@@ -287,4 +493,6 @@ if __name__ == "__main__":
         print("❌ Authentification Odoo impossible.")
         raise SystemExit(1)
 
-    catchup_unfactured_orders()
+    # Métriques du run : SYNC_METRICS_DIR/billing.prom et .json (sync_metrics)
+    with METRICS.run("billing"), profiled("billing", args.profile):
+        catchup_unfactured_orders(batch=args.batch, restart=args.restart)
@@ -0,0 +1,733 @@
+"""
+fake_odoo.py — FENUASIM
+Serveur Odoo factice, en mémoire, pour mesurer et tester les synchros sans
+base Odoo Online ni réseau. Uniquement la bibliothèque standard.
+
+Il répond aux mêmes points d'entrée que Odoo :
+  - /xmlrpc/2/common : authenticate, version ;
+  - /xmlrpc/2/object : execute_kw ;
+  - /jsonrpc         : execute_kw en JSON-RPC (odoo_async, moteur asyncio de main_fast.py) ;
+  - GET /stats       : nombre d'appels par modèle.méthode et d'enregistrements par modèle (JSON).
+
+Méthodes prises en charge sur tous les modèles : search, search_read,
+search_count, read, read_group, create (simple ou multi), write, unlink,
+load, fields_get, check_access_rights. Plus le comportement métier utilisé
+par les scripts : sale.order (action_confirm, action_cancel, _create_invoices),
+account.move (action_post, button_draft, message_post), account.payment
+(action_draft, action_cancel), mail.template (send_mail).
+Les many2one sont lus sous la forme [id, "nom"] comme dans Odoo, les
+commandes x2many (0, 0, vals) / (4, id) / (5,) / (6, 0, ids) sont appliquées.
+
+Pour rester négligeable devant les scripts mesurés (bench.py, jusqu'au
+million de lignes), les recherches s'appuient sur des index construits au
+premier usage : table de hachage par champ pour = / in, parcours à partir
+de l'id pour id > (pagination par id), arrêt dès `limit` atteint quand le
+tri est par id.
+
+Latence et pannes simulées :
+  --latency 0.05          secondes ajoutées à chaque appel execute_kw
+  --record-latency 0.002  secondes par enregistrement créé / modifié / supprimé
+  --fail-rate 0.01        part des appels refusés en HTTP 503 (Retry-After: 0)
+  --fault-rate 0.01       part des appels annulés par une erreur de sérialisation Postgres
+Les deux pannes surviennent avant traitement : l'appel n'a aucun effet et
+odoo_retry le rejoue.
+
+Usage :
+  python fake_odoo.py --port 8069 --latency 0.05
+  ODOO_URL=http://127.0.0.1:8069 ODOO_DB=fake ODOO_USER=admin ODOO_PASSWORD=admin python billing.py
+
+  server = FakeOdooServer(port=0, latency=0.02).start()   # depuis un benchmark
+  print(server.url, server.odoo.calls)
+  server.stop()
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from xmlrpc.client import Fault
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+UID = 2
+
+# Champs many2one connus : modèle cible (lecture [id, nom])
+MANY2ONE = {
+    "partner_id": "res.partner",
+    "categ_id": "product.category",
+    "product_id": "product.product",
+    "product_tmpl_id": "product.template",
+    "order_id": "sale.order",
+    "move_id": "account.move",
+    "property_account_income_id": "account.account",
+}
+# Champs one2many : (modèle des lignes, champ inverse)
+ONE2MANY = {
+    ("sale.order", "order_line"): ("sale.order.line", "order_id"),
+    ("account.move", "invoice_line_ids"): ("account.move.line", "move_id"),
+}
+# Champs x2many : lus comme une liste d'ids, vide si non renseignés (jamais False)
+X2MANY = {field for _, field in ONE2MANY} | {"invoice_ids"}
+# Suppressions en cascade : modèle -> [(modèle lié, champ inverse)]
+CASCADE = {
+    "sale.order": [("sale.order.line", "order_id")],
+    "account.move": [("account.move.line", "move_id")],
+}
+SERIALIZATION_FAULT = "psycopg2.errors.SerializationFailure: could not serialize access due to concurrent update"
+
+
+def _now():
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _user_error(message):
+    return Fault(2, f"odoo.exceptions.UserError: {message}")
+
+
+def _compare(value, op, target):
+    if op in ("=", "=="):
+        return value == target
+    if op in ("!=", "<>"):
+        return value != target
+    if op == "in":
+        return value in target
+    if op == "not in":
+        return value not in target
+    if op in ("=like", "=ilike", "like", "ilike", "not like", "not ilike"):
+        if value is False or value is None:
+            return op.startswith("not")
+        # Motif SQL : % et _ sont des jokers ; like / ilike cherchent le motif
+        # n'importe où dans la valeur, =like / =ilike la valeur entière
+        regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in str(target))
+        flags = re.S | (re.I if "ilike" in op else 0)
+        if op.startswith("="):
+            return re.fullmatch(regex, str(value), flags) is not None
+        return (re.search(regex, str(value), flags) is not None) != op.startswith("not")
+    if value is False or value is None:
+        return False
+    if op == ">":
+        return value > target
+    if op == ">=":
+        return value >= target
+    if op == "<":
+        return value < target
+    if op == "<=":
+        return value <= target
+    raise Fault(1, f"ValueError: opérateur de domaine inconnu {op!r}")
+
+
+def _index_add(index, value, record_id):
+    """Ajoute record_id sous `value` ; False si la valeur n'est pas indexable (liste…)."""
+    try:
+        index.setdefault(value, set()).add(record_id)
+    except TypeError:
+        return False
+    return True
+
+
+def _index_discard(index, value, record_id):
+    try:
+        ids = index.get(value)
+    except TypeError:
+        return
+    if ids is not None:
+        ids.discard(record_id)
+
+
+def _hashable(values):
+    try:
+        for value in values:
+            hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _hashable_value(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+def match(record, domain):
+    """Évalue un domaine Odoo (notation polonaise, & implicite) sur un enregistrement."""
+    stack = []
+    for term in reversed(domain):
+        if term in ("&", "|"):
+            first, second = stack.pop(), stack.pop()
+            stack.append(first and second if term == "&" else first or second)
+        elif term == "!":
+            stack.append(not stack.pop())
+        else:
+            field, op, target = term
+            value = record.get(field, False)
+            if isinstance(value, list) and op in ("=", "!=", "in", "not in") and not isinstance(target, list):
+                # x2many : vrai si l'un des ids correspond
+                stack.append(any(_compare(v, op, target) for v in value) if value else _compare(False, op, target))
+                continue
+            stack.append(_compare(value, op, target))
+    return all(stack)
+
+
+class FakeOdoo:
+    """Base en mémoire : {modèle: {id: enregistrement}} et exécution des méthodes."""
+
+    def __init__(self, latency=0.0, record_latency=0.0, fail_rate=0.0, fault_rate=0.0, seed=0):
+        self.latency = latency
+        self.record_latency = record_latency
+        self.fail_rate = fail_rate
+        self.fault_rate = fault_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.models = {}
+        self.sequences = {}
+        self.indexes = {}          # modèle -> champ -> valeur -> {ids}
+        self.unindexable = set()   # (modèle, champ) contenant des valeurs non hachables
+        self.calls = Counter()     # "modèle.méthode" -> nombre d'appels
+        self.seed_data()
+
+    # ─── DONNÉES ──────────────────────────────────────────────────────────────
+    def seed_data(self):
+        """Enregistrements présents dans toute base Odoo et attendus par les scripts."""
+        self._create("res.partner", {"name": "FENUASIM", "is_company": True})
+        self._create("res.partner", {"name": "Administrator", "email": "admin@example.com"})
+        self._create("product.category", {"name": "All"})
+        self._create("account.account", {"code": "706100", "name": "Prestations de services"})
+        self._create("mail.template", {"name": "Invoice: Sending", "model": "account.move"})
+
+    def table(self, model):
+        return self.models.setdefault(model, {})
+
+    def _next_id(self, model):
+        counter = self.sequences.setdefault(model, itertools.count(1))
+        return next(counter)
+
+    def should_throttle(self):
+        """Tirage de la panne HTTP 503 (avant toute exécution)."""
+        return self.fail_rate > 0 and self.random.random() < self.fail_rate
+
+    # ─── POINT D'ENTRÉE ───────────────────────────────────────────────────────
+    def authenticate(self, db, login, password, user_agent_env=None):
+        return UID
+
+    def version(self):
+        return {"server_version": "16.0", "server_serie": "16.0", "protocol_version": 1}
+
+    def execute_kw(self, db, uid, password, model, method, args, kw=None):
+        args, kw = list(args or []), dict(kw or {})
+        with self.lock:
+            self.calls[f"{model}.{method}"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fault_rate and self.random.random() < self.fault_rate:
+            raise Fault(1, SERIALIZATION_FAULT)
+        handler = getattr(self, f"rpc_{method.lstrip('_')}", None)
+        if handler is None:
+            raise Fault(1, f"AttributeError: The method '{method}' does not exist on the model '{model}'")
+        with self.lock:
+            result = handler(model, *args, **kw)
+        records = len(args[0]) if method in ("create", "write", "unlink") and args and isinstance(args[0], list) else 1
+        if self.record_latency and method in ("create", "write", "unlink", "load", "create_invoices", "action_post"):
+            time.sleep(self.record_latency * records)
+        return result
+
+    # ─── LECTURE ──────────────────────────────────────────────────────────────
+    def _index(self, model, field):
+        indexes = self.indexes.setdefault(model, {})
+        if field not in indexes and (model, field) not in self.unindexable:
+            index = {}
+            for rec in self.table(model).values():
+                if not _index_add(index, rec.get(field, False), rec["id"]):
+                    self.unindexable.add((model, field))
+                    return None
+            indexes[field] = index
+        return indexes.get(field)
+
+    def _candidates(self, model, domain):
+        """
+        Enregistrements susceptibles de vérifier `domain`, dans l'ordre des ids :
+        via un index pour un terme = / in, à partir de l'id pour id > / id >=,
+        sinon toute la table. Le domaine complet est toujours réévalué ensuite.
+        """
+        table = self.table(model)
+        if any(term in ("|", "!") for term in domain):
+            return table.values()
+        terms = [term for term in domain if isinstance(term, (list, tuple))]
+        for field, op, target in terms:
+            if op not in ("=", "in"):
+                continue
+            values = list(target) if op == "in" else [target]
+            if not _hashable(values):
+                continue
+            if field == "id":
+                return [table[i] for i in sorted(set(values)) if i in table]
+            index = self._index(model, field)
+            if index is not None:
+                ids = set().union(*(index.get(value, ()) for value in values))
+                return [table[i] for i in sorted(ids)]
+        for field, op, target in terms:
+            if field == "id" and op in (">", ">="):
+                keys = list(table)     # ids croissants : ordre de création
+                start = bisect.bisect_right(keys, target) if op == ">" else bisect.bisect_left(keys, target)
+                return (table[key] for key in keys[start:])
+        return table.values()
+
+    def _search(self, model, domain, offset=0, limit=None, order=None):
+        by_id = " ".join((order or "id").lower().split()) in ("id", "id asc")
+        stop = offset + limit if limit and by_id else None
+        records = []
+        for rec in self._candidates(model, domain):
+            if match(rec, domain):
+                records.append(rec)
+                if stop and len(records) >= stop:
+                    break
+        for clause in reversed([] if by_id else (order or "id").split(",")):
+            parts = clause.split()
+            if not parts:
+                continue
+            field = parts[0]
+            reverse = len(parts) > 1 and parts[1].lower() == "desc"
+            records.sort(key=lambda rec: (rec.get(field) in (False, None), rec.get(field) or 0), reverse=reverse)
+        records = records[offset:]
+        return records[:limit] if limit else records
+
+    def _display_name(self, model, record_id):
+        rec = self.table(model).get(record_id) or {}
+        return rec.get("name") or f"{model},{record_id}"
+
+    def _read(self, model, rec, fields):
+        out = {"id": rec["id"]}
+        for field in fields or rec.keys():
+            value = rec.get(field, False)
+            if field in MANY2ONE and isinstance(value, int) and value:
+                value = [value, self._display_name(MANY2ONE[field], value)]
+            elif field in X2MANY:
+                value = list(value or [])
+            out[field] = value
+        return out
+
+    def rpc_search(self, model, domain=(), offset=0, limit=None, order=None, context=None, count=False):
+        records = self._search(model, domain, offset, limit, order)
+        return len(records) if count else [rec["id"] for rec in records]
+
+    def rpc_search_count(self, model, domain=(), limit=None, context=None):
+        return len(self._search(model, domain, limit=limit))
+
+    def rpc_search_read(self, model, domain=(), fields=None, offset=0, limit=None, order=None, context=None):
+        return [self._read(model, rec, fields) for rec in self._search(model, domain, offset, limit, order)]
+
+    def rpc_read(self, model, ids, fields=None, context=None, load=None):
+        table = self.table(model)
+        missing = [i for i in ids if i not in table]
+        if missing:
+            raise Fault(2, f"odoo.exceptions.MissingError: Record does not exist or has been deleted. ({model}({missing[0]},))")
+        return [self._read(model, table[i], fields) for i in ids]
+
+    def rpc_read_group(self, model, domain, fields, groupby, offset=0, limit=None, orderby=False,
+                       lazy=True, context=None):
+        """Agrégats `champ:agg` ou `alias:agg(champ)` (count, count_distinct, sum, avg, min, max)."""
+        groupby = [groupby] if isinstance(groupby, str) else list(groupby)
+        groupby = groupby[:1] if lazy else groupby
+        specs = []
+        for spec in fields:
+            found = re.fullmatch(r"(\w+):(\w+)(?:\((\w+)\))?", spec)
+            if found:
+                specs.append((found.group(1), found.group(2), found.group(3) or found.group(1)))
+        groups = {}
+        for rec in self._search(model, domain):
+            key = tuple(_hashable_value(rec.get(field, False)) for field in groupby)
+            groups.setdefault(key, []).append(rec)
+        result = []
+        for key in sorted(groups, key=lambda key: [(value is False, str(value)) for value in key]):
+            records = groups[key]
+            group = {}
+            for field, value in zip(groupby, key):
+                if field in MANY2ONE and value:
+                    value = [value, self._display_name(MANY2ONE[field], value)]
+                group[field] = value
+            group[f"{groupby[0]}_count" if lazy and groupby else "__count"] = len(records)
+            for name, agg, field in specs:
+                values = [rec.get(field) for rec in records if rec.get(field) not in (False, None)]
+                if agg == "count":
+                    group[name] = len(values)
+                elif agg == "count_distinct":
+                    group[name] = len({_hashable_value(value) for value in values})
+                elif agg == "sum":
+                    group[name] = sum(values)
+                elif agg == "avg":
+                    group[name] = sum(values) / len(values) if values else False
+                elif agg in ("min", "max"):
+                    group[name] = (min if agg == "min" else max)(values) if values else False
+            group["__domain"] = list(domain) + [[field, "=", value] for field, value in zip(groupby, key)]
+            result.append(group)
+        result = result[offset:]
+        return result[:limit] if limit else result
+
+    def rpc_fields_get(self, model, allfields=None, attributes=None, context=None):
+        fields = {name for rec in self.table(model).values() for name in rec}
+        return {name: {"type": "many2one" if name in MANY2ONE else "char", "string": name} for name in sorted(fields)}
+
+    def rpc_check_access_rights(self, model, operation="read", raise_exception=True):
+        return True
+
+    # ─── ÉCRITURE ─────────────────────────────────────────────────────────────
+    def _defaults(self, model, record_id, vals):
+        now = _now()
+        rec = {"id": record_id, "create_date": now, "write_date": now, "active": True}
+        if model == "sale.order":
+            rec.update(name=f"S{record_id:05d}", state="draft", invoice_status="no", amount_total=0.0)
+        elif model == "account.move":
+            rec.update(name="/", state="draft", move_type="entry", amount_total=0.0)
+        elif model == "account.payment":
+            rec.update(state="draft")
+        elif model == "crm.lead":
+            rec.update(type="lead")
+        elif model == "product.product":
+            rec.update(type="consu", list_price=0.0, sale_ok=True, purchase_ok=True)
+        return rec
+
+    def _set(self, model, rec, vals):
+        """Modifie `rec` en tenant ses index à jour."""
+        indexes = self.indexes.get(model, {})
+        for field, value in vals.items():
+            index = indexes.get(field)
+            if index is not None:
+                _index_discard(index, rec.get(field, False), rec["id"])
+                if not _index_add(index, value, rec["id"]):
+                    del indexes[field]
+                    self.unindexable.add((model, field))
+            rec[field] = value
+
+    def _apply(self, model, rec, vals):
+        changes = {}
+        for field, value in vals.items():
+            if isinstance(value, list) and value and isinstance(value[0], (list, tuple)):
+                value = self._x2many(model, rec, field, value)
+            elif isinstance(value, tuple):
+                value = list(value)
+            changes[field] = value
+        changes["write_date"] = _now()
+        self._set(model, rec, changes)
+        if model == "sale.order":
+            self._compute_order(rec)
+
+    def _x2many(self, model, rec, field, commands):
+        lines = ONE2MANY.get((model, field))
+        ids = list(rec.get(field) or [])
+        for command in commands:
+            code = command[0]
+            if code == 0:
+                vals = dict(command[2])
+                if lines:
+                    line_model, inverse = lines
+                    vals[inverse] = rec["id"]
+                    ids.append(self._create(line_model, vals))
+            elif code == 4:
+                ids.append(command[1])
+            elif code == 5:
+                ids = []
+            elif code == 6:
+                ids = list(command[2])
+        return ids
+
+    def _compute_order(self, order):
+        lines = self.table("sale.order.line")
+        total = 0.0
+        for line_id in order.get("order_line") or []:
+            line = lines.get(line_id)
+            if line is None:
+                continue
+            subtotal = float(line.get("price_unit") or 0.0) * float(line.get("product_uom_qty") or 1.0)
+            self._set("sale.order.line", line, {"price_subtotal": subtotal})
+            total += subtotal
+        self._set("sale.order", order, {"amount_total": round(total, 2)})
+
+    def _create(self, model, vals):
+        record_id = self._next_id(model)
+        rec = self._defaults(model, record_id, vals)
+        self.table(model)[record_id] = rec
+        for field, index in list(self.indexes.get(model, {}).items()):
+            if not _index_add(index, rec.get(field, False), record_id):
+                del self.indexes[model][field]
+                self.unindexable.add((model, field))
+        self._apply(model, rec, vals)
+        return record_id
+
+    def _delete(self, model, rec):
+        for field, index in self.indexes.get(model, {}).items():
+            _index_discard(index, rec.get(field, False), rec["id"])
+        del self.table(model)[rec["id"]]
+
+    def rpc_create(self, model, vals_list, context=None):
+        if isinstance(vals_list, dict):
+            return self._create(model, vals_list)
+        return [self._create(model, vals) for vals in vals_list]
+
+    def _records(self, model, ids):
+        table = self.table(model)
+        ids = [ids] if isinstance(ids, int) else ids
+        missing = [i for i in ids if i not in table]
+        if missing:
+            raise Fault(2, f"odoo.exceptions.MissingError: Record does not exist or has been deleted. ({model}({missing[0]},))")
+        return [table[i] for i in ids]
+
+    def rpc_write(self, model, ids, vals, context=None):
+        for rec in self._records(model, ids):
+            self._apply(model, rec, vals)
+        return True
+
+    def rpc_unlink(self, model, ids, context=None):
+        records = self._records(model, ids)
+        if model == "sale.order":
+            locked = [rec["name"] for rec in records if rec.get("state") not in ("draft", "sent", "cancel")]
+            if locked:
+                raise _user_error(f"Vous ne pouvez pas supprimer une commande confirmée ({locked[0]}) : annulez-la d'abord.")
+        if model == "account.move":
+            posted = [rec["name"] for rec in records if rec.get("state") == "posted"]
+            if posted:
+                raise _user_error(f"Vous ne pouvez pas supprimer une pièce comptabilisée ({posted[0]}).")
+        for rec in records:
+            for child_model, inverse in CASCADE.get(model, []):
+                for child in self._search(child_model, [(inverse, "=", rec["id"])]):
+                    self._delete(child_model, child)
+            self._delete(model, rec)
+        return True
+
+    def rpc_load(self, model, fields, rows, context=None):
+        """Import par id externe (module.nom) : crée ou met à jour, tout ou rien."""
+        operations, messages = [], []
+        for index, row in enumerate(rows):
+            vals, xmlid = {}, None
+            for field, value in zip(fields, row):
+                if field == "id":
+                    xmlid = value
+                elif field.endswith("/.id"):
+                    vals[field[:-4]] = int(value) if value else False
+                elif field == "list_price":
+                    vals[field] = float(value or 0)
+                elif field in ("sale_ok", "purchase_ok"):
+                    vals[field] = value == "1"
+                else:
+                    vals[field] = value
+            if model.startswith("product.") and not vals.get("name"):
+                messages.append({"type": "error", "message": "Missing required value for the field 'Name' (name)",
+                                 "rows": {"from": index, "to": index}})
+                continue
+            module, name = (xmlid or f"__import__.{model}_{index}").split(".", 1)
+            known = self._search("ir.model.data", [("name", "=", name), ("module", "=", module), ("model", "=", model)], limit=1)
+            operations.append((known[0] if known else None, module, name, vals))
+        if messages:
+            return {"ids": False, "messages": messages}
+        ids = []
+        for known, module, name, vals in operations:
+            if known and known["res_id"] in self.table(model):
+                self._apply(model, self.table(model)[known["res_id"]], vals)
+                ids.append(known["res_id"])
+            else:
+                record_id = self._create(model, vals)
+                self._create("ir.model.data", {"module": module, "name": name, "model": model, "res_id": record_id})
+                ids.append(record_id)
+        return {"ids": ids, "messages": []}
+
+    # ─── MÉTIER : VENTES ──────────────────────────────────────────────────────
+    def rpc_action_confirm(self, model, ids, context=None):
+        # Comme Odoo 16 : seules les commandes terminées ou annulées sont refusées,
+        # une commande déjà confirmée reste inchangée
+        for rec in self._records(model, ids):
+            if rec.get("state") in ("done", "cancel"):
+                raise _user_error(f"Une commande à l'état {rec.get('state')} ne peut pas être confirmée ({rec['name']}).")
+        for rec in self._records(model, ids):
+            if rec.get("state") in ("draft", "sent"):
+                self._set(model, rec, {"state": "sale", "invoice_status": "to invoice" if rec.get("amount_total") else "no"})
+        return True
+
+    def rpc_action_cancel(self, model, ids, context=None):
+        for rec in self._records(model, ids):
+            self._set(model, rec, {"state": "cancel", **({"invoice_status": "no"} if model == "sale.order" else {})})
+        return True
+
+    def rpc_create_invoices(self, model, ids, grouped=False, final=False, date=None, context=None):
+        orders = [rec for rec in self._records(model, ids) if rec.get("invoice_status") == "to invoice"]
+        if not orders:
+            raise _user_error("Aucune ligne à facturer : vérifiez que les commandes sont confirmées.")
+        groups = {}
+        for order in orders:
+            key = order["id"] if grouped else (order.get("partner_id"), order.get("currency_id"))
+            groups.setdefault(key, []).append(order)
+        invoice_ids = []
+        for group in groups.values():
+            lines = [
+                (0, 0, {"name": line.get("name"), "product_id": line.get("product_id"),
+                        "quantity": line.get("product_uom_qty", 1.0), "price_unit": line.get("price_unit", 0.0)})
+                for order in group
+                for line in (self.table("sale.order.line").get(i, {}) for i in order.get("order_line") or [])
+            ]
+            invoice_id = self._create("account.move", {
+                "move_type": "out_invoice",
+                "partner_id": group[0].get("partner_id"),
+                "invoice_origin": ", ".join(order["name"] for order in group),
+                "amount_total": round(sum(order.get("amount_total") or 0.0 for order in group), 2),
+                "invoice_line_ids": lines,
+            })
+            for order in group:
+                self._set(model, order, {
+                    "invoice_status": "invoiced",
+                    "invoice_ids": list(order.get("invoice_ids") or []) + [invoice_id],
+                })
+            invoice_ids.append(invoice_id)
+        return invoice_ids
+
+    # ─── MÉTIER : COMPTABILITÉ ────────────────────────────────────────────────
+    def rpc_action_post(self, model, ids, context=None):
+        records = self._records(model, ids)
+        for rec in records:
+            if rec.get("state") != "draft":
+                raise _user_error(f"Seules les pièces en brouillon peuvent être validées ({rec['name']}).")
+            if model == "account.move" and rec.get("move_type") == "out_invoice" and not rec.get("partner_id"):
+                raise _user_error("Le client est obligatoire pour valider une facture.")
+        for rec in records:
+            self._set(model, rec, {"state": "posted"})
+            if model == "account.move" and rec.get("name") in (None, False, "/"):
+                self._set(model, rec, {"name": f"INV/{datetime.utcnow().year}/{rec['id']:05d}"})
+        return True
+
+    def rpc_button_draft(self, model, ids, context=None):
+        for rec in self._records(model, ids):
+            self._set(model, rec, {"state": "draft"})
+        return True
+
+    def rpc_action_draft(self, model, ids, context=None):
+        return self.rpc_button_draft(model, ids)
+
+    def rpc_message_post(self, model, ids, body="", context=None, **kwargs):
+        rec = self._records(model, ids)[0]
+        return self._create("mail.message", {"model": model, "res_id": rec["id"], "body": body, **kwargs})
+
+    def rpc_send_mail(self, model, template_id, res_id=None, force_send=False, context=None, **kwargs):
+        self._records(model, template_id)
+        return self._create("mail.mail", {"mail_template_id": template_id, "res_id": res_id, "state": "sent"})
+
+    # ─── STATISTIQUES ─────────────────────────────────────────────────────────
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": dict(self.calls),
+                "total_calls": sum(self.calls.values()),
+                "records": {model: len(table) for model, table in sorted(self.models.items())},
+            }
+
+
+# ─── SERVEUR HTTP ─────────────────────────────────────────────────────────────
+class _Dispatcher:
+    """Objet XML-RPC : authenticate / version (common) et execute_kw (object)."""
+
+    def __init__(self, odoo):
+        self.authenticate = odoo.authenticate
+        self.version = odoo.version
+        self.execute_kw = odoo.execute_kw
+
+
+class _Handler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ("/xmlrpc/2/common", "/xmlrpc/2/object")
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            return self._reply(404)
+        self._reply(200, json.dumps(self.server.odoo.stats(), indent=2).encode())
+
+    def do_POST(self):
+        odoo = self.server.odoo
+        if self.path != "/xmlrpc/2/common" and odoo.should_throttle():
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            return self._reply(503, headers={"Retry-After": "0"})
+        if self.path == "/jsonrpc":
+            return self._jsonrpc(odoo)
+        return super().do_POST()
+
+    def _jsonrpc(self, odoo):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        params = request.get("params") or {}
+        try:
+            if params.get("service") == "common":
+                result = getattr(odoo, params.get("method"))(*params.get("args", []))
+            else:
+                result = odoo.execute_kw(*params.get("args", []))
+            response = {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+        except Exception as e:
+            text = e.faultString if isinstance(e, Fault) else f"{type(e).__name__}: {e}"
+            name, _, message = str(text).partition(": ")
+            response = {"jsonrpc": "2.0", "id": request.get("id"), "error": {
+                "code": 200, "message": "Odoo Server Error",
+                "data": {"name": name, "message": message or name},
+            }}
+        self._reply(200, json.dumps(response).encode())
+
+
+class _ThreadingServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class FakeOdooServer:
+    def __init__(self, host="127.0.0.1", port=8069, **options):
+        self.odoo = FakeOdoo(**options)
+        self.server = _ThreadingServer((host, port), requestHandler=_Handler, allow_none=True, logRequests=False)
+        self.server.odoo = self.odoo
+        self.server.register_instance(_Dispatcher(self.odoo))
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Démarre le serveur dans un thread (benchmarks, scripts de test)."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-odoo", daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur Odoo factice (XML-RPC / JSON-RPC, en mémoire)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8069)
+    parser.add_argument("--latency", type=float, default=0.0, help="secondes ajoutées à chaque appel")
+    parser.add_argument("--record-latency", type=float, default=0.0,
+                        help="secondes par enregistrement créé / modifié / supprimé")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="part des appels refusés en HTTP 503")
+    parser.add_argument("--fault-rate", type=float, default=0.0,
+                        help="part des appels annulés (erreur de sérialisation Postgres)")
+    parser.add_argument("--seed", type=int, default=0, help="graine du tirage des pannes")
+    args = parser.parse_args()
+
+    server = FakeOdooServer(
+        args.host, args.port, latency=args.latency, record_latency=args.record_latency,
+        fail_rate=args.fail_rate, fault_rate=args.fault_rate, seed=args.seed,
+    )
+    print(f"🧪 Odoo factice sur {server.url} (latence {args.latency}s, 503 {args.fail_rate:.0%}, "
+          f"fautes {args.fault_rate:.0%}) — statistiques : GET {server.url}/stats", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {server.odoo.stats()['total_calls']} appels servis.", flush=True)
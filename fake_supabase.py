@@ -0,0 +1,349 @@
+"""
+fake_supabase.py — FENUASIM
+Stand-in local de l'API REST Supabase (PostgREST), en mémoire, pour faire
+tourner les synchros sans projet Supabase (bench.py). Bibliothèque standard
+uniquement ; le client supabase-py s'y connecte normalement :
+  SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=bench python main_fast.py
+
+Sous-ensemble de PostgREST couvert (ce qu'utilisent supabase_reader et
+sync_state) : GET /rest/v1/<table> avec
+  - select=col1,col2 (ou *) — colonne inconnue : erreur 400 42703 comme PostgREST ;
+  - filtres col=eq. / neq. / gt. / gte. / lt. / lte. / like. / ilike. / in.(…) / is.null,
+    préfixe not. accepté ;
+  - or=(…) avec and(…) imbriqués (pagination par clé de supabase_reader),
+    valeurs entre guillemets acceptées ;
+  - order=col.asc,col2.desc ; offset / limit (ou en-tête Range).
+Les horodatages ISO sont comparés en dates, les nombres en nombres.
+
+Le résultat filtré et trié d'une requête est gardé en cache : les pages
+suivantes ne refont ni le filtrage ni le tri. La condition de pagination
+par clé (col.gt.X, ou or=(c1.gt.X,and(c1.eq.X,c2.gt.Y)) sur les colonnes
+du tri) est reconnue et résolue par dichotomie dans ce résultat. Les tables
+sont donc en lecture seule une fois le serveur démarré (set_table vide le cache).
+
+Usage :
+  python fake_supabase.py --port 54321 --data bench_data/10k    # <table>.jsonl
+  server = FakeSupabaseServer({"orders": rows, ...}, port=0).start()
+  server.url, server.requests, server.stop()
+"""
+
+import argparse
+import bisect
+import json
+import operator
+import os
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+RESERVED = {"select", "order", "offset", "limit", "or", "and", "columns"}
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+COMPARE = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt,
+           "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def _typed(value):
+    """Valeur comparable : dates ISO en datetime, le reste tel quel."""
+    if isinstance(value, str) and ISO_DATE.match(value):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    return value
+
+
+def _coerce(text, sample):
+    """Convertit une valeur de filtre (texte) dans le type de la colonne."""
+    if isinstance(sample, bool):
+        return text.lower() == "true"
+    if isinstance(sample, (int, float)):
+        try:
+            return float(text)
+        except ValueError:
+            return text
+    return _typed(text)
+
+
+def _unquote(text):
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', text[1:-1])
+    return text
+
+
+def _split(text):
+    """Découpe `a,b,and(c,d)` au niveau 0, en respectant parenthèses et guillemets."""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _like(pattern, flags=0):
+    regex = "".join(".*" if c in "%*" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(regex, flags | re.S)
+
+
+def _condition(column, expression):
+    """Prédicat ligne -> bool pour `column=expression` (ex. eq.completed, in.(a,b))."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, raw = expression.partition(".")
+    raw = _unquote(raw)
+    if op == "in":
+        values = [v.strip().strip('"') for v in _split(raw.strip()[1:-1])]
+    elif op in ("like", "ilike"):
+        pattern = _like(raw, re.I if op == "ilike" else 0)
+    elif op not in COMPARE and op != "is":
+        raise PostgrestError(400, "PGRST100", f'"failed to parse filter ({op}.{raw})"')
+
+    def test(row):
+        value = row.get(column)
+        if op == "is":
+            result = value is None if raw == "null" else value is (raw == "true")
+        elif value is None:
+            result = False
+        elif op == "in":
+            result = _typed(value) in [_coerce(v, value) for v in values]
+        elif op in ("like", "ilike"):
+            result = pattern.fullmatch(str(value)) is not None
+        else:
+            try:
+                result = COMPARE[op](_typed(value), _coerce(raw, value))
+            except TypeError:          # ex. date naïve contre date avec fuseau
+                result = COMPARE[op](str(value), raw)
+        return result != negate
+    return test
+
+
+def _logic(kind, text):
+    """Prédicat pour or=(…) / and=(…), éléments `col.op.valeur` ou groupes imbriqués."""
+    tests = []
+    for part in _split(text.strip()[1:-1]):
+        for nested in ("and", "or"):
+            if part.startswith(f"{nested}("):
+                tests.append(_logic(nested, part[len(nested):]))
+                break
+        else:
+            column, _, expression = part.partition(".")
+            tests.append(_condition(column, expression))
+    if kind == "or":
+        return lambda row: any(test(row) for test in tests)
+    return lambda row: all(test(row) for test in tests)
+
+
+def _keyset(columns, filters, logic):
+    """
+    Repère la condition « après la clé » de supabase_reader.after_key sur les
+    colonnes du tri. Retourne (filtres restants, logique restante, valeurs de
+    la clé) ou None.
+    """
+    if len(columns) == 1:
+        for item in filters:
+            column, expression = item
+            if column == columns[0] and expression.startswith("gt."):
+                return [f for f in filters if f is not item], logic, [_unquote(expression[3:])]
+        return None
+    for item in logic:
+        kind, text = item
+        parts = _split(text.strip()[1:-1])
+        if kind != "or" or len(parts) != len(columns) or not parts[-1].startswith("and("):
+            continue
+        raw = [term.split(".", 2)[-1] for term in _split(parts[-1][4:-1])]
+        if len(raw) != len(columns):
+            continue
+        expected = []
+        for i, column in enumerate(columns):
+            equal = [f"{previous}.eq.{value}" for previous, value in zip(columns[:i], raw)]
+            term = f"{column}.gt.{raw[i]}"
+            expected.append(f"and({','.join(equal + [term])})" if equal else term)
+        if parts == expected:
+            return filters, [entry for entry in logic if entry is not item], [_unquote(value) for value in raw]
+    return None
+
+
+class FakeSupabase:
+    def __init__(self, tables=None):
+        self.tables = {}
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.requests = Counter()  # table -> nombre de requêtes servies
+        for name, rows in (tables or {}).items():
+            self.set_table(name, rows)
+
+    def set_table(self, name, rows):
+        with self.lock:
+            self.tables[name] = list(rows)
+            self.cache.clear()
+
+    def load_dir(self, path):
+        """Charge chaque <table>.jsonl du dossier `path`."""
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(".jsonl"):
+                with open(os.path.join(path, filename), encoding="utf-8") as f:
+                    self.set_table(filename[:-6], (json.loads(line) for line in f if line.strip()))
+
+    def select(self, table, params, range_header=None):
+        """Retourne (lignes de la page, offset, nombre total) ; params : {nom: [valeurs]}."""
+        if table not in self.tables:
+            raise PostgrestError(404, "42P01", f'relation "public.{table}" does not exist')
+        rows = self.tables[table]
+        known = set(rows[0]) if rows else None
+        columns = [c.strip() for c in (params.get("select") or ["*"])[-1].split(",") if c.strip()]
+        if columns == ["*"]:
+            columns = None
+        filters = sorted((k, v) for k, values in params.items() if k not in RESERVED for v in values)
+        referenced = [k for k, _ in filters] + (columns or [])
+        if known is not None:
+            for column in referenced:
+                if column not in known:
+                    raise PostgrestError(400, "42703", f"column {table}.{column} does not exist")
+
+        order = (params.get("order") or [""])[-1]
+        logic = tuple((kind, text) for kind in ("or", "and") for text in params.get(kind, []))
+        clauses = [clause.split(".") for clause in order.split(",") if clause]
+        sort_columns = [clause[0] for clause in clauses]
+        after = None
+        if clauses and not any("desc" in clause[1:] for clause in clauses):
+            found = _keyset(sort_columns, filters, logic)
+            if found:
+                filters, logic, after = found
+                logic = tuple(logic)
+        key = (table, tuple(filters), logic, order)
+        with self.lock:
+            self.requests[table] += 1
+            cached = self.cache.get(key)
+        matched, sort_keys = cached or (None, None)
+        if matched is None:
+            tests = [_condition(column, expression) for column, expression in filters]
+            tests += [_logic(kind, text) for kind, text in logic]
+            matched = [row for row in rows if all(test(row) for test in tests)]
+            for clause in reversed([c for c in order.split(",") if c]):
+                column, *modifiers = clause.split(".")
+                descending = "desc" in modifiers
+                matched.sort(key=lambda row: (row.get(column) is None, _typed(row.get(column))), reverse=descending)
+            sort_keys = [
+                tuple((row.get(column) is None, _typed(row.get(column))) for column in sort_columns)
+                for row in matched
+            ]
+            with self.lock:
+                self.cache[key] = (matched, sort_keys)
+
+        first = 0
+        if after is not None:
+            samples = [next((row[column] for row in rows if row.get(column) is not None), "") for column in sort_columns]
+            bound = tuple((False, _typed(_coerce(value, sample))) for value, sample in zip(after, samples))
+            first = bisect.bisect_right(sort_keys, bound)
+
+        offset = int((params.get("offset") or ["0"])[-1])
+        limit = int(params["limit"][-1]) if params.get("limit") else None
+        if range_header and "-" in range_header:
+            start, _, end = range_header.partition("-")
+            offset, limit = int(start), int(end) - int(start) + 1
+        page = matched[first + offset:first + offset + limit if limit is not None else None]
+        if columns:
+            page = [{column: row.get(column) for column in columns} for row in page]
+        return page, offset, len(matched) - first
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith("/rest/v1/"):
+            return self._reply(404, {"message": "not found"})
+        table = url.path[len("/rest/v1/"):].strip("/")
+        params = {}
+        for name, value in parse_qsl(url.query, keep_blank_values=True):
+            params.setdefault(name, []).append(value)
+        try:
+            page, offset, total = self.server.supabase.select(table, params, self.headers.get("Range"))
+        except PostgrestError as e:
+            return self._reply(e.status, {"code": e.code, "details": None, "hint": None, "message": e.message})
+        end = offset + len(page) - 1
+        self._reply(200, page, {"Content-Range": f"{offset}-{end}/{total}" if page else f"*/{total}"})
+
+
+class FakeSupabaseServer:
+    def __init__(self, tables=None, host="127.0.0.1", port=54321):
+        self.supabase = FakeSupabase(tables)
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.supabase = self.supabase
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.supabase.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-supabase", daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in Supabase / PostgREST (lecture, en mémoire)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--data", help="dossier de fichiers <table>.jsonl (voir bench.py --dump)")
+    args = parser.parse_args()
+
+    server = FakeSupabaseServer(host=args.host, port=args.port)
+    if args.data:
+        server.supabase.load_dir(args.data)
+    tables = ", ".join(f"{name} ({len(rows)})" for name, rows in server.supabase.tables.items()) or "aucune table"
+    print(f"🧪 Supabase factice sur {server.url} — {tables}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
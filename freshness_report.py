@@ -0,0 +1,270 @@
+"""
+freshness_report.py — FENUASIM
+Fraîcheur de la synchro Supabase -> Odoo par source (Stripe, AVA, Airalo) :
+où en est l'arriéré, et qu'est-ce qui le limite ? Remplace debug_orders.py.
+
+Le rapport, en lecture seule :
+  1. Odoo : sale.order agrégés par origine et par état (read_group, une
+     requête) : volume, plus ancien et plus récent create_date. L'âge de la
+     dernière création montre un cron arrêté, l'âge du plus vieux brouillon
+     l'arriéré de facturation (billing.py).
+  2. Supabase -> Odoo : lignes éligibles de chaque source sur la fenêtre
+     (--days), présence dans Odoo vérifiée par read_group groupé par
+     client_order_ref (une requête par page de lignes, doublons compris) :
+     arriéré (lignes absentes d'Odoo), plus ancienne ligne non synchronisée,
+     délai réalisé created_at -> create_date en p50 / p95 / max.
+  3. Diagnostic par source, à partir de l'intervalle du cron
+     (SYNC_CRON_MINUTES, défaut 30) et, s'ils sont là, des métriques du
+     dernier run (SYNC_METRICS_DIR/<script>.json, sync_metrics ; en CI,
+     debug.yml les récupère dans l'artefact du dernier run de sync-orders.yml) :
+       - pas d'arriéré, p95 de l'ordre d'un cycle   -> cadence du cron ;
+       - arriéré plus vieux qu'un cycle + un run      -> débit insuffisant :
+         création groupée dominante -> taille de lot (ODOO_BATCH_SIZE),
+         clients / produits / anti-doublon dominants -> concurrence
+         (ODOO_CONCURRENCY, ODOO_ASYNC_CONCURRENCY).
+     Airalo n'a pas de synchro planifiée (main.py se lance à la main) : ni
+     cadence ni métriques de run, seul l'arriéré est signalé.
+
+Sans SUPABASE_URL / SUPABASE_KEY, seule la partie Odoo est produite.
+
+Usage :
+  python freshness_report.py                     # 7 derniers jours
+  python freshness_report.py --days 1 --json freshness.json
+  python freshness_report.py --days 0            # tout l'historique
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from odoo_index import chunked
+from odoo_transport import connect
+from supabase_reader import PAGE_SIZE, iter_pages, select_columns
+from sync_metrics import METRICS_DIR, lag_summary
+from sync_state import parse_ts
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+ODOO_URL = os.getenv("ODOO_URL")
+ODOO_DB = os.getenv("ODOO_DB")
+ODOO_USER = os.getenv("ODOO_USER")
+ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
+CRON_MINUTES = int(os.getenv("SYNC_CRON_MINUTES", "30"))
+
+
+class Source:
+    def __init__(self, name, table, ref, origin, eligible=None, prefix="", script=None, phases=None):
+        self.name = name
+        self.table = table
+        self.ref = ref                 # colonne Supabase -> client_order_ref
+        self.origin = origin           # sale.order.origin
+        self.eligible = eligible or (lambda query: query)
+        self.prefix = prefix
+        self.script = script           # synchro planifiée qui crée les commandes (métriques), ou None
+        self.phases = phases           # préfixe de ses phases dans sync_metrics
+
+
+SOURCES = [
+    Source("stripe", "orders", "stripe_session_id", "Stripe",
+           lambda query: query.eq("status", "completed"), script="main_fast", phases="orders."),
+    Source("ava", "insurances", "adhesion_number", "AVA Assurances",
+           lambda query: query.in_("status", ["paid", "active"]), script="main_fast", phases="insurances."),
+    Source("airalo", "airalo_orders", "order_id", "Airalo", prefix="AIRALO-"),
+]
+
+
+def utc(value):
+    ts = parse_ts(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def age(seconds):
+    if seconds is None:
+        return "—"
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 172800:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} j"
+
+
+# ─── ODOO ─────────────────────────────────────────────────────────────────────
+def odoo_overview(call, now):
+    """sale.order par (origine, état) : volume, plus ancien / plus récent create_date."""
+    groups = call("sale.order", "read_group", [
+        [("origin", "in", [source.origin for source in SOURCES])],
+        ["oldest:min(create_date)", "newest:max(create_date)"],
+        ["origin", "state"],
+    ], {"lazy": False})
+    return [{
+        "origin": group["origin"],
+        "state": group["state"],
+        "count": group["__count"],
+        "oldest_age_s": round((now - utc(group["oldest"])).total_seconds()) if group.get("oldest") else None,
+        "newest_age_s": round((now - utc(group["newest"])).total_seconds()) if group.get("newest") else None,
+    } for group in groups]
+
+
+def synced_refs(call, refs):
+    """{client_order_ref: (nombre de sale.order, premier create_date)} pour les refs présentes."""
+    groups = call("sale.order", "read_group", [
+        [("client_order_ref", "in", refs)],
+        ["synced:min(create_date)"],
+        ["client_order_ref"],
+    ], {"lazy": False})
+    return {group["client_order_ref"]: (group["__count"], group["synced"]) for group in groups}
+
+
+# ─── SUPABASE -> ODOO ─────────────────────────────────────────────────────────
+def source_backlog(call, supabase, source, since, now):
+    """Arriéré et délai réalisé d'une source sur la fenêtre [since, now]."""
+    rows_of = select_columns(supabase, source.table, ("id", source.ref, "created_at"))
+
+    def query():
+        q = source.eligible(rows_of())
+        return q.gte("created_at", since.isoformat()) if since else q
+
+    rows = backlog = duplicates = 0
+    oldest_unsynced = None
+    lags = []
+    for page in iter_pages(query, order=("created_at", "id")):
+        page = [row for row in page if row.get(source.ref)]
+        rows += len(page)
+        for chunk in chunked(page, PAGE_SIZE):
+            found = synced_refs(call, [f"{source.prefix}{row[source.ref]}" for row in chunk])
+            for row in chunk:
+                match = found.get(f"{source.prefix}{row[source.ref]}")
+                if match is None:
+                    backlog += 1
+                    # Pages triées par created_at : la première absente est la plus ancienne
+                    oldest_unsynced = oldest_unsynced or row["created_at"]
+                    continue
+                count, synced_at = match
+                duplicates += count > 1
+                if row.get("created_at") and synced_at:
+                    lags.append(max(0.0, (utc(synced_at) - utc(row["created_at"])).total_seconds()))
+    return {
+        "rows": rows,
+        "backlog": backlog,
+        "oldest_unsynced": oldest_unsynced,
+        "oldest_unsynced_age_s": round((now - utc(oldest_unsynced)).total_seconds()) if oldest_unsynced else None,
+        "duplicates": duplicates,
+        "lag": lag_summary(lags) if lags else None,
+    }
+
+
+# ─── DIAGNOSTIC ───────────────────────────────────────────────────────────────
+def last_run(script, directory=METRICS_DIR):
+    path = os.path.join(directory, f"{script}.json")
+    if not script or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def diagnose(source, backlog, run, cron_minutes=CRON_MINUTES):
+    """Goulot d'étranglement probable de la source : cadence du cron, taille de lot ou concurrence."""
+    if source.script is None:
+        notes = []
+        if backlog["backlog"]:
+            notes.append(f"{backlog['backlog']} ligne(s) en attente, plus ancienne {age(backlog['oldest_unsynced_age_s'])} : "
+                         "aucune synchro planifiée pour cette source, à lancer à la main")
+        if backlog["duplicates"]:
+            notes.append(f"{backlog['duplicates']} référence(s) présentes plusieurs fois dans Odoo")
+        return notes
+    cycle = cron_minutes * 60
+    duration = (run or {}).get("run_duration_seconds") or 0
+    notes = []
+    if duration > cycle:
+        notes.append(f"le run dure {age(duration)}, plus qu'un cycle de cron ({cron_minutes} min) : "
+                     "les runs se chevauchent ou sautent un créneau")
+    oldest = backlog["oldest_unsynced_age_s"]
+    if backlog["backlog"] and oldest is not None and oldest > cycle + duration:
+        phases = {
+            name[len(source.phases):]: seconds
+            for name, seconds in ((run or {}).get("phases") or {}).items()
+            if source.phases and name.startswith(source.phases)
+        }
+        total = sum(phases.values())
+        if not total:
+            missing = "" if run else f" (pas de métriques {source.script} pour trancher)"
+            notes.append(f"arriéré plus vieux qu'un cycle ({age(oldest)}) : débit insuffisant ou cron arrêté{missing}")
+        elif phases.get("create", 0) >= total / 2:
+            notes.append(f"débit insuffisant, création groupée = {100 * phases['create'] / total:.0f}% du run : "
+                         "augmenter ODOO_BATCH_SIZE")
+        else:
+            slowest = max(phases, key=phases.get)
+            notes.append(f"débit insuffisant, phase {source.phases}{slowest} = "
+                         f"{100 * phases[slowest] / total:.0f}% du run : "
+                         "augmenter ODOO_CONCURRENCY (ou ODOO_ASYNC_CONCURRENCY)")
+    elif backlog["lag"] and backlog["lag"]["p95"] <= cycle + duration:
+        notes.append(f"pas d'arriéré, p95 {age(backlog['lag']['p95'])} ≤ un cycle : délai dicté par la "
+                     f"cadence du cron ({cron_minutes} min)")
+    elif backlog["lag"]:
+        notes.append(f"pas d'arriéré mais p95 {age(backlog['lag']['p95'])} > un cycle : runs en échec "
+                     "ou rattrapages (vérifier run_success)")
+    if backlog["duplicates"]:
+        notes.append(f"{backlog['duplicates']} référence(s) présentes plusieurs fois dans Odoo")
+    return notes
+
+
+# ─── RAPPORT ──────────────────────────────────────────────────────────────────
+def report(call, supabase=None, days=7, cron_minutes=CRON_MINUTES, now=None):
+    now = now or datetime.now(timezone.utc)
+    since = now - timedelta(days=days) if days else None
+    result = {"generated_at": now.isoformat(), "days": days, "cron_minutes": cron_minutes,
+              "odoo": odoo_overview(call, now), "sources": {}}
+
+    print("📦 sale.order par origine (Odoo) :", flush=True)
+    for group in result["odoo"]:
+        print(f"   {group['origin']:<16} {group['state']:<8} {group['count']:>8}  "
+              f"plus ancien {age(group['oldest_age_s']):>8}  dernier {age(group['newest_age_s']):>8}", flush=True)
+
+    if supabase is None:
+        print("⚠️ SUPABASE_URL / SUPABASE_KEY absents : arriéré Supabase -> Odoo non mesuré.", flush=True)
+        return result
+
+    window = f"{days} derniers jours" if days else "tout l'historique"
+    print(f"\n⏱️  Supabase -> Odoo ({window}) :", flush=True)
+    for source in SOURCES:
+        backlog = source_backlog(call, supabase, source, since, now)
+        backlog["diagnosis"] = diagnose(source, backlog, last_run(source.script), cron_minutes)
+        result["sources"][source.name] = backlog
+        lag = backlog["lag"]
+        print(f"   {source.name:<7} {backlog['rows']:>8} lignes, arriéré {backlog['backlog']:>6}, "
+              f"plus ancienne non synchronisée {age(backlog['oldest_unsynced_age_s'])}", flush=True)
+        if lag:
+            print(f"           délai p50 {age(lag['p50'])}, p95 {age(lag['p95'])}, max {age(lag['max'])}", flush=True)
+        for note in backlog["diagnosis"]:
+            print(f"           → {note}", flush=True)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fraîcheur et arriéré de la synchro Supabase -> Odoo")
+    parser.add_argument("--days", type=int, default=7,
+                        help="fenêtre des lignes Supabase examinées, en jours (0 : tout l'historique)")
+    parser.add_argument("--cron-minutes", type=int, default=CRON_MINUTES,
+                        help="intervalle du cron de synchro (défaut : $SYNC_CRON_MINUTES ou 30)")
+    parser.add_argument("--json", help="écrit aussi le rapport en JSON dans ce fichier")
+    args = parser.parse_args()
+
+    print("🔌 Connexion à Odoo…", flush=True)
+    uid, models = connect(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
+
+    def call(model, method, rpc_args, kw=None):
+        return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, rpc_args, kw or {})
+
+    supabase = None
+    if SUPABASE_URL and SUPABASE_KEY:
+        from supabase import create_client
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+    result = report(call, supabase, args.days, args.cron_minutes)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n📝 Rapport : {args.json}", flush=True)
@@ -1,7 +1,13 @@
 import os
-import xmlrpc.client
 from datetime import datetime
 from supabase import create_client
+from odoo_batch import CreateBatch
+from odoo_index import OrderRefIndex, PartnerIndex, ProductIndex
+from odoo_pool import OdooPool
+from odoo_transport import server_proxy
+from product_sync import CatalogSync
+from supabase_reader import iter_pages, select_columns
+from sync_metrics import METRICS
 
 # -----------------------------------------
 # CONFIG
@@ -18,17 +24,24 @@ if not all([SUPABASE_URL, SUPABASE_KEY, ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSW
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common", allow_none=True)
+common = server_proxy(ODOO_URL, "common")
 uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
 if not uid:
     raise SystemExit("❌ Auth Odoo impossible.")
 
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object", allow_none=True)
+POOL = OdooPool(ODOO_URL)
+models = POOL.models  # un ServerProxy par thread
+
+
+def call(model, method, args, kw=None):
+    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
 
 # -----------------------------------------
 # CONSTANTES
 # -----------------------------------------
 XPF_PER_EUR = 119.33  # parité fixe
+PARTNERS = PartnerIndex(call)
+PRODUCTS = ProductIndex(call)
 
 # -----------------------------------------
 # UTILS
@@ -72,14 +85,9 @@ def ensure_partner(row):
     """
     email = (row.get("email") or "").strip().lower() or "client@fenuasim.com"
 
-    res = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "res.partner", "search",
-        [[["email", "=ilike", email]]],
-        {"limit": 1}
-    )
-    if res:
-        return res[0]
+    existing = PARTNERS.get(email)
+    if existing:
+        return existing
 
     fname = row.get("first_name") or ""
     lname = row.get("last_name") or ""
@@ -94,6 +102,7 @@ def ensure_partner(row):
         vals["ref"] = str(row.get("id"))
 
     pid = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "res.partner", "create", [vals])
+    PARTNERS.add(email, pid)
     print(f"👤 Partner créé : {fullname} ({email})", flush=True)
     return pid
 
@@ -101,23 +110,7 @@ def ensure_partner(row):
 def find_product(package_id):
     if not package_id:
         return None
-    res = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.product", "search_read",
-        [[["default_code", "=", package_id]]],
-        {"fields": ["id", "name", "list_price"], "limit": 1}
-    )
-    return res[0] if res else None
-
-
-def find_odoo_order(ref):
-    res = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "sale.order", "search",
-        [[["client_order_ref", "=", ref]]],
-        {"limit": 1}
-    )
-    return res[0] if res else None
+    return PRODUCTS.get(package_id)
 
 
 def read_order_total(order_id) -> float:
@@ -150,49 +143,60 @@ def confirm_order(order_id, expected_total=None):
 # -----------------------------------------
 # SYNC PRODUITS
 # -----------------------------------------
-def sync_products():
-    print("📦 Sync produits Airalo...", flush=True)
-    data = supabase.table("airalo_packages").select("*").execute().data or []
+PACKAGE_COLUMNS = ("id", "name", "region", "price")
+PRODUCT_FIELDS = ("name", "list_price", "type")
 
-    for row in data:
-        pkg = row.get("id")
-        if not pkg:
-            continue
 
-        name = row.get("name") or pkg
-        region = row.get("region")
-        price = float(row.get("price") or 0)
-
-        existing = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "product.product", "search_read",
-            [[["default_code", "=", pkg]]],
-            {"fields": ["id"], "limit": 1}
-        )
-
-        vals = {
-            "name": f"{name} [{region}]" if region else name,
-            "default_code": pkg,
-            "list_price": price,    # ici tu es déjà en EUR (table airalo_packages)
-            "type": "service",
-        }
-
-        if existing:
-            models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "product.product", "write", [[existing[0]["id"]], vals])
+def sync_products():
+    print("📦 Sync produits Airalo...", flush=True)
+    catalog = CatalogSync(call, PRODUCT_FIELDS, index=PRODUCTS, pool=POOL)
+    for rows in iter_pages(select_columns(supabase, "airalo_packages", PACKAGE_COLUMNS)):
+        vals_by_code = {}
+        for row in rows:
+            pkg = row.get("id")
+            if not pkg:
+                continue
+
+            name = row.get("name") or pkg
+            region = row.get("region")
+            price = float(row.get("price") or 0)
+
+            vals_by_code[pkg] = {
+                "name": f"{name} [{region}]" if region else name,
+                "default_code": pkg,
+                "list_price": price,    # ici tu es déjà en EUR (table airalo_packages)
+                "type": "service",
+            }
+
+        # Seuls les produits nouveaux ou modifiés partent vers Odoo
+        created, updated = catalog.sync(vals_by_code)
+        for pkg in updated:
             print(f"🔁 Produit mis à jour : {pkg}", flush=True)
-        else:
-            models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "product.product", "create", [vals])
+        for pkg in created:
             print(f"✨ Produit créé : {pkg}", flush=True)
 
+    print(f"📊 Produits : {catalog.summary()}", flush=True)
     print("✅ Produits synchronisés.", flush=True)
 
 
 # -----------------------------------------
 # SYNC AIRALO ORDERS
 # -----------------------------------------
+AIRALO_ORDER_COLUMNS = ("id", "order_id", "email", "package_id", "prenom", "nom", "created_at")
+
+
 def sync_airalo_orders():
     print("📡 Sync Airalo orders…", flush=True)
-    rows = supabase.table("airalo_orders").select("*").execute().data or []
+    existing = OrderRefIndex(call)
+    for rows in iter_pages(select_columns(supabase, "airalo_orders", AIRALO_ORDER_COLUMNS)):
+        sync_airalo_page(rows, existing)
+
+
+def sync_airalo_page(rows, existing):
+    existing.prefetch(
+        f"AIRALO-{row['order_id']}" for row in rows if row.get("order_id")
+    )
+    orders = CreateBatch(call, "sale.order", pool=POOL)
 
     for row in rows:
         order_ref = row.get("order_id")
@@ -206,7 +210,7 @@ def sync_airalo_orders():
         # Optionnel: prefix pour éviter collisions avec Stripe
         odoo_ref = f"AIRALO-{order_ref}"
 
-        if find_odoo_order(odoo_ref):
+        if odoo_ref in existing:
             continue
 
         product = find_product(package_id)
@@ -219,33 +223,51 @@ def sync_airalo_orders():
             "last_name": row.get("nom")
         })
 
-        order_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "sale.order", "create",
-            [{
-                "partner_id": partner_id,
-                "client_order_ref": odoo_ref,
-                "date_order": created_at,
-                "origin": "Airalo",
-                "order_line": [
-                    (0, 0, {
-                        "product_id": product["id"],
-                        "name": product["name"],
-                        "product_uom_qty": 1,
-                        "price_unit": float(product["list_price"]),  # EUR
-                    })
-                ],
-            }]
-        )
+        orders.add((odoo_ref, row.get("created_at")), {
+            "partner_id": partner_id,
+            "client_order_ref": odoo_ref,
+            "date_order": created_at,
+            "origin": "Airalo",
+            "order_line": [
+                (0, 0, {
+                    "product_id": product["id"],
+                    "name": product["name"],
+                    "product_uom_qty": 1,
+                    "price_unit": float(product["list_price"]),  # EUR
+                })
+            ],
+        })
+        existing.add(odoo_ref)
+
+    for (odoo_ref, source_created_at), order_id in orders.flush():
+        METRICS.observe_lag("airalo", source_created_at)
         print(f"🟢 Commande Airalo créée : {odoo_ref} (id {order_id})", flush=True)
 
 
 # -----------------------------------------
 # SYNC STRIPE PAYMENTS (EUR only dans Odoo)
 # -----------------------------------------
+STRIPE_ORDER_COLUMNS = (
+    "id", "created_at", "stripe_session_id", "amount", "currency", "email",
+    "first_name", "last_name", "package_id", "package_name", "data_amount",
+    "data_unit", "promo_code", "destination_name",
+)
+
+
 def sync_stripe_payments():
     print("💳 Sync Stripe payments…", flush=True)
-    rows = supabase.table("orders").select("*").eq("status", "completed").execute().data or []
+    orders = select_columns(supabase, "orders", STRIPE_ORDER_COLUMNS)
+    existing = OrderRefIndex(call)
+    for rows in iter_pages(
+        lambda: orders().eq("status", "completed"),
+        order=("created_at", "id"),
+    ):
+        sync_stripe_page(rows, existing)
+
+
+def sync_stripe_page(rows, existing):
+    existing.prefetch(row.get("stripe_session_id") for row in rows)
+    orders = CreateBatch(call, "sale.order", pool=POOL)
 
     for row in rows:
         order_ref = row.get("stripe_session_id")
@@ -253,8 +275,7 @@ def sync_stripe_payments():
             continue
 
         # Anti-doublon
-        odoo_order_id = find_odoo_order(order_ref)
-        if odoo_order_id:
+        if order_ref in existing:
             continue
 
         # ✅ Prix EUR calculé proprement (clé du fix)
@@ -288,28 +309,30 @@ def sync_stripe_payments():
         if promo:
             note_html += f"<p><strong>Code Promo :</strong> {promo}</p>"
 
-        odoo_order_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "sale.order", "create",
-            [{
-                "partner_id": partner_id,
-                "client_order_ref": order_ref,
-                "origin": "Stripe",
-                "note": note_html,
-                "order_line": [
-                    (0, 0, {
-                        "product_id": product["id"],
-                        "name": product["name"],
-                        "product_uom_qty": 1,
-                        "price_unit": float(price_eur),  # ✅ EUR uniquement
-                    })
-                ],
-            }]
-        )
+        orders.add((order_ref, price_eur, row.get("created_at")), {
+            "partner_id": partner_id,
+            "client_order_ref": order_ref,
+            "origin": "Stripe",
+            "note": note_html,
+            "order_line": [
+                (0, 0, {
+                    "product_id": product["id"],
+                    "name": product["name"],
+                    "product_uom_qty": 1,
+                    "price_unit": float(price_eur),  # ✅ EUR uniquement
+                })
+            ],
+        })
+        existing.add(order_ref)
+
+    created = []
+    for (order_ref, price_eur, source_created_at), odoo_order_id in orders.flush():
+        METRICS.observe_lag("stripe", source_created_at)
         print(f"🧾 Commande Stripe créée : {order_ref} -> {price_eur:.2f} EUR (id {odoo_order_id})", flush=True)
+        created.append((odoo_order_id, price_eur))
 
-        # ✅ Confirme seulement si le total correspond
-        confirm_order(odoo_order_id, expected_total=price_eur)
+    # ✅ Confirme seulement si le total correspond (en parallèle, logs dans l'ordre)
+    POOL.map(lambda item: confirm_order(item[0], expected_total=item[1]), created)
 
 
 # -----------------------------------------
@@ -317,7 +340,9 @@ def sync_stripe_payments():
 # -----------------------------------------
 if __name__ == "__main__":
     print("🚀 FULL SYNC STARTED", flush=True)
-    sync_products()
-    sync_airalo_orders()
-    sync_stripe_payments()
+    # Métriques du run, dont la fraîcheur des commandes Airalo : SYNC_METRICS_DIR/main.*
+    with METRICS.run("main"):
+        sync_products()
+        sync_airalo_orders()
+        sync_stripe_payments()
     print("🎉 FULL SYNC DONE", flush=True)
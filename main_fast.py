@@ -1,7 +1,18 @@
+import argparse
+import asyncio
 import os
 import sys
-import xmlrpc.client
 from supabase import create_client, Client
+from odoo_batch import BATCH_SIZE, CreateBatch, acreate_isolating
+from odoo_budget import caller_name, set_origin
+from odoo_index import OrderRefIndex, PartnerIndex, ProductIndex, chunked
+from odoo_pool import OdooPool
+from odoo_refcache import RefCache
+from odoo_transport import server_proxy
+from supabase_reader import aiter_pages, iter_pages, select_columns
+from sync_metrics import METRICS
+from sync_profile import profiled
+from sync_state import WatermarkStore, resume_key, since_mark
 
 # ============================================================
 #  CONFIG
@@ -21,12 +32,20 @@ if not all([ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD]):
     sys.exit(1)
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common", allow_none=True)
+common = server_proxy(ODOO_URL, "common")
 uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
 if not uid:
     print("❌ Impossible de s'authentifier sur Odoo.", flush=True)
     sys.exit(1)
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object", allow_none=True)
+# Un ServerProxy par thread : les créations de clients / commandes partent en parallèle
+POOL = OdooPool(ODOO_URL)
+models = POOL.models
+
+def call(model, method, args, kw=None):
+    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
+
+# Catégories : ids conservés sur disque (REFCACHE_FILE, REFCACHE_TTL)
+REF = RefCache(ODOO_URL, ODOO_DB, call)
 
 # ============================================================
 #  CONSTANTES
@@ -34,138 +53,166 @@ models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object", allow_none=Tru
 XPF_PER_EUR = 119.33
 ESIM_CATEGORY_ID = None
 INSURANCE_CATEGORY_ID = None
+PARTNERS = PartnerIndex(call)
+PRODUCTS = ProductIndex(call)
+STATE = WatermarkStore()
+INSURANCE_PRODUCT_LABELS = {
+    "ava_tourist_card": "AVA Tourist Card",
+    "ava_carte_sante": "AVA Carte Sante",
+    "avantages_pom": "AVAntages POM",
+}
 
 # ============================================================
 #  HELPERS COMMUNS
 # ============================================================
+def get_or_create_category(name):
+    """Catégorie produit par nom, créée si absente (cache de référence REF)."""
+    def lookup():
+        ids = models.execute_kw(
+            ODOO_DB, uid, ODOO_PASSWORD,
+            "product.category", "search",
+            [[("name", "=", name)]],
+            {"limit": 1}
+        )
+        if ids:
+            return ids[0]
+        return models.execute_kw(
+            ODOO_DB, uid, ODOO_PASSWORD,
+            "product.category", "create",
+            [{"name": name}]
+        )
+    return REF.resolve(f"product.category:{name}", lookup)
+
 def get_or_create_esim_category():
     global ESIM_CATEGORY_ID
-    if ESIM_CATEGORY_ID:
-        return ESIM_CATEGORY_ID
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.category", "search",
-        [[("name", "=", "Forfaits eSIM")]],
-        {"limit": 1}
-    )
-    if ids:
-        ESIM_CATEGORY_ID = ids[0]
-        return ESIM_CATEGORY_ID
-    ESIM_CATEGORY_ID = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.category", "create",
-        [{"name": "Forfaits eSIM"}]
-    )
+    if not ESIM_CATEGORY_ID:
+        ESIM_CATEGORY_ID = get_or_create_category("Forfaits eSIM")
     return ESIM_CATEGORY_ID
 
 def get_or_create_insurance_category():
     global INSURANCE_CATEGORY_ID
-    if INSURANCE_CATEGORY_ID:
-        return INSURANCE_CATEGORY_ID
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.category", "search",
-        [[("name", "=", "Assurance Voyage")]],
-        {"limit": 1}
-    )
-    if ids:
-        INSURANCE_CATEGORY_ID = ids[0]
-        return INSURANCE_CATEGORY_ID
-    INSURANCE_CATEGORY_ID = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.category", "create",
-        [{"name": "Assurance Voyage"}]
-    )
+    if not INSURANCE_CATEGORY_ID:
+        INSURANCE_CATEGORY_ID = get_or_create_category("Assurance Voyage")
     return INSURANCE_CATEGORY_ID
 
-def ensure_partner(email, first_name=None, last_name=None, supabase_id=None):
-    if not email:
-        email = "client@fenuasim.com"
-    email = email.strip().lower()
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "res.partner", "search",
-        [[("email", "=ilike", email)]],
-        {"limit": 1}
-    )
-    if ids:
-        return ids[0]
+def partner_email(email):
+    return (email or "client@fenuasim.com").strip().lower()
+
+def partner_vals(email, first_name=None, last_name=None, supabase_id=None):
     fullname = f"{first_name or ''} {last_name or ''}".strip() or email
     vals = {"name": fullname, "email": email, "customer_rank": 1}
     if supabase_id:
         vals["ref"] = str(supabase_id)
+    return vals
+
+def ensure_partner(email, first_name=None, last_name=None, supabase_id=None):
+    email = partner_email(email)
+    existing = PARTNERS.get(email)
+    if existing:
+        return existing
+    vals = partner_vals(email, first_name, last_name, supabase_id)
     pid = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "res.partner", "create", [vals])
-    print(f"🆕 Nouveau client Odoo : {fullname} ({email})", flush=True)
+    PARTNERS.add(email, pid)
+    print(f"🆕 Nouveau client Odoo : {vals['name']} ({email})", flush=True)
     return pid
 
-def get_or_create_product(row):
+def missing_partners(contacts):
+    """
+    Contacts dont l'email n'est pas encore dans l'index, un seul par email.
+    contacts : tuples (email, first_name, last_name, supabase_id) comme ensure_partner().
+    """
+    missing = {}
+    for contact in contacts:
+        email = partner_email(contact[0])
+        if email not in missing and email not in PARTNERS:
+            missing[email] = contact
+    return missing
+
+def ensure_partners(contacts):
+    """Crée en parallèle (pool de threads) les clients absents de l'index."""
+    POOL.map(lambda contact: ensure_partner(*contact), missing_partners(contacts).values())
+
+def esim_product_vals(row):
     package_id = row.get("package_id") or "ESIM-UNKNOWN"
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.product", "search",
-        [[("default_code", "=", package_id)]],
-        {"limit": 1}
-    )
-    if ids:
-        return ids[0]
     label_parts = []
     if row.get("package_name"):
         label_parts.append(row["package_name"])
     if row.get("data_amount") and row.get("data_unit"):
         label_parts.append(f"{row['data_amount']} {row['data_unit']}")
     name = " - ".join(label_parts) or "Forfait eSIM"
-    pid = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.product", "create",
-        [{
-            "name": name,
-            "default_code": package_id,
-            "type": "service",
-            "categ_id": get_or_create_esim_category(),
-        }]
-    )
-    print(f"🆕 Produit créé : {name} (code={package_id})", flush=True)
-    return pid
-
-def get_or_create_insurance_product(product_type):
-    PRODUCT_LABELS = {
-        "ava_tourist_card": "AVA Tourist Card",
-        "ava_carte_sante": "AVA Carte Sante",
-        "avantages_pom": "AVAntages POM",
+    return {
+        "name": name,
+        "default_code": package_id,
+        "type": "service",
+        "categ_id": get_or_create_esim_category(),
     }
+
+def insurance_product_vals(product_type):
     code = f"AVA-{product_type.upper()}"
-    label = PRODUCT_LABELS.get(product_type, f"Assurance {product_type}")
+    label = INSURANCE_PRODUCT_LABELS.get(product_type, f"Assurance {product_type}")
+    return {
+        "name": label,
+        "default_code": code,
+        "type": "service",
+        "categ_id": get_or_create_insurance_category(),
+    }
 
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.product", "search",
-        [[("default_code", "=", code)]],
-        {"limit": 1}
-    )
-    if ids:
-        return ids[0]
+def missing_esim_products(rows):
+    """Forfaits eSIM absents du catalogue Odoo : {default_code: vals}."""
+    missing = {}
+    for row in rows:
+        package_id = row.get("package_id") or "ESIM-UNKNOWN"
+        if package_id not in missing and package_id not in PRODUCTS:
+            missing[package_id] = esim_product_vals(row)
+    return missing
 
-    pid = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.product", "create",
-        [{
-            "name": label,
-            "default_code": code,
-            "type": "service",
-            "categ_id": get_or_create_insurance_category(),
-        }]
-    )
-    print(f"🆕 Produit assurance créé : {label} (code={code})", flush=True)
-    return pid
+def missing_insurance_products(product_types):
+    """Produits assurance absents du catalogue Odoo : {default_code: vals}."""
+    missing = {}
+    for product_type in product_types:
+        code = f"AVA-{product_type.upper()}"
+        if code not in missing and code not in PRODUCTS:
+            missing[code] = insurance_product_vals(product_type)
+    return missing
 
-def find_order(client_order_ref: str):
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "sale.order", "search",
-        [[("client_order_ref", "=", client_order_ref)]],
-        {"limit": 1}
-    )
-    return ids[0] if ids else None
+def ensure_esim_products(rows):
+    """Crée en un seul appel les forfaits eSIM absents du catalogue Odoo."""
+    missing = missing_esim_products(rows)
+    for code in PRODUCTS.create_many(missing):
+        print(f"🆕 Produit créé : {missing[code]['name']} (code={code})", flush=True)
+
+def ensure_insurance_products(product_types):
+    """Crée en un seul appel les produits assurance absents du catalogue Odoo."""
+    missing = missing_insurance_products(product_types)
+    for code in PRODUCTS.create_many(missing):
+        print(f"🆕 Produit assurance créé : {missing[code]['name']} (code={code})", flush=True)
+
+def get_or_create_product(row):
+    package_id = row.get("package_id") or "ESIM-UNKNOWN"
+    if package_id not in PRODUCTS:
+        ensure_esim_products([row])
+    return PRODUCTS.get(package_id)["id"]
+
+def get_or_create_insurance_product(product_type):
+    code = f"AVA-{product_type.upper()}"
+    if code not in PRODUCTS:
+        ensure_insurance_products([product_type])
+    return PRODUCTS.get(code)["id"]
+
+def watermark_for(table, full=False):
+    """Marqueur de reprise de `table`, ou None en mode complet / premier run."""
+    mark = None if full else STATE.get(table)
+    if mark:
+        print(f"⏩ {table} : lignes depuis {mark[0]} (recouvrement inclus)", flush=True)
+    else:
+        print(f"🔁 {table} : lecture complète", flush=True)
+    return mark
+
+def warn_rejected(table, refs):
+    """Références refusées par Odoo (CreateBatch.failed) : le marqueur les dépasse."""
+    if refs:
+        print(f"⚠️ {table} : {len(refs)} ligne(s) refusée(s) par Odoo, reprises seulement au prochain --full : "
+              f"{', '.join(refs)}", flush=True)
 
 def compute_price_eur(row) -> float:
     currency = (row.get("currency") or "EUR").upper()
@@ -181,38 +228,65 @@ def compute_price_eur(row) -> float:
 # ============================================================
 #  SYNC eSIM STRIPE -> ODOO
 # ============================================================
-def sync_stripe_orders_to_odoo_quotes():
+STRIPE_ORDER_COLUMNS = (
+    "id", "created_at", "stripe_session_id", "amount", "currency", "email",
+    "first_name", "last_name", "package_id", "package_name", "data_amount",
+    "data_unit", "promo_code", "destination_name",
+)
+
+def sync_stripe_orders_to_odoo_quotes(full=False):
     print("💳 Sync eSIM Stripe -> Odoo (devis, sans confirmation)…", flush=True)
-    rows = (
-        supabase
-        .table("orders")
-        .select("*")
-        .eq("status", "completed")
-        .order("created_at")
-        .execute()
-        .data
-        or []
-    )
+    orders = select_columns(supabase, "orders", STRIPE_ORDER_COLUMNS)
+    mark = watermark_for("orders", full)
+    existing = OrderRefIndex(call)
+    for rows in iter_pages(
+        lambda: since_mark(orders().eq("status", "completed"), mark),
+        order=("created_at", "id"), after=resume_key(mark),
+    ):
+        sync_stripe_page(rows, existing)
+        # Marqueur avancé une fois toutes les commandes de la page créées. Les
+        # lignes refusées par Odoo (signalées par warn_rejected) sont dépassées
+        # aussi : les garder bloquerait le run sur une même page à chaque
+        # passage ; la réconciliation --full quotidienne les retente.
+        STATE.advance("orders", rows[-1])
+        STATE.save()
+
+    print("✅ Sync eSIM terminé.", flush=True)
+
+def filter_stripe_rows(rows, existing):
+    """Lignes à créer : référence présente, absente d'Odoo, montant valide -> [(row, price_eur)]."""
+    todo = []
     for row in rows:
         ref = row.get("stripe_session_id")
         if not ref:
+            METRICS.count("rows_skipped", table="orders", reason="no_ref")
             continue
-        if find_order(ref):
+        if ref in existing:
+            METRICS.count("rows_skipped", table="orders", reason="duplicate")
             continue
         try:
             price_eur = compute_price_eur(row)
         except Exception as e:
             print(f"❌ Skip {ref} : {e}", flush=True)
+            METRICS.count("rows_skipped", table="orders", reason="invalid")
             continue
+        todo.append((row, price_eur))
+        existing.add(ref)
+    return todo
+
+def stripe_contact(row):
+    return (row.get("email"), row.get("first_name"), row.get("last_name"), row.get("id"))
 
-        currency_paid = (row.get("currency") or "EUR").upper()
-        amount_paid = row.get("amount")
-        promo = row.get("promo_code")
-        pid = ensure_partner(row.get("email"), row.get("first_name"), row.get("last_name"), row.get("id"))
-        product_id = get_or_create_product(row)
-        label = row.get("package_name") or "Forfait eSIM"
+def stripe_order_vals(row, price_eur):
+    """Payload sale.order d'une commande Stripe (clients et produits déjà résolus)."""
+    currency_paid = (row.get("currency") or "EUR").upper()
+    amount_paid = row.get("amount")
+    promo = row.get("promo_code")
+    pid = ensure_partner(*stripe_contact(row))
+    product_id = get_or_create_product(row)
+    label = row.get("package_name") or "Forfait eSIM"
 
-        note_html = f"""
+    note_html = f"""
         <p><strong>Commande eSIM FENUA SIM</strong></p>
         <p>
         <strong>Statut :</strong> Payé via Stripe (importé en devis dans Odoo)<br/>
@@ -224,86 +298,131 @@ def sync_stripe_orders_to_odoo_quotes():
         <strong>Montant enregistré Odoo :</strong> {price_eur:.2f} EUR
         </p>
         """
-        if promo:
-            note_html += f"<p><strong>Code Promo :</strong> {promo}</p>"
+    if promo:
+        note_html += f"<p><strong>Code Promo :</strong> {promo}</p>"
 
-        order_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "sale.order", "create",
-            [{
-                "partner_id": pid,
-                "client_order_ref": ref,
-                "origin": "Stripe",
-                "note": note_html,
-                "order_line": [(0, 0, {
-                    "product_id": product_id,
-                    "name": label,
-                    "product_uom_qty": 1,
-                    "price_unit": float(price_eur),
-                })]
-            }]
-        )
-        print(f"🧾 Devis eSIM créé {ref} -> {price_eur:.2f} EUR (payé {amount_paid} {currency_paid}) order_id={order_id}", flush=True)
+    return {
+        "partner_id": pid,
+        "client_order_ref": row["stripe_session_id"],
+        "origin": "Stripe",
+        "note": note_html,
+        "order_line": [(0, 0, {
+            "product_id": product_id,
+            "name": label,
+            "product_uom_qty": 1,
+            "price_unit": float(price_eur),
+        })]
+    }
 
-    print("✅ Sync eSIM terminé.", flush=True)
+def print_stripe_created(row, price_eur, order_id):
+    currency_paid = (row.get("currency") or "EUR").upper()
+    print(f"🧾 Devis eSIM créé {row['stripe_session_id']} -> {price_eur:.2f} EUR (payé {row.get('amount')} {currency_paid}) order_id={order_id}", flush=True)
+
+def sync_stripe_page(rows, existing):
+    """Une page de commandes Stripe : anti-doublon, produits, clients, création groupée."""
+    # Anti-doublon : une seule passe Odoo pour toutes les références de la page
+    with METRICS.phase("orders.dedupe"):
+        existing.prefetch(row.get("stripe_session_id") for row in rows)
+        todo = filter_stripe_rows(rows, existing)
+
+    # Résolution groupée : produits en un create, clients en parallèle
+    with METRICS.phase("orders.products"):
+        ensure_esim_products(row for row, _ in todo)
+    with METRICS.phase("orders.partners"):
+        ensure_partners(stripe_contact(row) for row, _ in todo)
+
+    with METRICS.phase("orders.create"):
+        orders = CreateBatch(call, "sale.order", pool=POOL)
+        for row, price_eur in todo:
+            orders.add((row, price_eur), stripe_order_vals(row, price_eur))
+
+        # Création groupée : un create par paquet, ids renvoyés dans l'ordre des payloads
+        for (row, price_eur), order_id in orders.flush():
+            METRICS.observe_lag("stripe", row.get("created_at"))
+            print_stripe_created(row, price_eur, order_id)
+        warn_rejected("orders", [row["stripe_session_id"] for (row, _), _ in orders.failed])
 
 # ============================================================
 #  SYNC ASSURANCE -> ODOO
 # ============================================================
-def sync_insurance_orders_to_odoo():
+INSURANCE_COLUMNS = (
+    "id", "created_at", "adhesion_number", "total_amount", "premium_ava",
+    "frais_distribution", "product_type", "user_email", "subscriber_first_name",
+    "subscriber_last_name", "start_date", "end_date", "contract_number", "contract_link",
+)
+
+def sync_insurance_orders_to_odoo(full=False):
     print("🛡️  Sync Assurance -> Odoo (devis, sans confirmation)…", flush=True)
 
-    rows = (
-        supabase
-        .table("insurances")
-        .select("*")
-        .in_("status", ["paid", "active"])
-        .order("created_at")
-        .execute()
-        .data
-        or []
-    )
+    insurances = select_columns(supabase, "insurances", INSURANCE_COLUMNS)
+    mark = watermark_for("insurances", full)
+    existing = OrderRefIndex(call)
+    for rows in iter_pages(
+        lambda: since_mark(insurances().in_("status", ["paid", "active"]), mark),
+        order=("created_at", "id"), after=resume_key(mark),
+    ):
+        sync_insurance_page(rows, existing)
+        # Lignes refusées par Odoo dépassées comme pour les commandes Stripe (--full les retente)
+        STATE.advance("insurances", rows[-1])
+        STATE.save()
+
+    print("✅ Sync assurance terminé.", flush=True)
 
+def filter_insurance_rows(rows, existing):
+    """Adhésions à créer : numéro présent, absent d'Odoo, montant renseigné."""
+    todo = []
     for row in rows:
         # Référence unique = numéro d'adhésion AVA
         ref = row.get("adhesion_number")
         if not ref:
+            METRICS.count("rows_skipped", table="insurances", reason="no_ref")
             continue
 
         # Anti-doublon
-        if find_order(ref):
+        if ref in existing:
+            METRICS.count("rows_skipped", table="insurances", reason="duplicate")
             continue
 
-        total_amount = float(row.get("total_amount") or 0)
-        premium_ava = float(row.get("premium_ava") or 0)
-        frais = float(row.get("frais_distribution") or 10)
-        product_type = row.get("product_type") or "ava_tourist_card"
-
-        if total_amount <= 0:
+        if float(row.get("total_amount") or 0) <= 0:
             print(f"❌ Skip {ref} : montant vide", flush=True)
+            METRICS.count("rows_skipped", table="insurances", reason="invalid")
             continue
+        todo.append(row)
+        existing.add(ref)
+    return todo
 
-        PRODUCT_LABELS = {
-            "ava_tourist_card": "AVA Tourist Card",
-            "ava_carte_sante": "AVA Carte Sante",
-            "avantages_pom": "AVAntages POM",
-        }
-        product_label = PRODUCT_LABELS.get(product_type, f"Assurance {product_type}")
-
-        pid = ensure_partner(
-            row.get("user_email"),
-            row.get("subscriber_first_name"),
-            row.get("subscriber_last_name"),
-            row.get("id")
-        )
-        product_id = get_or_create_insurance_product(product_type)
+def insurance_contact(row):
+    return (
+        row.get("user_email"),
+        row.get("subscriber_first_name"),
+        row.get("subscriber_last_name"),
+        row.get("id"),
+    )
+
+def insurance_product_types(todo):
+    if not todo:
+        return []
+    return [row.get("product_type") or "ava_tourist_card" for row in todo] + ["frais_distribution"]
+
+def insurance_order_vals(row):
+    """Payload sale.order d'une adhésion AVA (clients et produits déjà résolus)."""
+    ref = row["adhesion_number"]
+    total_amount = float(row.get("total_amount") or 0)
+    premium_ava = float(row.get("premium_ava") or 0)
+    frais = float(row.get("frais_distribution") or 10)
+    product_type = row.get("product_type") or "ava_tourist_card"
+
+    product_label = INSURANCE_PRODUCT_LABELS.get(product_type, f"Assurance {product_type}")
 
-        start_date = row.get("start_date", "N/A")
-        end_date = row.get("end_date", "N/A")
-        contract_number = row.get("contract_number") or "N/A"
-        contract_link = row.get("contract_link") or ""
+    pid = ensure_partner(*insurance_contact(row))
+    product_id = get_or_create_insurance_product(product_type)
 
-        note_html = f"""
+    start_date = row.get("start_date", "N/A")
+    end_date = row.get("end_date", "N/A")
+    contract_number = row.get("contract_number") or "N/A"
+    contract_link = row.get("contract_link") or ""
+
+    note_html = f"""
         <p><strong>Commande Assurance Voyage FENUA SIM</strong></p>
         <p>
         <strong>Produit :</strong> {product_label}<br/>
@@ -318,42 +437,251 @@ def sync_insurance_orders_to_odoo():
         <strong>Total TTC :</strong> {total_amount:.2f} EUR
         </p>
         """
-        if contract_link:
-            note_html += f'<p><a href="{contract_link}">📄 Certificat de garantie</a></p>'
+    if contract_link:
+        note_html += f'<p><a href="{contract_link}">📄 Certificat de garantie</a></p>'
 
-        order_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "sale.order", "create",
-            [{
-                "partner_id": pid,
-                "client_order_ref": ref,
-                "origin": "AVA Assurances",
-                "note": note_html,
-                "order_line": [
-                    (0, 0, {
-                        "product_id": product_id,
-                        "name": f"{product_label} — {ref}",
-                        "product_uom_qty": 1,
-                        "price_unit": float(premium_ava),
-                    }),
-                    (0, 0, {
-                        "product_id": get_or_create_insurance_product("frais_distribution"),
-                        "name": "Frais de distribution FENUA SIM",
-                        "product_uom_qty": 1,
-                        "price_unit": float(frais),
-                    }),
-                ],
-            }]
-        )
-        print(f"🧾 Devis assurance créé {ref} -> {total_amount:.2f} EUR order_id={order_id}", flush=True)
+    return {
+        "partner_id": pid,
+        "client_order_ref": ref,
+        "origin": "AVA Assurances",
+        "note": note_html,
+        "order_line": [
+            (0, 0, {
+                "product_id": product_id,
+                "name": f"{product_label} — {ref}",
+                "product_uom_qty": 1,
+                "price_unit": float(premium_ava),
+            }),
+            (0, 0, {
+                "product_id": get_or_create_insurance_product("frais_distribution"),
+                "name": "Frais de distribution FENUA SIM",
+                "product_uom_qty": 1,
+                "price_unit": float(frais),
+            }),
+        ],
+    }
+
+def print_insurance_created(row, order_id):
+    total_amount = float(row.get("total_amount") or 0)
+    print(f"🧾 Devis assurance créé {row['adhesion_number']} -> {total_amount:.2f} EUR order_id={order_id}", flush=True)
+
+def sync_insurance_page(rows, existing):
+    """Une page d'adhésions AVA : anti-doublon, produits, clients, création groupée."""
+    with METRICS.phase("insurances.dedupe"):
+        existing.prefetch(row.get("adhesion_number") for row in rows)
+        todo = filter_insurance_rows(rows, existing)
+
+    with METRICS.phase("insurances.products"):
+        ensure_insurance_products(insurance_product_types(todo))
+    with METRICS.phase("insurances.partners"):
+        ensure_partners(insurance_contact(row) for row in todo)
+
+    with METRICS.phase("insurances.create"):
+        orders = CreateBatch(call, "sale.order", pool=POOL)
+        for row in todo:
+            orders.add(row, insurance_order_vals(row))
+
+        for row, order_id in orders.flush():
+            METRICS.observe_lag("ava", row.get("created_at"))
+            print_insurance_created(row, order_id)
+        warn_rejected("insurances", [row["adhesion_number"] for row, _ in orders.failed])
+
+# ============================================================
+#  MOTEUR ASYNCIO (SYNC_ENGINE=asyncio)
+# ============================================================
+# Même pipeline que ci-dessus, mais toutes les requêtes Odoo passent par un
+# client JSON-RPC asynchrone, sur une seule boucle. Pipeline par page : la
+# création des commandes de la page N (tâche de fond) se recouvre avec la
+# lecture Supabase, l'anti-doublon et la création des produits / clients de
+# la page N+1 ; le marqueur n'avance qu'une fois les commandes d'une page créées.
+# Les index (PARTNERS, PRODUCTS) sont les mêmes objets que pour le moteur threads.
+# odoo_async (et httpx) ne sont importés qu'avec ce moteur. Les appels
+# bloquants restants (cache de référence REF : vérification XML-RPC, fichier)
+# passent par asyncio.to_thread pour ne pas geler la boucle.
+
+async def aprepare_indexes(odoo):
+    """Charge en parallèle les index clients / produits et les catégories, une fois."""
+    from odoo_async import get_or_create_by_name, load_partners, load_products
+    global ESIM_CATEGORY_ID, INSURANCE_CATEGORY_ID
+    pending = []
+    if PARTNERS.by_email is None:
+        pending.append(load_partners(odoo, PARTNERS))
+    if PRODUCTS.by_code is None:
+        pending.append(load_products(odoo, PRODUCTS))
+    await asyncio.gather(*pending)
+    if not ESIM_CATEGORY_ID or not INSURANCE_CATEGORY_ID:
+        names = ["Forfaits eSIM", "Assurance Voyage"]
+        known = await asyncio.to_thread(lambda: {name: REF.get(f"product.category:{name}") for name in names})
+        missing = [name for name, categ_id in known.items() if categ_id is None]
+        found = await asyncio.gather(*(get_or_create_by_name(odoo, "product.category", name) for name in missing))
+        for name, categ_id in zip(missing, found):
+            await asyncio.to_thread(REF.set, f"product.category:{name}", categ_id)
+            known[name] = categ_id
+        ESIM_CATEGORY_ID, INSURANCE_CATEGORY_ID = (known[name] for name in names)
+
+async def acreate_many(odoo, model, payloads, failed=None):
+    """
+    [(clé, vals)] -> [(clé, id)] ; un create par paquet de ODOO_BATCH_SIZE,
+    paquets en parallèle. Un paquet refusé est coupé en deux comme dans
+    CreateBatch (odoo_batch.acreate_isolating) : les payloads refusés sont
+    signalés, ajoutés à `failed` et absents du résultat ; les pannes
+    incertaines remontent.
+    """
+    failed = [] if failed is None else failed
+    chunks = list(chunked(payloads, odoo.limits.batch_size(BATCH_SIZE)))
+    # Les tâches du gather copient le contexte : leurs appels sont comptés sous acreate_many
+    set_origin(caller_name(1))
+    try:
+        results = await asyncio.gather(*(acreate_isolating(odoo.call, model, chunk, failed) for chunk in chunks))
+    finally:
+        set_origin(None)
+    return [pair for created in results for pair in created]
+
+async def acreate_partners(odoo, contacts):
+    missing = missing_partners(contacts)
+    vals_by_email = {email: partner_vals(email, *contact[1:]) for email, contact in missing.items()}
+    for email, pid in await acreate_many(odoo, "res.partner", list(vals_by_email.items())):
+        PARTNERS.add(email, pid)
+        print(f"🆕 Nouveau client Odoo : {vals_by_email[email]['name']} ({email})", flush=True)
+
+def with_partner(todo, contact, table):
+    """Lignes dont le client existe dans Odoo ; les autres (client refusé) sont écartées."""
+    kept = []
+    for item in todo:
+        if partner_email(contact(item)[0]) in PARTNERS:
+            kept.append(item)
+        else:
+            METRICS.count("rows_skipped", table=table, reason="partner_failed")
+    return kept
+
+async def apipeline(pages, resolve, create):
+    """
+    Pour chaque page : `resolve(rows)` (anti-doublon, produits, clients) puis
+    `create(rows, todo)` en tâche de fond, attendue juste avant de lancer la
+    création de la page suivante : les commandes et les marqueurs restent
+    dans l'ordre des pages.
+    """
+    creating = None
+    try:
+        async for rows in pages:
+            todo = await resolve(rows)
+            if creating is not None:
+                await creating
+            creating = asyncio.create_task(create(rows, todo))
+        if creating is not None:
+            await creating
+    except BaseException:
+        # Laisse finir (sans l'annuler) une création déjà envoyée à Odoo
+        if creating is not None and not creating.done():
+            await asyncio.gather(creating, return_exceptions=True)
+        raise
+
+async def sync_stripe_orders_async(odoo, full=False):
+    from odoo_async import create_products, prefetch_refs
+    print("💳 Sync eSIM Stripe -> Odoo (devis, sans confirmation, asyncio)…", flush=True)
+    orders = select_columns(supabase, "orders", STRIPE_ORDER_COLUMNS)
+    mark = watermark_for("orders", full)
+    existing = OrderRefIndex(call)
+
+    async def resolve(rows):
+        with METRICS.phase("orders.dedupe"):
+            await prefetch_refs(odoo, existing, (row.get("stripe_session_id") for row in rows))
+            todo = filter_stripe_rows(rows, existing)
+        if todo:
+            with METRICS.phase("orders.products"):
+                await aprepare_indexes(odoo)
+                missing = missing_esim_products(row for row, _ in todo)
+                for code in await create_products(odoo, PRODUCTS, missing):
+                    print(f"🆕 Produit créé : {missing[code]['name']} (code={code})", flush=True)
+            with METRICS.phase("orders.partners"):
+                await acreate_partners(odoo, (stripe_contact(row) for row, _ in todo))
+        return with_partner(todo, lambda item: stripe_contact(item[0]), "orders")
+
+    async def create(rows, todo):
+        with METRICS.phase("orders.create"):
+            payloads = [((row, price_eur), stripe_order_vals(row, price_eur)) for row, price_eur in todo]
+            failed = []
+            for (row, price_eur), order_id in await acreate_many(odoo, "sale.order", payloads, failed):
+                METRICS.observe_lag("stripe", row.get("created_at"))
+                print_stripe_created(row, price_eur, order_id)
+            warn_rejected("orders", [row["stripe_session_id"] for (row, _), _ in failed])
+        # Lignes refusées dépassées comme dans sync_stripe_orders_to_odoo_quotes (--full les retente)
+        STATE.advance("orders", rows[-1])
+        await asyncio.to_thread(STATE.save)
+
+    await apipeline(aiter_pages(
+        lambda: since_mark(orders().eq("status", "completed"), mark),
+        order=("created_at", "id"), after=resume_key(mark),
+    ), resolve, create)
+
+    print("✅ Sync eSIM terminé.", flush=True)
+
+async def sync_insurance_orders_async(odoo, full=False):
+    from odoo_async import create_products, prefetch_refs
+    print("🛡️  Sync Assurance -> Odoo (devis, sans confirmation, asyncio)…", flush=True)
+    insurances = select_columns(supabase, "insurances", INSURANCE_COLUMNS)
+    mark = watermark_for("insurances", full)
+    existing = OrderRefIndex(call)
+
+    async def resolve(rows):
+        with METRICS.phase("insurances.dedupe"):
+            await prefetch_refs(odoo, existing, (row.get("adhesion_number") for row in rows))
+            todo = filter_insurance_rows(rows, existing)
+        if todo:
+            with METRICS.phase("insurances.products"):
+                await aprepare_indexes(odoo)
+                missing = missing_insurance_products(insurance_product_types(todo))
+                for code in await create_products(odoo, PRODUCTS, missing):
+                    print(f"🆕 Produit assurance créé : {missing[code]['name']} (code={code})", flush=True)
+            with METRICS.phase("insurances.partners"):
+                await acreate_partners(odoo, (insurance_contact(row) for row in todo))
+        return with_partner(todo, insurance_contact, "insurances")
+
+    async def create(rows, todo):
+        with METRICS.phase("insurances.create"):
+            payloads = [(row, insurance_order_vals(row)) for row in todo]
+            failed = []
+            for row, order_id in await acreate_many(odoo, "sale.order", payloads, failed):
+                METRICS.observe_lag("ava", row.get("created_at"))
+                print_insurance_created(row, order_id)
+            warn_rejected("insurances", [row["adhesion_number"] for row, _ in failed])
+        STATE.advance("insurances", rows[-1])
+        await asyncio.to_thread(STATE.save)
+
+    await apipeline(aiter_pages(
+        lambda: since_mark(insurances().in_("status", ["paid", "active"]), mark),
+        order=("created_at", "id"), after=resume_key(mark),
+    ), resolve, create)
 
     print("✅ Sync assurance terminé.", flush=True)
 
+async def run_async(full=False):
+    from odoo_async import AsyncOdoo
+    async with AsyncOdoo(ODOO_URL, ODOO_DB, uid, ODOO_PASSWORD) as odoo:
+        # Les deux flux restent séquentiels pour garder des logs lisibles et
+        # éviter de créer deux fois le même client partagé entre eSIM et assurance
+        await sync_stripe_orders_async(odoo, full)
+        await sync_insurance_orders_async(odoo, full)
+
 # ============================================================
 #  MAIN
 # ============================================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync Supabase -> Odoo (devis eSIM et assurance)")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore les marqueurs de reprise et relit tout l'historique (réconciliation)")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default=os.getenv("SYNC_ENGINE", "threads"),
+                        help="moteur d'exécution des appels Odoo (défaut : $SYNC_ENGINE ou threads)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile le run (cProfile + piles par phase dans SYNC_PROFILE_DIR, voir sync_profile.py)")
+    args = parser.parse_args()
+
     print("🚀 SCRIPT DEMARRÉ", flush=True)
-    sync_stripe_orders_to_odoo_quotes()
-    sync_insurance_orders_to_odoo()
+    # Métriques du run : SYNC_METRICS_DIR/main_fast.prom et .json (sync_metrics)
+    with METRICS.run("main_fast"), profiled("main_fast", args.profile):
+        if args.engine == "asyncio":
+            asyncio.run(run_async(full=args.full))
+        else:
+            sync_stripe_orders_to_odoo_quotes(full=args.full)
+            sync_insurance_orders_to_odoo(full=args.full)
     print("✅ SCRIPT TERMINÉ", flush=True)
@@ -1,6 +1,12 @@
+import argparse
 import os
-import xmlrpc.client
 from supabase import create_client
+from odoo_refcache import RefCache
+from odoo_transport import connect
+from product_sync import CatalogLoader, CatalogSync
+from supabase_reader import iter_pages, select_columns
+from sync_metrics import METRICS
+from sync_profile import profiled
 
 # -----------------------------
 # CONFIG
@@ -15,9 +21,13 @@ ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Connexions Odoo
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common", allow_none=True)
-uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object", allow_none=True)
+uid, models = connect(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
+
+def call(model, method, args, kw=None):
+    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
+
+# Catégorie et compte de revenus : ids conservés sur disque (REFCACHE_FILE, REFCACHE_TTL)
+REF = RefCache(ODOO_URL, ODOO_DB, call)
 
 ESIM_CATEGORY_ID = None
 
@@ -26,109 +36,149 @@ ESIM_CATEGORY_ID = None
 # -----------------------------
 
 def get_or_create_esim_category():
-    """Récupère ou crée la catégorie 'Forfaits eSIM'."""
+    """Récupère ou crée la catégorie 'Forfaits eSIM' (cache de référence REF)."""
     global ESIM_CATEGORY_ID
     if ESIM_CATEGORY_ID:
         return ESIM_CATEGORY_ID
 
-    ids = models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        "product.category", "search",
-        [[("name", "=", "Forfaits eSIM")]],
-        {"limit": 1}
-    )
-    if ids:
-        ESIM_CATEGORY_ID = ids[0]
-    else:
-        ESIM_CATEGORY_ID = models.execute_kw(
+    def lookup():
+        ids = models.execute_kw(
+            ODOO_DB, uid, ODOO_PASSWORD,
+            "product.category", "search",
+            [[("name", "=", "Forfaits eSIM")]],
+            {"limit": 1}
+        )
+        if ids:
+            return ids[0]
+        categ_id = models.execute_kw(
             ODOO_DB, uid, ODOO_PASSWORD,
             "product.category", "create",
             [{"name": "Forfaits eSIM"}]
         )
         print("🆕 Catégorie 'Forfaits eSIM' créée.")
+        return categ_id
+
+    ESIM_CATEGORY_ID = REF.resolve("product.category:Forfaits eSIM", lookup)
     return ESIM_CATEGORY_ID
 
 def get_esim_income_account():
-    """Récupère le compte comptable 706100."""
-    try:
-        account = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "account.account", "search_read",
-            [[["code", "=", "706100"]]],
-            {"fields": ["id"], "limit": 1}
-        )
-        if account:
-            return account[0]["id"]
-        print("⚠ Compte 706100 introuvable.")
-        return None
-    except Exception as e:
-        print("❌ Erreur récupération compte 706100 :", e)
-        return None
+    """Récupère le compte comptable 706100 (cache de référence REF)."""
+    def lookup():
+        try:
+            account = models.execute_kw(
+                ODOO_DB, uid, ODOO_PASSWORD,
+                "account.account", "search_read",
+                [[["code", "=", "706100"]]],
+                {"fields": ["id"], "limit": 1}
+            )
+            if account:
+                return account[0]["id"]
+            print("⚠ Compte 706100 introuvable.")
+            return None
+        except Exception as e:
+            print("❌ Erreur récupération compte 706100 :", e)
+            return None
+
+    return REF.resolve("account.account:706100", lookup)
 
 # -----------------------------
 # SYNCHRONISATION DES PRODUITS
 # -----------------------------
+PACKAGE_COLUMNS = ("id", "name", "region", "price")
+# Champs comparés pour décider d'un write (voir product_vals)
+PRODUCT_FIELDS = (
+    "name", "list_price", "type", "sale_ok", "purchase_ok", "categ_id", "property_account_income_id",
+)
+
+def product_vals(pkg, categ_id, esim_account_id):
+    """Valeurs product.product d'une offre Airalo."""
+    raw_name = pkg["name"]
+    region = pkg["region"]
+    price = pkg.get("price", 0)
+
+    # NETTOYAGE : On retire les mentions de validité (ex: "30 jours", "7 days")
+    # On garde le nom de base et la région
+    clean_name = raw_name
+    if region:
+        clean_name = f"{clean_name} [{region}]"
+
+    return {
+        "name": clean_name,
+        "default_code": pkg["id"],
+        "list_price": float(price),
+        "type": "service",
+        "sale_ok": True,
+        "purchase_ok": False,
+        "categ_id": categ_id,
+        "property_account_income_id": esim_account_id,
+    }
+
 def sync_products():
     print("🚀 Synchronisation des produits Airalo (Optimisée)...")
 
-    # Récupérer les offres Airalo depuis Supabase
-    result = supabase.table("airalo_packages").select("*").execute()
-    packages = result.data
-    print(f"📦 {len(packages)} produits trouvés dans Supabase.")
-
-    esim_account_id = get_esim_income_account()
-    categ_id = get_or_create_esim_category()
+    with METRICS.phase("references"):
+        esim_account_id = get_esim_income_account()
+        categ_id = get_or_create_esim_category()
+
+    # Empreintes des produits existants : un search_read paginé, puis seuls
+    # les produits réellement modifiés sont réécrits
+    catalog = CatalogSync(call, PRODUCT_FIELDS)
+    with METRICS.phase("catalog.load"):
+        catalog.load()
+
+    # Offres Airalo lues page par page depuis Supabase
+    count = 0
+    for rows in iter_pages(select_columns(supabase, "airalo_packages", PACKAGE_COLUMNS)):
+        count += len(rows)
+        vals_by_code = {pkg["id"]: product_vals(pkg, categ_id, esim_account_id) for pkg in rows}
+        with METRICS.phase("catalog.sync"):
+            created, updated = catalog.sync(vals_by_code)
+        for package_id in updated:
+            print(f"🔁 Mis à jour : {package_id}")
+        for package_id in created:
+            print(f"✨ Créé : {vals_by_code[package_id]['name']} ({package_id})")
 
-    for pkg in packages:
-        package_id = pkg["id"]
-        raw_name = pkg["name"]
-        region = pkg["region"]
-        price = pkg.get("price", 0)
+    METRICS.count("rows_skipped", catalog.unchanged, table="airalo_packages", reason="unchanged")
+    print(f"📦 {count} produits lus dans Supabase.")
+    print(f"📊 Produits : {catalog.summary()}")
+    print("✅ Synchronisation des produits terminée.")
 
-        # NETTOYAGE : On retire les mentions de validité (ex: "30 jours", "7 days")
-        # On garde le nom de base et la région
-        clean_name = raw_name
-        if region:
-            clean_name = f"{clean_name} [{region}]"
+def sync_products_bulk():
+    """Import complet via product.product.load (ids externes fenuasim.airalo_<id>)."""
+    print("🚀 Import complet du catalogue Airalo (load)...")
 
-        # Recherche du produit existant
-        existing = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            "product.product", "search",
-            [[["default_code", "=", package_id]]],
-            {"limit": 1},
-        )
+    with METRICS.phase("references"):
+        esim_account_id = get_esim_income_account()
+        categ_id = get_or_create_esim_category()
+    loader = CatalogLoader(call, ("default_code", *PRODUCT_FIELDS))
 
-        vals = {
-            "name": clean_name,
-            "default_code": package_id,
-            "list_price": float(price),
-            "type": "service",
-            "sale_ok": True,
-            "purchase_ok": False,
-            "categ_id": categ_id,
-            "property_account_income_id": esim_account_id,
-        }
-
-        if existing:
-            models.execute_kw(
-                ODOO_DB, uid, ODOO_PASSWORD,
-                "product.product", "write",
-                [[existing[0]], vals],
-            )
-            print(f"🔁 Mis à jour : {package_id}")
-        else:
-            product_id = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASSWORD,
-                "product.product", "create",
-                [vals],
-            )
-            print(f"✨ Créé : {clean_name} ({package_id})")
+    count = imported = 0
+    for rows in iter_pages(select_columns(supabase, "airalo_packages", PACKAGE_COLUMNS)):
+        count += len(rows)
+        with METRICS.phase("catalog.load"):
+            loaded, failed = loader.load({pkg["id"]: product_vals(pkg, categ_id, esim_account_id) for pkg in rows})
+        imported += len(loaded)
+        METRICS.count("rows_skipped", len(failed), table="airalo_packages", reason="import_failed")
+        for package_id, message in failed:
+            print(f"❌ Import impossible : {package_id} — {message}")
 
-    print("✅ Synchronisation des produits terminée.")
+    print(f"📦 {count} produits lus dans Supabase, {imported} importés.")
+    print("✅ Import du catalogue terminé.")
 
 # -----------------------------
 # MAIN
 # -----------------------------
 if __name__ == "__main__":
-    sync_products()
+    parser = argparse.ArgumentParser(description="Sync catalogue Airalo (Supabase -> Odoo)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="réimporte tout le catalogue via product.product.load (ids externes)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile le run (cProfile + piles par phase dans SYNC_PROFILE_DIR, voir sync_profile.py)")
+    args = parser.parse_args()
+
+    # Métriques du run : SYNC_METRICS_DIR/main_products.prom et .json (sync_metrics)
+    with METRICS.run("main_products"), profiled("main_products", args.profile):
+        if args.bulk:
+            sync_products_bulk()
+        else:
+            sync_products()
@@ -0,0 +1,198 @@
+"""
+odoo_async.py — FENUASIM
+Client Odoo asynchrone (JSON-RPC /jsonrpc) pour le moteur asyncio de main_fast.py.
+
+Un seul httpx.AsyncClient à connexions keep-alive, partagé par toutes les
+coroutines ; le nombre d'appels simultanés est borné par odoo_retry.AdaptiveLimits
+(plafond ODOO_ASYNC_CONCURRENCY). Les erreurs sont relevées comme avec le
+client XML-RPC (xmlrpc.client.Fault, ProtocolError, erreurs réseau), et
+rejouées selon la même odoo_retry.RetryPolicy.
+
+Usage :
+  async with AsyncOdoo(ODOO_URL, ODOO_DB, uid, ODOO_PASSWORD) as odoo:
+      ids = await odoo.call("sale.order", "search", [[("state", "=", "draft")]])
+
+Les helpers en bas de module remplissent les index de odoo_index.py
+(mêmes structures que la version synchrone) via le client asynchrone.
+"""
+
+import asyncio
+import itertools
+import os
+import time
+import xmlrpc.client
+
+import httpx
+
+from odoo_budget import RPC_BUDGET, caller_name
+from odoo_index import PAGE_SIZE, chunked, normalize_email
+from odoo_retry import AdaptiveLimits, RetryPolicy, record_count
+from odoo_transport import TIMEOUT
+from sync_metrics import METRICS
+
+CONCURRENCY = int(os.getenv("ODOO_ASYNC_CONCURRENCY", "16"))
+
+
+class AsyncOdoo:
+    def __init__(self, url, db, uid, password, concurrency=CONCURRENCY, timeout=TIMEOUT):
+        self.db = db
+        self.uid = uid
+        self.password = password
+        self.limits = AdaptiveLimits(concurrency)
+        self.policy = RetryPolicy(self.limits)
+        self.slots = asyncio.Condition()
+        self.in_flight = 0
+        self.ids = itertools.count(1)
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def call(self, model, method, args, kw=None):
+        # Compté à la création de la coroutine : une fois dans asyncio.gather,
+        # la pile ne remonte plus jusqu'à la fonction de synchro
+        RPC_BUDGET.record(model, method, caller_name(), METRICS.current_phase())
+        return self._call(model, method, args, kw)
+
+    async def _call(self, model, method, args, kw=None):
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "call",
+            "id": next(self.ids),
+            "params": {
+                "service": "object",
+                "method": "execute_kw",
+                "args": [self.db, self.uid, self.password, model, method, args, kw or {}],
+            },
+        }
+        records = record_count(method, args)
+        attempt = 0
+        while True:
+            pause = self.policy.pause()
+            if pause:
+                await asyncio.sleep(pause)
+            async with self.slots:
+                await self.slots.wait_for(lambda: self.in_flight < self.limits.concurrency)
+                self.in_flight += 1
+            start = time.monotonic()
+            try:
+                result = await self._post(payload)
+            except Exception as e:
+                await self._release()
+                delay = self.policy.failed(e, model, method, attempt, time.monotonic() - start, records)
+                if delay is None:
+                    raise
+                attempt += 1
+                RPC_BUDGET.retried()
+                await asyncio.sleep(delay)
+                continue
+            await self._release()
+            latency = time.monotonic() - start
+            self.policy.succeeded(latency, records)
+            METRICS.observe_rpc(model, method, args, latency)
+            return result
+
+    async def _release(self):
+        async with self.slots:
+            self.in_flight -= 1
+            self.slots.notify_all()
+
+    async def _post(self, payload):
+        # Erreurs httpx traduites dans les types que odoo_retry.classify connaît
+        try:
+            response = await self.client.post("/jsonrpc", json=payload)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            raise ConnectionRefusedError(f"Odoo injoignable : {e}") from e
+        except httpx.TimeoutException as e:
+            raise TimeoutError(f"Délai Odoo dépassé : {e}") from e
+        except httpx.TransportError as e:
+            raise ConnectionResetError(f"Connexion Odoo interrompue : {e}") from e
+        if response.status_code != 200:
+            raise xmlrpc.client.ProtocolError(
+                f"{self.client.base_url}jsonrpc", response.status_code,
+                response.reason_phrase, dict(response.headers),
+            )
+        data = response.json()
+        error = data.get("error")
+        if error:
+            details = error.get("data") or {}
+            message = details.get("message") or error.get("message") or str(error)
+            raise xmlrpc.client.Fault(error.get("code", 1), f"{details.get('name', 'Odoo')}: {message}")
+        return data.get("result")
+
+
+# ─── HELPERS D'INDEX (équivalents async de odoo_index) ───────────────────────
+async def search_read_paged(odoo, model, domain, fields, page_size=PAGE_SIZE):
+    records, last_id = [], 0
+    fields = list(dict.fromkeys(["id", *fields]))
+    while True:
+        batch = await odoo.call(
+            model, "search_read",
+            [list(domain) + [("id", ">", last_id)]],
+            {"fields": fields, "limit": page_size, "order": "id asc"}
+        )
+        records.extend(batch)
+        if len(batch) < page_size:
+            return records
+        last_id = batch[-1]["id"]
+
+
+async def prefetch_refs(odoo, index, refs):
+    """OrderRefIndex.prefetch, les paquets `in` partant en parallèle."""
+    wanted = sorted({r for r in refs if r} - index.refs)
+    results = await asyncio.gather(*(
+        odoo.call("sale.order", "search_read", [[("client_order_ref", "in", chunk)]], {"fields": ["client_order_ref"]})
+        for chunk in chunked(wanted, index.page_size)
+    ))
+    for rows in results:
+        index.refs.update(r["client_order_ref"] for r in rows)
+    return index
+
+
+async def load_partners(odoo, index):
+    index.by_email = {}
+    for rec in await search_read_paged(odoo, "res.partner", [("email", "!=", False)], ["email"], index.page_size):
+        index.by_email.setdefault(normalize_email(rec["email"]), rec["id"])
+    return index
+
+
+async def load_products(odoo, index):
+    index.by_code = {}
+    for rec in await search_read_paged(
+        odoo, "product.product", [("default_code", "!=", False)], index.FIELDS, index.page_size
+    ):
+        index.by_code.setdefault(rec["default_code"], {
+            "id": rec["id"],
+            "name": rec["name"],
+            "list_price": rec["list_price"],
+        })
+    return index
+
+
+async def create_products(odoo, index, vals_by_code):
+    """ProductIndex.create_many : crée les codes absents, retourne les codes créés."""
+    missing = [code for code in vals_by_code if index.get(code) is None]
+    chunks = list(chunked(missing, index.page_size))
+    results = await asyncio.gather(*(
+        odoo.call("product.product", "create", [[vals_by_code[code] for code in chunk]])
+        for chunk in chunks
+    ))
+    for chunk, ids in zip(chunks, results):
+        for code, product_id in zip(chunk, ids):
+            vals = vals_by_code[code]
+            index.add(code, product_id, vals.get("name"), vals.get("list_price", 0.0))
+    return missing
+
+
+async def get_or_create_by_name(odoo, model, name):
+    ids = await odoo.call(model, "search", [[("name", "=", name)]], {"limit": 1})
+    if ids:
+        return ids[0]
+    return await odoo.call(model, "create", [{"name": name}])
@@ -0,0 +1,131 @@
+"""
+odoo_batch.py — FENUASIM
+Création multi-enregistrements : `create` accepte une liste de vals et renvoie
+les ids dans le même ordre, on peut donc créer N commandes en un seul appel.
+
+Usage :
+  batch = CreateBatch(call, "sale.order")
+  batch.add(row, vals)                   # clé libre : ligne Supabase, ref, tuple…
+  for row, order_id in batch.flush():    # un create par paquet de ODOO_BATCH_SIZE
+      ...
+
+Taille des paquets : variable d'environnement ODOO_BATCH_SIZE (défaut 100).
+Avec `pool=` (odoo_pool.OdooPool), les paquets partent en parallèle ; les
+(clé, id) sont toujours restitués dans l'ordre d'ajout. La taille effective
+suit alors pool.limits (réduite quand les create deviennent lents).
+
+Odoo annule tout le create au premier payload refusé (champ invalide,
+contrainte…) : le paquet est alors coupé en deux, récursivement, comme
+billing._call_isolating, pour créer les autres lignes. Les payloads refusés
+sont signalés, comptés (create_failed) et gardés dans batch.failed ; flush()
+ne renvoie que les (clé, id) créés. Les pannes réseau / Odoo qui persistent
+après odoo_retry ne sont pas découpées : l'exception remonte.
+
+create_isolating / acreate_isolating font ce découpage pour un paquet
+(clients synchrones, et client asynchrone odoo_async du moteur asyncio).
+"""
+
+import os
+
+from odoo_retry import classify
+from sync_metrics import METRICS
+
+BATCH_SIZE = int(os.getenv("ODOO_BATCH_SIZE", "100"))
+
+
+def _describe(key):
+    """Clé lisible dans les logs : tuple -> premier élément, ligne Supabase -> son id."""
+    if isinstance(key, tuple) and key:
+        key = key[0]
+    if isinstance(key, dict):
+        return key.get("id", "?")
+    return key
+
+
+def _reason(error):
+    """Dernière ligne du message Odoo (la trace complète noierait les logs)."""
+    lines = str(getattr(error, "faultString", error)).strip().splitlines()
+    return lines[-1] if lines else repr(error)
+
+
+def _split(chunk, error, model, failed):
+    """Moitiés à recréer, ou [] si `chunk` est le payload refusé (signalé dans `failed`)."""
+    if classify(error)[0] is not None:
+        raise error            # panne persistante : le create a peut-être abouti, ne pas le rejouer
+    if len(chunk) > 1:
+        middle = len(chunk) // 2
+        return [chunk[:middle], chunk[middle:]]
+    key = chunk[0][0]
+    failed.append((key, error))
+    METRICS.count("create_failed", model=model)
+    print(f"❌ Création {model} refusée ({_describe(key)}) : {_reason(error)}", flush=True)
+    return []
+
+
+def create_isolating(call, model, chunk, failed):
+    """[(clé, id)] des payloads créés ; coupe le paquet en deux si Odoo en refuse un."""
+    try:
+        ids = call(model, "create", [[vals for _, vals in chunk]])
+    except Exception as e:
+        return [pair for half in _split(chunk, e, model, failed)
+                for pair in create_isolating(call, model, half, failed)]
+    return list(zip((key for key, _ in chunk), ids))
+
+
+async def acreate_isolating(call, model, chunk, failed):
+    """create_isolating pour un `call` asynchrone (odoo_async.AsyncOdoo.call)."""
+    try:
+        ids = await call(model, "create", [[vals for _, vals in chunk]])
+    except Exception as e:
+        created = []
+        for half in _split(chunk, e, model, failed):
+            created += await acreate_isolating(call, model, half, failed)
+        return created
+    return list(zip((key for key, _ in chunk), ids))
+
+
+class CreateBatch:
+    """Accumule des payloads (clé, vals) puis les crée par paquets."""
+
+    def __init__(self, call, model, batch_size=BATCH_SIZE, pool=None):
+        self.call = call
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.pool = pool
+        self.pending = []
+        self.failed = []           # [(clé, erreur)] des payloads refusés par Odoo
+
+    def add(self, key, vals):
+        self.pending.append((key, vals))
+
+    def flush(self):
+        """
+        Envoie les payloads en attente, un `create` par paquet.
+        Génère (clé, id) au fil des paquets pour que les logs restent progressifs.
+        """
+        if self.pool is not None:
+            chunks = []
+            while self.pending:
+                size = self.chunk_size()
+                chunks.append(self.pending[:size])
+                del self.pending[:size]
+            for created in self.pool.map(self._create, chunks):
+                yield from created
+            return
+
+        while self.pending:
+            size = self.chunk_size()
+            chunk = self.pending[:size]
+            del self.pending[:size]
+            yield from self._create(chunk)
+
+    def chunk_size(self):
+        if self.pool is not None:
+            return self.pool.limits.batch_size(self.batch_size)
+        return self.batch_size
+
+    def _create(self, chunk):
+        return create_isolating(self.call, self.model, chunk, self.failed)
+
+    def __len__(self):
+        return len(self.pending)
@@ -0,0 +1,126 @@
+"""
+odoo_budget.py — FENUASIM
+Comptage des appels Odoo par modèle, méthode, fonction de synchro appelante
+et phase METRICS en cours (orders.dedupe, insurances.create…).
+
+Chaque execute_kw qui passe par odoo_retry.ResilientModels (connect(),
+OdooPool) ou par odoo_async.AsyncOdoo est compté une fois dans RPC_BUDGET,
+reprises comprises à part (`retries`). La fonction appelante est la première
+fonction des scripts du dépôt sur la pile (ensure_partner, sync_stripe_page,
+confirm_order…), en sautant la plomberie Odoo (odoo_retry, odoo_index,
+odoo_batch…) et les enveloppes `call` : un nouveau lookup par ligne ajouté
+dans une synchro apparaît sous le nom de cette synchro.
+
+Avec ODOO_RPC_REPORT=<fichier>, le détail est écrit en JSON à la fin du
+process et résumé dans les logs ; bench.py --check compare ces chiffres,
+regroupés par pipeline (préfixe de la phase), aux budgets d'appels par ligne.
+
+Usage :
+  from odoo_budget import RPC_BUDGET
+  RPC_BUDGET.total(), RPC_BUDGET.by_caller(), RPC_BUDGET.by_phase(), RPC_BUDGET.snapshot()
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+from collections import Counter
+
+REPORT_FILE = os.getenv("ODOO_RPC_REPORT")
+REPO = os.path.dirname(os.path.abspath(__file__))
+# Modules qui relaient l'appel sans être une étape de synchro
+# (les helpers de odoo_async tournent souvent dans leur propre tâche asyncio,
+# sans la fonction de synchro sur la pile : ils sont comptés sous leur nom)
+PLUMBING = {
+    "odoo_budget", "odoo_retry", "odoo_transport", "odoo_pool",
+    "odoo_index", "odoo_batch", "odoo_refcache", "product_sync",
+}
+# Enveloppes et fonctions locales : l'appel revient à la fonction englobante
+# (<module> : asyncio.run au niveau du script, sous une tâche sans appelant)
+WRAPPERS = {
+    "call", "_call_isolating", "lookup", "search_read_paged",
+    "<genexpr>", "<listcomp>", "<dictcomp>", "<setcomp>", "<lambda>", "<module>",
+}
+
+_origin = contextvars.ContextVar("rpc_origin", default=None)
+
+
+def caller_name(depth=2):
+    """
+    Nom de la première fonction de synchro sur la pile de l'appelant. Dans un
+    thread de OdooPool.map ou une tâche asyncio, la pile s'arrête au thread /
+    à la boucle : on reprend alors la fonction qui a lancé le map ou les
+    tâches (set_origin).
+    """
+    frame = sys._getframe(depth)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "")
+        if module not in PLUMBING and code.co_filename.startswith(REPO):
+            if code.co_name not in WRAPPERS:
+                return code.co_name
+            fallback = fallback or code.co_name
+        frame = frame.f_back
+    return _origin.get() or fallback or "?"
+
+
+def set_origin(name):
+    """
+    Fonction appelante à retenir pour les appels du contexte courant : le
+    thread, ou les tâches asyncio créées ensuite (None pour effacer).
+    """
+    _origin.set(name)
+
+
+class RpcBudget:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()     # (model, method, caller, phase) -> appels
+        self.retries = 0
+
+    def record(self, model, method, caller, phase=None):
+        with self.lock:
+            self.calls[(model, method, caller, phase)] += 1
+
+    def retried(self):
+        with self.lock:
+            self.retries += 1
+
+    def total(self):
+        return sum(self.calls.values())
+
+    def by_caller(self):
+        counts = Counter()
+        for (_, _, caller, _), n in self.calls.items():
+            counts[caller] += n
+        return counts
+
+    def by_phase(self):
+        counts = Counter()
+        for (_, _, _, phase), n in self.calls.items():
+            counts[phase] += n
+        return counts
+
+    def snapshot(self):
+        with self.lock:
+            rows = [
+                {"model": model, "method": method, "caller": caller, "phase": phase, "calls": n}
+                for (model, method, caller, phase), n in self.calls.most_common()
+            ]
+            return {"total": sum(self.calls.values()), "retries": self.retries, "calls": rows}
+
+    def report(self, path):
+        data = self.snapshot()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        top = ", ".join(f"{caller} {n}" for caller, n in self.by_caller().most_common(5))
+        print(f"📊 Appels Odoo : {data['total']} ({data['retries']} reprises) — {top or 'aucun'}", flush=True)
+
+
+RPC_BUDGET = RpcBudget()
+
+if REPORT_FILE:
+    atexit.register(RPC_BUDGET.report, REPORT_FILE)
@@ -0,0 +1,312 @@
+"""
+odoo_index.py — FENUASIM
+Index en mémoire des enregistrements Odoo déjà présents, chargés en quelques
+search_read paginés au début du run au lieu d'une recherche par ligne Supabase.
+
+Usage :
+  from odoo_index import OrderRefIndex, PartnerIndex
+  existing = OrderRefIndex(call).prefetch(row["stripe_session_id"] for row in rows)
+  if ref in existing: ...
+
+  partners = PartnerIndex(call)      # chargé au premier accès
+  pid = partners.get(email)          # None si inconnu -> créer puis partners.add()
+
+  products = ProductIndex(call)
+  product = products.get(code)       # {"id", "name", "list_price"} ou None
+  products.create_many({code: vals}) # un seul create pour tous les manquants
+
+  opportunities = OpportunityIndex(call)
+  if email in opportunities: ...     # opportunité crm.lead déjà ouverte pour cet email
+
+  invoices = InvoiceOriginIndex(call)
+  invoice_id = invoices.get("S00042")  # facture existante pour la commande, ou None
+  invoices.clear().prefetch(names)     # mémoire bornée : seules `names` sont chargées
+
+`call` a la même signature que billing.call : call(model, method, args, kw=None).
+"""
+
+import os
+import threading
+
+PAGE_SIZE = int(os.getenv("ODOO_PAGE_SIZE", "1000"))
+
+
+def search_read_paged(call, model, domain, fields, page_size=PAGE_SIZE):
+    """
+    Parcourt un search_read page par page (pagination par id croissant).
+    Plus stable qu'un offset si des enregistrements sont créés pendant la lecture.
+    """
+    last_id = 0
+    fields = list(dict.fromkeys(["id", *fields]))
+    while True:
+        batch = call(
+            model, "search_read",
+            [list(domain) + [("id", ">", last_id)]],
+            {"fields": fields, "limit": page_size, "order": "id asc"}
+        )
+        yield from batch
+        if len(batch) < page_size:
+            return
+        last_id = batch[-1]["id"]
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def chunked(values, size):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+# ─── ANTI-DOUBLON sale.order ──────────────────────────────────────────────────
+class OrderRefIndex:
+    """
+    Ensemble des client_order_ref déjà présents sur sale.order.
+    Seules les références candidates du run sont interrogées (domaine `in` par
+    paquets), le coût ne dépend donc pas de l'historique des commandes Odoo.
+    """
+
+    def __init__(self, call, page_size=PAGE_SIZE):
+        self.call = call
+        self.page_size = page_size
+        self.refs = set()
+
+    def prefetch(self, refs):
+        wanted = sorted({r for r in refs if r} - self.refs)
+        for chunk in chunked(wanted, self.page_size):
+            rows = self.call(
+                "sale.order", "search_read",
+                [[("client_order_ref", "in", chunk)]],
+                {"fields": ["client_order_ref"]}
+            )
+            self.refs.update(r["client_order_ref"] for r in rows)
+        return self
+
+    def add(self, ref):
+        self.refs.add(ref)
+
+    def __contains__(self, ref):
+        return ref in self.refs
+
+    def __len__(self):
+        return len(self.refs)
+
+
+# ─── CLIENTS res.partner ──────────────────────────────────────────────────────
+class PartnerIndex:
+    """
+    Table email (minuscules) -> res.partner.id, chargée une fois par run.
+    En cas de doublons d'email dans Odoo, le partenaire le plus ancien gagne.
+    """
+
+    def __init__(self, call, page_size=PAGE_SIZE):
+        self.call = call
+        self.page_size = page_size
+        self.by_email = None
+
+    def load(self):
+        self.by_email = {}
+        for rec in search_read_paged(
+            self.call, "res.partner", [("email", "!=", False)], ["email"], self.page_size
+        ):
+            self.by_email.setdefault(normalize_email(rec["email"]), rec["id"])
+        return self
+
+    def get(self, email):
+        if self.by_email is None:
+            self.load()
+        return self.by_email.get(normalize_email(email))
+
+    def add(self, email, partner_id):
+        if self.by_email is None:
+            self.load()
+        self.by_email[normalize_email(email)] = partner_id
+
+    def __contains__(self, email):
+        return self.get(email) is not None
+
+    def __len__(self):
+        return len(self.by_email or {})
+
+
+# ─── OPPORTUNITÉS crm.lead ────────────────────────────────────────────────────
+class OpportunityIndex:
+    """
+    Emails (minuscules) des opportunités crm.lead actives, chargés une fois par
+    run : remplace la recherche email_from =ilike faite pour chaque lead.
+    """
+
+    DOMAIN = [("type", "=", "opportunity"), ("email_from", "!=", False)]
+
+    def __init__(self, call, page_size=PAGE_SIZE):
+        self.call = call
+        self.page_size = page_size
+        self.emails = None
+
+    def load(self):
+        self.emails = {
+            normalize_email(rec["email_from"])
+            for rec in search_read_paged(self.call, "crm.lead", self.DOMAIN, ["email_from"], self.page_size)
+        }
+        return self
+
+    def add(self, email):
+        if self.emails is None:
+            self.load()
+        self.emails.add(normalize_email(email))
+
+    def __contains__(self, email):
+        if self.emails is None:
+            self.load()
+        return normalize_email(email) in self.emails
+
+    def __len__(self):
+        return len(self.emails or ())
+
+
+# ─── PRODUITS product.product ─────────────────────────────────────────────────
+class ProductIndex:
+    """
+    Catalogue default_code -> {"id", "name", "list_price"}, chargé une fois par
+    run et partagé par les flux Airalo, Stripe et assurance.
+    """
+
+    FIELDS = ["default_code", "name", "list_price"]
+
+    def __init__(self, call, page_size=PAGE_SIZE):
+        self.call = call
+        self.page_size = page_size
+        self.by_code = None
+
+    def load(self):
+        self.by_code = {}
+        for rec in search_read_paged(
+            self.call, "product.product", [("default_code", "!=", False)], self.FIELDS, self.page_size
+        ):
+            self.by_code.setdefault(rec["default_code"], {
+                "id": rec["id"],
+                "name": rec["name"],
+                "list_price": rec["list_price"],
+            })
+        return self
+
+    def get(self, code):
+        if self.by_code is None:
+            self.load()
+        return self.by_code.get(code)
+
+    def add(self, code, product_id, name, list_price=0.0):
+        if self.by_code is None:
+            self.load()
+        self.by_code[code] = {"id": product_id, "name": name, "list_price": list_price}
+
+    def create_many(self, vals_by_code):
+        """
+        Crée les produits absents du catalogue, par paquets de `page_size`
+        (create multi-enregistrements). Retourne les codes réellement créés.
+        """
+        missing = [code for code in vals_by_code if self.get(code) is None]
+        for chunk in chunked(missing, self.page_size):
+            ids = self.call("product.product", "create", [[vals_by_code[code] for code in chunk]])
+            for code, product_id in zip(chunk, ids):
+                vals = vals_by_code[code]
+                self.add(code, product_id, vals.get("name"), vals.get("list_price", 0.0))
+        return missing
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        return len(self.by_code or {})
+
+
+# ─── FACTURES account.move (anti-doublon facturation) ─────────────────────────
+class InvoiceOriginIndex:
+    """
+    Table nom de commande (S00042) -> facture client non annulée, chargée une
+    fois par run. Une facture regroupant plusieurs commandes porte une origine
+    « S00042, S00043 » : load() indexe chaque nom séparément, en clé exacte.
+
+    Pour un historique trop gros à garder en mémoire : clear() puis
+    prefetch(noms) par page ; l'index ne connaît alors que les noms préchargés.
+    prefetch ne passe pas par l'origine texte mais par sale.order.invoice_ids
+    (factures liées aux lignes de la commande) : une facture multi-commandes
+    est retrouvée pour chacune de ses commandes, en deux requêtes par paquet.
+    prefetch et add peuvent être appelés depuis plusieurs threads (paquets de
+    billing.auto_invoice_orders sur le pool) : les mises à jour sont verrouillées.
+    """
+
+    DOMAIN = [("move_type", "=", "out_invoice"), ("state", "!=", "cancel"), ("invoice_origin", "!=", False)]
+
+    def __init__(self, call, page_size=PAGE_SIZE):
+        self.call = call
+        self.page_size = page_size
+        self.by_origin = None
+        self.checked = set()       # noms déjà interrogés par prefetch
+        self.complete = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.by_origin = {}
+        for rec in search_read_paged(self.call, "account.move", self.DOMAIN, ["invoice_origin"], self.page_size):
+            self._index(rec)
+        self.complete = True
+        return self
+
+    def prefetch(self, names):
+        """Charge les factures des seules commandes `names` (invoice_ids, par paquets)."""
+        with self.lock:
+            if self.by_origin is None:
+                self.by_origin = {}
+            if self.complete:
+                return self
+            wanted = sorted({n for n in names if n} - self.checked)
+        found = {}
+        for chunk in chunked(wanted, self.page_size):
+            orders = self.call(
+                "sale.order", "search_read", [[("name", "in", chunk)]], {"fields": ["name", "invoice_ids"]}
+            )
+            linked = sorted({invoice_id for order in orders for invoice_id in order["invoice_ids"]})
+            if not linked:
+                continue
+            # Seules les factures client non annulées comptent (même filtre que load)
+            valid = set(self.call("account.move", "search", [self.DOMAIN + [("id", "in", linked)]]))
+            for order in orders:
+                invoice_id = next((i for i in sorted(order["invoice_ids"]) if i in valid), None)
+                if invoice_id:
+                    found.setdefault(order["name"], invoice_id)
+        with self.lock:
+            for name, invoice_id in found.items():
+                self.by_origin.setdefault(name, invoice_id)
+            self.checked.update(wanted)
+        return self
+
+    def clear(self):
+        with self.lock:
+            self.by_origin = {}
+            self.checked = set()
+            self.complete = False
+        return self
+
+    def _index(self, rec):
+        for name in rec["invoice_origin"].split(","):
+            self.by_origin.setdefault(name.strip(), rec["id"])
+
+    def get(self, order_name):
+        if self.by_origin is None:
+            self.load()
+        return self.by_origin.get(order_name)
+
+    def add(self, order_name, invoice_id):
+        if self.by_origin is None:
+            self.load()
+        with self.lock:
+            self.by_origin.setdefault(order_name, invoice_id)
+
+    def __contains__(self, order_name):
+        return self.get(order_name) is not None
+
+    def __len__(self):
+        return len(self.by_origin or {})
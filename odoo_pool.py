@@ -0,0 +1,128 @@
+"""
+odoo_pool.py — FENUASIM
+Exécution concurrente des appels XML-RPC Odoo.
+
+Un ServerProxy n'est pas thread-safe (une seule session HTTP) : chaque thread
+reçoit donc le sien (odoo_transport.server_proxy, connexions keep-alive).
+La latence réseau vers Odoo Online domine le temps de synchro, quelques
+appels en parallèle suffisent à diviser la durée d'un run.
+
+Usage :
+  POOL = OdooPool(ODOO_URL)
+  models = POOL.models                  # remplace le ServerProxy module-level
+  results = POOL.map(traiter, items)    # parallèle, résultats dans l'ordre des items
+
+Les print() des tâches lancées par map() sont mis en tampon par tâche puis
+restitués dans l'ordre des items : les logs restent identiques à une
+exécution séquentielle.
+
+Concurrence : ODOO_CONCURRENCY (défaut 4, prudent vis-à-vis des limites
+d'Odoo Online). ODOO_CONCURRENCY=1 revient au comportement séquentiel.
+C'est un plafond : `models` passe par odoo_retry (reprises, disjoncteur) et
+`limits` réduit la concurrence effective quand Odoo sature.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo_budget import caller_name, set_origin
+from odoo_retry import AdaptiveLimits, ResilientModels, RetryPolicy
+from odoo_transport import server_proxy
+from sync_metrics import METRICS
+
+CONCURRENCY = int(os.getenv("ODOO_CONCURRENCY", "4"))
+
+
+class _ThreadLocalModels:
+    """Se comporte comme un ServerProxy /object, mais un par thread."""
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool.proxy(), name)
+
+
+class _BufferedStdout:
+    """sys.stdout qui écrit dans un tampon propre au thread quand il y en a un."""
+
+    def __init__(self, target):
+        self.target = target
+        self.local = threading.local()
+
+    def write(self, text):
+        buf = getattr(self.local, "buf", None)
+        if buf is None:
+            return self.target.write(text)
+        buf.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(self.local, "buf", None) is None:
+            self.target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+class OdooPool:
+    def __init__(self, url, workers=CONCURRENCY):
+        self.url = url
+        self.workers = max(1, workers)
+        self.local = threading.local()
+        self.limits = AdaptiveLimits(self.workers)
+        self.models = ResilientModels(_ThreadLocalModels(self), RetryPolicy(self.limits))
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="odoo")
+
+    def proxy(self):
+        proxy = getattr(self.local, "models", None)
+        if proxy is None:
+            proxy = server_proxy(self.url, "object")
+            self.local.models = proxy
+        return proxy
+
+    def map(self, fn, items):
+        """
+        Applique fn à chaque item sur le pool. Retourne la liste des résultats
+        dans l'ordre des items ; la première exception (dans cet ordre) est
+        relevée après restitution des logs des items précédents.
+        """
+        items = list(items)
+        if self.workers == 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+
+        stdout = sys.stdout
+        buffered = _BufferedStdout(stdout)
+        origin = caller_name()
+        phase = METRICS.current_phase()
+
+        def run(item):
+            buffered.local.buf = []
+            set_origin(origin)
+            try:
+                with METRICS.attach(phase):
+                    return True, fn(item), buffered.local.buf
+            except Exception as e:
+                return False, e, buffered.local.buf
+            finally:
+                buffered.local.buf = None
+                set_origin(None)
+
+        sys.stdout = buffered
+        try:
+            futures = [self.executor.submit(run, item) for item in items]
+            results = []
+            for i, future in enumerate(futures):
+                ok, value, output = future.result()
+                stdout.write("".join(output))
+                stdout.flush()
+                if not ok:
+                    for pending in futures[i + 1:]:
+                        pending.cancel()
+                    raise value
+                results.append(value)
+            return results
+        finally:
+            sys.stdout = stdout
@@ -0,0 +1,132 @@
+"""
+odoo_refcache.py — FENUASIM
+Cache des données de référence Odoo : catégories produit, compte de revenus,
+étiquettes CRM, modèles d'email… Des ids qui ne changent presque jamais mais
+qu'on recherchait à chaque run, voire à chaque enregistrement.
+
+Deux niveaux :
+  - mémoire : une recherche par clé et par process au plus ;
+  - disque : fichier JSON REFCACHE_FILE (défaut .odoo_refcache.json), valable
+    REFCACHE_TTL secondes (défaut 86400 = 24 h). REFCACHE_TTL=0 le désactive.
+Les entrées sont rangées par base Odoo (url + db) : un même fichier peut
+servir à plusieurs bases sans mélange d'ids.
+
+Usage :
+  REF = RefCache(ODOO_URL, ODOO_DB, call)
+  categ_id = REF.resolve("product.category:Forfaits eSIM", lambda: chercher_ou_creer())
+  REF.invalidate("product.category:Forfaits eSIM")
+
+Les clés sont de la forme "<modèle>:<libellé>". Avec `call`, les ids lus sur
+disque sont vérifiés au premier usage : un search par modèle et par process
+(ids de tous les libellés du modèle d'un coup). Un id supprimé entre-temps
+(reset_odoo_full.py…) est oublié et recherché à nouveau.
+
+Une valeur None (ex. compte introuvable) n'est pas mise en cache : elle est
+recherchée à nouveau au prochain appel.
+"""
+
+import json
+import os
+import threading
+import time
+
+REFCACHE_FILE = os.getenv("REFCACHE_FILE", ".odoo_refcache.json")
+REFCACHE_TTL = float(os.getenv("REFCACHE_TTL", "86400"))
+
+
+class RefCache:
+    def __init__(self, url, db, call=None, path=REFCACHE_FILE, ttl=REFCACHE_TTL):
+        self.namespace = f"{(url or '').rstrip('/')}#{db}"
+        self.call = call
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.memory = {}
+        self.disk = self._read_disk() if ttl > 0 else {}
+        self.verified = set()      # modèles dont les ids disque ont été vérifiés
+
+    def _read_disk(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Cache de référence {self.path} illisible ({e}) — ignoré", flush=True)
+            return {}
+        now = time.time()
+        return {
+            key: entry for key, entry in (data.get(self.namespace) or {}).items()
+            if now - entry.get("at", 0) < self.ttl
+        }
+
+    def _write_disk(self):
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        data[self.namespace] = self.disk
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def _verify(self, model):
+        """Retire du cache disque les ids de `model` qui n'existent plus dans Odoo."""
+        self.verified.add(model)
+        keys = [key for key in self.disk if key.split(":", 1)[0] == model]
+        ids = [self.disk[key]["value"] for key in keys if isinstance(self.disk[key]["value"], int)]
+        if not ids:
+            return
+        existing = set(self.call(model, "search", [[("id", "in", ids)]], {"context": {"active_test": False}}))
+        stale = [key for key in keys if self.disk[key]["value"] not in existing]
+        for key in stale:
+            del self.disk[key]
+        if stale:
+            self._write_disk()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                return self.memory[key]
+            model = key.split(":", 1)[0]
+            if key in self.disk and self.call is not None and model not in self.verified:
+                self._verify(model)
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory[key] = entry["value"]
+                return entry["value"]
+            return None
+
+    def set(self, key, value):
+        with self.lock:
+            if value is None:
+                return
+            self.memory[key] = value
+            if self.ttl > 0:
+                self.disk[key] = {"value": value, "at": time.time()}
+                self._write_disk()
+
+    def resolve(self, key, loader):
+        """Valeur en cache, sinon loader() (appel Odoo) mise en cache."""
+        with self.lock:
+            value = self.get(key)
+            if value is None:
+                value = loader()
+                self.set(key, value)
+            return value
+
+    def invalidate(self, key=None):
+        """Oublie une clé (ou tout le cache de cette base si key=None)."""
+        with self.lock:
+            if key is None:
+                self.memory.clear()
+                self.disk.clear()
+            else:
+                self.memory.pop(key, None)
+                self.disk.pop(key, None)
+            if self.ttl > 0:
+                self._write_disk()
@@ -0,0 +1,178 @@
+"""
+odoo_reset.py — FENUASIM
+Moteur de suppression par paquets pour les scripts reset_*.py.
+
+Un search sans limite suivi d'un unlink géant dépasse le délai d'attente
+d'Odoo Online sur une grosse base, et le reset s'arrête à moitié. Ici :
+  - les ids sont lus par pages (id croissant, RESET_CHUNK par page, défaut 200) ;
+  - chaque page passe par les actions préalables de l'étape (action_cancel,
+    button_draft…) puis par un unlink, une page à la fois ;
+  - une page dont Odoo refuse l'unlink est coupée en deux, récursivement
+    (comme billing._call_isolating), pour supprimer tout le reste ; seuls les
+    enregistrements refusés restent en place et le reset continue. Une étape
+    qui en laisse n'est pas marquée terminée : le run suivant la reprend au
+    début, où il ne reste plus qu'eux ;
+  - les étapes d'un même palier partent en parallèle (OdooPool), les paliers
+    se suivent : commandes -> factures -> paiements -> produits -> contacts.
+    Une étape interrompue (recherche impossible) arrête la séquence : les
+    paliers suivants attendent la reprise ;
+  - la progression (dernier id traité, étapes terminées) est enregistrée dans
+    RESET_STATE_FILE (défaut .reset_state.json) après chaque page : un reset
+    interrompu reprend là où il s'était arrêté. Le fichier est remis à zéro
+    quand le reset va au bout ; --restart ignore une reprise en cours.
+
+Usage :
+  stages = [
+      [ResetStep("sale.order", actions=("action_cancel",))],
+      [ResetStep("account.move", [("move_type", "!=", "entry")], ("button_draft",), name="factures"),
+       ResetStep("sale.order.line")],
+  ]
+  ResetEngine(call, "full", pool=POOL).run(stages, restart=args.restart)
+"""
+
+import os
+import threading
+import time
+
+from odoo_retry import classify
+from sync_state import WatermarkStore
+
+RESET_CHUNK = int(os.getenv("RESET_CHUNK", "200"))
+RESET_STATE_FILE = os.getenv("RESET_STATE_FILE", ".reset_state.json")
+
+
+class ResetStep:
+    def __init__(self, model, domain=None, actions=(), name=None):
+        self.model = model
+        self.domain = list(domain or [])
+        self.actions = tuple(actions)
+        self.name = name or model
+
+
+class ResetEngine:
+    def __init__(self, call, plan, pool=None, chunk_size=RESET_CHUNK, state_file=RESET_STATE_FILE):
+        self.call = call
+        self.plan = plan
+        self.pool = pool
+        self.chunk_size = max(1, chunk_size)
+        self.state = WatermarkStore(state_file)
+        self.lock = threading.Lock()
+        self.deleted_now = 0       # supprimés pendant ce run (débit)
+
+    def _key(self, step):
+        return f"reset:{self.plan}:{step.name}"
+
+    def _progress(self, step):
+        return self.state.cursor(self._key(step), None) or {"last_id": 0, "deleted": 0, "failed": 0, "done": False}
+
+    def _save(self, step, progress):
+        with self.lock:
+            self.state.set_cursor(self._key(step), progress)
+            self.state.save()
+
+    def run(self, stages, restart=False):
+        steps = [step for stage in stages for step in stage]
+        if restart:
+            for step in steps:
+                self.state.set_cursor(self._key(step), None)
+            self.state.save()
+        resumed = [step.name for step in steps if self._progress(step)["last_id"] or self._progress(step)["done"]]
+        if resumed:
+            print(f"⏩ Reprise du reset '{self.plan}' ({', '.join(resumed)} déjà entamé)", flush=True)
+
+        start = time.monotonic()
+        for number, stage in enumerate(stages, 1):
+            if self.pool is not None:
+                results = self.pool.map(self.run_step, stage)
+            else:
+                results = [self.run_step(step) for step in stage]
+            if not all(results):
+                # Les paliers suivants dépendent de celui-ci (factures avant paiements…)
+                interrupted = [step.name for step, ok in zip(stage, results) if not ok]
+                print(f"⛔ Palier {number} interrompu ({', '.join(interrupted)}) : "
+                      "paliers suivants non lancés.", flush=True)
+                break
+
+        progress = [self._progress(step) for step in steps]
+        deleted = sum(p["deleted"] for p in progress)
+        failed = sum(p["failed"] for p in progress)
+        elapsed = time.monotonic() - start
+        print(
+            f"📊 Reset '{self.plan}' : {deleted} supprimés, {failed} laissés en place — "
+            f"{self.deleted_now} en {elapsed:.1f}s ({self.deleted_now / elapsed if elapsed else 0:.1f}/s)",
+            flush=True,
+        )
+        complete = all(p["done"] for p in progress)
+        if complete:
+            for step in steps:
+                self.state.set_cursor(self._key(step), None)
+            self.state.save()
+        else:
+            print(f"⏸ Reset incomplet : relancer pour reprendre ({self.state.path}).", flush=True)
+        return complete
+
+    def run_step(self, step):
+        """Supprime les enregistrements de `step` page par page ; False si interrompu."""
+        progress = self._progress(step)
+        if progress["done"]:
+            print(f"⏭ {step.name} : déjà traité ({progress['deleted']} supprimés).", flush=True)
+            return True
+
+        if not progress["last_id"]:
+            progress["failed"] = 0     # nouvelle passe : les refusés de la précédente sont retentés
+        start = time.monotonic()
+        deleted = failed = 0
+        while True:
+            try:
+                ids = self.call(
+                    step.model, "search",
+                    [step.domain + [("id", ">", progress["last_id"])]],
+                    {"limit": self.chunk_size, "order": "id asc"},
+                )
+            except Exception as e:
+                print(f"⚠️ Erreur lors de la recherche de {step.name} : {e}", flush=True)
+                return False
+            if not ids:
+                break
+            for action in step.actions:
+                try:
+                    self.call(step.model, action, [ids])
+                except Exception as e:
+                    print(f"⚠️ {step.name}.{action} impossible sur {len(ids)} enregistrements : {e}", flush=True)
+            refused = self._unlink(step, ids)
+            deleted += len(ids) - len(refused)
+            failed += len(refused)
+            progress["deleted"] += len(ids) - len(refused)
+            progress["failed"] += len(refused)
+            # Les ids refusés restent en base : le curseur passe au-delà
+            progress["last_id"] = ids[-1]
+            self._save(step, progress)
+            if len(ids) < self.chunk_size:
+                break
+
+        elapsed = time.monotonic() - start
+        progress["done"] = not progress["failed"]
+        if not progress["done"]:
+            progress["last_id"] = 0    # reprise au début : seuls les refusés correspondent encore
+        self._save(step, progress)
+        rate = deleted / elapsed if elapsed else 0
+        if deleted or failed:
+            print(f"🗑 {step.name} : {deleted} supprimés, {failed} laissés en place ({elapsed:.1f}s, {rate:.1f}/s).", flush=True)
+        else:
+            print(f"ℹ️ {step.name} : aucun enregistrement.", flush=True)
+        return True
+
+    def _unlink(self, step, ids):
+        """unlink de `ids`, page refusée coupée en deux ; retourne les ids laissés en place."""
+        try:
+            self.call(step.model, "unlink", [ids])
+        except Exception as e:
+            # Refus isolé, ou issue inconnue (pas de rejeu : la passe suivante revérifie)
+            if len(ids) == 1 or classify(e)[0] is not None:
+                print(f"⚠️ Impossible de supprimer {len(ids)} {step.name} (ids {ids[0]}…{ids[-1]}, on continue) : {e}", flush=True)
+                return list(ids)
+            middle = len(ids) // 2
+            return self._unlink(step, ids[:middle]) + self._unlink(step, ids[middle:])
+        with self.lock:
+            self.deleted_now += len(ids)
+        return []
@@ -0,0 +1,269 @@
+"""
+odoo_retry.py — FENUASIM
+Couche d'appel résiliente autour de execute_kw.
+
+  - Reprises avec backoff exponentiel et jitter (ODOO_MAX_RETRIES, défaut 5) :
+    une erreur passagère ne fait plus échouer tout le run.
+  - Disjoncteur : après ODOO_BREAKER_THRESHOLD réponses 429/503 consécutives,
+    plus aucun appel ne part pendant ODOO_BREAKER_COOLDOWN secondes (ou le
+    Retry-After d'Odoo s'il est plus long).
+  - Limites adaptatives (AIMD) : la concurrence et la taille des paquets de
+    create baissent de moitié sur saturation ou lenteur (> ODOO_TARGET_LATENCY
+    secondes), puis remontent progressivement tant qu'Odoo répond vite.
+
+Quelles erreurs rejouer :
+  - requête refusée avant traitement (429, 503, connexion impossible) ou
+    transaction annulée par Odoo (conflit de sérialisation, verrou) :
+    rejouable pour toutes les méthodes ;
+  - issue inconnue (délai dépassé, connexion coupée, 502/504) : Odoo a pu
+    exécuter l'appel, on ne rejoue que les lectures. Un create perdu ainsi
+    est rattrapé au run suivant par l'anti-doublon (odoo_index) ;
+  - Fault métier (ValidationError, UserError, AccessError…) : jamais rejouée.
+
+Usage :
+  models = ResilientModels(proxy)                   # même interface que le proxy
+  models = ResilientModels(proxy, RetryPolicy(AdaptiveLimits(4)))
+odoo_pool.OdooPool et odoo_transport.connect() l'appliquent déjà. Chaque
+appel est compté dans odoo_budget.RPC_BUDGET (modèle, méthode, appelant) et
+sa latence dans sync_metrics.METRICS.
+"""
+
+import os
+import random
+import threading
+import time
+import xmlrpc.client
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from odoo_budget import RPC_BUDGET, caller_name
+from sync_metrics import METRICS
+
+MAX_RETRIES = int(os.getenv("ODOO_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("ODOO_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("ODOO_BACKOFF_MAX", "60"))
+BREAKER_THRESHOLD = int(os.getenv("ODOO_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("ODOO_BREAKER_COOLDOWN", "30"))
+TARGET_LATENCY = float(os.getenv("ODOO_TARGET_LATENCY", "5"))
+
+THROTTLED = "throttled"   # 429/503 : refusé, rejouable, compte pour le disjoncteur
+REJECTED = "rejected"     # non exécuté par Odoo : rejouable
+UNCERTAIN = "uncertain"   # peut-être exécuté : rejouable pour les lectures seulement
+
+READ_METHODS = {
+    "search", "search_read", "search_count", "read", "read_group",
+    "fields_get", "name_search", "name_get", "check_access_rights",
+}
+# Erreurs Postgres remontées par Odoo quand la transaction a été annulée
+TRANSIENT_FAULTS = (
+    "could not serialize access",
+    "SerializationFailure",
+    "LockNotAvailable",
+    "deadlock detected",
+    "TransactionRollbackError",
+)
+
+
+def _retry_after(headers):
+    try:
+        return float((headers or {}).get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(exc):
+    """Retourne (nature, retry_after) ; nature None = erreur définitive."""
+    if isinstance(exc, xmlrpc.client.Fault):
+        text = str(exc.faultString)
+        return (REJECTED if any(marker in text for marker in TRANSIENT_FAULTS) else None), None
+    if isinstance(exc, xmlrpc.client.ProtocolError):
+        if exc.errcode in (429, 503):
+            return THROTTLED, _retry_after(exc.headers)
+        if exc.errcode in (502, 504):
+            return UNCERTAIN, None
+        return None, None
+    if isinstance(exc, requests.ConnectTimeout):
+        return REJECTED, None
+    if isinstance(exc, requests.ConnectionError):
+        reason = getattr(exc.args[0], "reason", None) if exc.args else None
+        return (REJECTED if isinstance(reason, NewConnectionError) else UNCERTAIN), None
+    if isinstance(exc, requests.Timeout):
+        return UNCERTAIN, None
+    if isinstance(exc, ConnectionRefusedError):
+        return REJECTED, None
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return UNCERTAIN, None
+    return None, None
+
+
+def backoff(attempt, retry_after=None):
+    """Délai avant la reprise n° attempt (0, 1…) : full jitter, borné."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.open_until = 0.0
+
+    def remaining(self):
+        """Secondes de pause restantes avant de pouvoir appeler Odoo."""
+        return max(0.0, self.open_until - time.monotonic())
+
+    def throttled(self, retry_after=None):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.threshold:
+                return
+            pause = max(self.cooldown, retry_after or 0)
+            until = time.monotonic() + pause
+            if until > self.open_until:
+                if self.remaining() == 0:
+                    print(f"⏸ Odoo saturé ({self.failures} réponses 429/503) : pause de {pause:.0f}s", flush=True)
+                self.open_until = until
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+
+
+class AdaptiveLimits:
+    """
+    Concurrence et taille de paquet ajustées aux réponses d'Odoo (AIMD).
+    `concurrency` plafonne les appels simultanés (acquire/release) ;
+    `batch_scale` (0..1] s'applique à ODOO_BATCH_SIZE dans odoo_batch.
+    """
+
+    MIN_BATCH_SCALE = 0.01
+
+    def __init__(self, max_concurrency, target_latency=TARGET_LATENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.batch_scale = 1.0
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.successes = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def batch_size(self, max_size):
+        return max(1, int(max_size * self.batch_scale))
+
+    def observe(self, latency, kind=None, records=1):
+        """kind : None (succès), THROTTLED, REJECTED, UNCERTAIN."""
+        with self.cond:
+            slow = latency > self.target_latency
+            if kind in (THROTTLED, UNCERTAIN) or (kind is None and slow):
+                self.concurrency = max(1, self.concurrency // 2)
+                self.successes = 0
+            elif kind is None:
+                self.successes += 1
+                if self.successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self.successes = 0
+            if records > 1:
+                if kind == UNCERTAIN or slow:
+                    self.batch_scale = max(self.MIN_BATCH_SCALE, self.batch_scale / 2)
+                elif kind is None and latency < self.target_latency / 2:
+                    self.batch_scale = min(1.0, self.batch_scale * 1.25)
+            self.cond.notify_all()
+
+
+class RetryPolicy:
+    """Décisions partagées par le client synchrone et le client asyncio."""
+
+    def __init__(self, limits=None, breaker=None, max_retries=MAX_RETRIES):
+        self.limits = limits
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+
+    def pause(self):
+        return self.breaker.remaining()
+
+    def succeeded(self, latency, records=1):
+        self.breaker.succeeded()
+        if self.limits:
+            self.limits.observe(latency, None, records)
+
+    def failed(self, exc, model, method, attempt, latency, records=1):
+        """Retourne le délai avant reprise, ou None s'il faut relever l'erreur."""
+        kind, retry_after = classify(exc)
+        if self.limits and kind:
+            self.limits.observe(latency, kind, records)
+        if kind == THROTTLED:
+            self.breaker.throttled(retry_after)
+        if kind is None or attempt >= self.max_retries:
+            return None
+        if kind == UNCERTAIN and method not in READ_METHODS:
+            return None
+        delay = backoff(attempt, retry_after)
+        print(
+            f"🔁 {model}.{method} : {type(exc).__name__} ({kind}) — "
+            f"essai {attempt + 2}/{self.max_retries + 1} dans {delay:.1f}s",
+            flush=True,
+        )
+        return delay
+
+
+def record_count(method, args):
+    """Nombre d'enregistrements d'un create multi (pour l'ajustement des paquets)."""
+    if method == "create" and args and isinstance(args[0], list):
+        return len(args[0])
+    return 1
+
+
+class ResilientModels:
+    """Proxy /object dont execute_kw passe par RetryPolicy."""
+
+    def __init__(self, models, policy=None):
+        self.models = models
+        self.policy = policy or RetryPolicy()
+
+    def execute_kw(self, db, uid, password, model, method, args, kw=None):
+        policy, limits = self.policy, self.policy.limits
+        records = record_count(method, args)
+        RPC_BUDGET.record(model, method, caller_name(), METRICS.current_phase())
+        attempt = 0
+        while True:
+            pause = policy.pause()
+            if pause:
+                time.sleep(pause)
+            if limits:
+                limits.acquire()
+            start = time.monotonic()
+            try:
+                result = self.models.execute_kw(db, uid, password, model, method, args, kw or {})
+            except Exception as e:
+                latency = time.monotonic() - start
+                if limits:
+                    limits.release()
+                delay = policy.failed(e, model, method, attempt, latency, records)
+                if delay is None:
+                    raise
+                attempt += 1
+                RPC_BUDGET.retried()
+                time.sleep(delay)
+                continue
+            if limits:
+                limits.release()
+            latency = time.monotonic() - start
+            policy.succeeded(latency, records)
+            METRICS.observe_rpc(model, method, args, latency)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self.models, name)
@@ -0,0 +1,85 @@
+"""
+odoo_transport.py — FENUASIM
+Transport XML-RPC Odoo sur requests.Session, partagé par tous les scripts.
+
+Le transport standard de xmlrpc.client n'offre ni délai d'attente, ni
+compression, et ses connexions ne survivent pas à une erreur HTTP. Ici chaque
+ServerProxy passe par une Session requests :
+  - connexions TLS keep-alive réutilisées d'un appel à l'autre (pool urllib3) ;
+  - réponses gzip acceptées et décompressées (gros search_read sur
+    product.product / account.move : Odoo Online compresse le XML) ;
+  - délai d'attente par appel : ODOO_TIMEOUT secondes (défaut 60).
+
+Usage :
+  uid, models = connect(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
+  models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "sale.order", "search", [[]])
+
+  models = server_proxy(ODOO_URL, "object")   # proxy seul, session propre
+
+Une Session n'est pas prévue pour être partagée entre threads :
+odoo_pool.OdooPool crée un proxy (donc une session) par thread.
+"""
+
+import os
+import xmlrpc.client
+from urllib.parse import urlsplit
+
+import requests
+
+from odoo_retry import ResilientModels
+
+TIMEOUT = float(os.getenv("ODOO_TIMEOUT", "60"))
+
+
+def odoo_session():
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "text/xml",
+        "Accept-Encoding": "gzip, deflate",
+        "User-Agent": "fenuasim-sync",
+    })
+    return session
+
+
+class SessionTransport(xmlrpc.client.Transport):
+    """Transport xmlrpc.client qui envoie les requêtes via une Session requests."""
+
+    def __init__(self, scheme="https", session=None, timeout=TIMEOUT):
+        super().__init__()
+        self.scheme = scheme
+        self.session = session or odoo_session()
+        self.timeout = timeout
+
+    def request(self, host, handler, request_body, verbose=False):
+        url = f"{self.scheme}://{host}{handler}"
+        response = self.session.post(url, data=request_body, timeout=self.timeout)
+        if response.status_code != 200:
+            raise xmlrpc.client.ProtocolError(
+                f"{host}{handler}", response.status_code, response.reason, dict(response.headers)
+            )
+        # requests a déjà décompressé le corps (Content-Encoding: gzip)
+        parser, unmarshaller = self.getparser()
+        parser.feed(response.content)
+        parser.close()
+        return unmarshaller.close()
+
+    def close(self):
+        self.session.close()
+
+
+def server_proxy(url, service="object", session=None, timeout=TIMEOUT):
+    """ServerProxy /xmlrpc/2/<service> branché sur une Session requests."""
+    transport = SessionTransport(urlsplit(url).scheme or "https", session, timeout)
+    return xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/{service}", transport=transport, allow_none=True)
+
+
+def connect(url, db, user, password, timeout=TIMEOUT):
+    """
+    Authentifie l'utilisateur et renvoie (uid, models). L'authentification et
+    les appels suivants partagent la même session, donc la même connexion TLS ;
+    models.execute_kw passe par odoo_retry (reprises, disjoncteur).
+    """
+    session = odoo_session()
+    common = server_proxy(url, "common", session, timeout)
+    uid = common.authenticate(db, user, password, {})
+    return uid, ResilientModels(server_proxy(url, "object", session, timeout))
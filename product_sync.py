@@ -0,0 +1,231 @@
+"""
+product_sync.py — FENUASIM
+Synchro du catalogue airalo_packages -> product.product sans réécriture inutile.
+
+Chaque write sur product.product déclenche recalculs et suivi de messages
+côté Odoo : on ne l'envoie que si le produit a réellement changé. L'empreinte
+d'un produit est le tuple normalisé de ses champs suivis (nom, prix, catégorie,
+compte de revenus…). Celle des produits existants vient d'un seul search_read
+paginé en début de run. On ne tient pas d'état local, donc une modification
+faite à la main dans Odoo est elle aussi corrigée.
+
+Usage :
+  catalog = CatalogSync(call, ["name", "list_price", "categ_id"])
+  created, updated = catalog.sync({code: vals, ...})   # autant d'appels que de pages
+  print(catalog.summary())
+
+  - produits absents : create multi-enregistrements (odoo_batch.CreateBatch) ;
+  - produits modifiés : write des seuls champs changés, un write par
+    ensemble de changements identiques (ex. même catégorie pour tous) ;
+  - produits inchangés : aucun appel.
+Avec `index=` (odoo_index.ProductIndex), l'index est rempli par la même
+lecture et tenu à jour après création / modification.
+
+Import complet (CatalogLoader) : product.product.load, chaque offre portant
+l'id externe fenuasim.airalo_<package_id>. Odoo résout lui-même création ou
+mise à jour, sans recherche préalable : quelques appels pour tout le
+catalogue (LOAD_CHUNK lignes par load, défaut 500).
+  loader = CatalogLoader(call, ["default_code", "name", "list_price", "categ_id"])
+  loaded, failed = loader.load({code: vals, ...})      # failed : [(code, message)]
+Un load en erreur est annulé en entier par Odoo : le paquet est alors coupé
+en deux, récursivement, jusqu'à isoler les lignes fautives, que l'erreur
+soit rapportée dans `messages` ou levée (Fault). Une panne incertaine
+(délai dépassé, 502/504) n'est pas découpée : l'exception remonte.
+"""
+
+import os
+import re
+
+from odoo_batch import CreateBatch
+from odoo_index import PAGE_SIZE, chunked, search_read_paged
+from odoo_retry import classify
+
+XMLID_MODULE = "fenuasim"
+LOAD_CHUNK = int(os.getenv("ODOO_LOAD_CHUNK", "500"))
+
+
+def _normalize(value):
+    if isinstance(value, (list, tuple)) and value:   # many2one lu : [id, "Nom"]
+        return value[0]
+    if value is None or value is False:
+        return False
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def fingerprint(vals, fields):
+    """Empreinte comparable d'un produit sur `fields` (vals ou enregistrement lu)."""
+    return tuple(_normalize(vals.get(field)) for field in fields)
+
+
+class CatalogSync:
+    def __init__(self, call, fields, index=None, pool=None, page_size=PAGE_SIZE):
+        self.call = call
+        self.fields = [f for f in fields if f != "default_code"]
+        self.index = index
+        self.pool = pool
+        self.page_size = page_size
+        self.current = None        # default_code -> (id, empreinte)
+        self.created = self.updated = self.unchanged = 0
+
+    def load(self):
+        fill_index = self.index is not None and self.index.by_code is None
+        if fill_index:
+            self.index.by_code = {}
+        self.current = {}
+        fields = list(dict.fromkeys(["default_code", *self.fields, *(self.index.FIELDS if fill_index else [])]))
+        for rec in search_read_paged(
+            self.call, "product.product", [("default_code", "!=", False)], fields, self.page_size
+        ):
+            code = rec["default_code"]
+            if code in self.current:
+                continue
+            self.current[code] = (rec["id"], fingerprint(rec, self.fields))
+            if fill_index:
+                self.index.by_code[code] = {"id": rec["id"], "name": rec["name"], "list_price": rec["list_price"]}
+        return self
+
+    def sync(self, vals_by_code):
+        """Crée / met à jour ce qui doit l'être. Retourne (codes créés, codes mis à jour)."""
+        if self.current is None:
+            self.load()
+        batch = CreateBatch(self.call, "product.product", pool=self.pool)
+        writes = {}                # changements (tuple trié) -> [ids]
+        updated = []
+        for code, vals in vals_by_code.items():
+            known = self.current.get(code)
+            if known is None:
+                batch.add(code, vals)
+                continue
+            product_id, current = known
+            wanted = fingerprint(vals, self.fields)
+            if wanted == current:
+                self.unchanged += 1
+                continue
+            changes = tuple(sorted(
+                (field, vals.get(field))
+                for field, old, new in zip(self.fields, current, wanted) if old != new
+            ))
+            writes.setdefault(changes, []).append(product_id)
+            self.current[code] = (product_id, wanted)
+            updated.append(code)
+
+        items = list(writes.items())
+        write = lambda item: self.call("product.product", "write", [item[1], dict(item[0])])
+        if self.pool is not None:
+            self.pool.map(write, items)
+        else:
+            for item in items:
+                write(item)
+
+        created = []
+        for code, product_id in batch.flush():
+            self.current[code] = (product_id, fingerprint(vals_by_code[code], self.fields))
+            created.append(code)
+
+        if self.index is not None:
+            for code in created + updated:
+                vals = vals_by_code[code]
+                self.index.add(code, self.current[code][0], vals.get("name"), vals.get("list_price", 0.0))
+        self.created += len(created)
+        self.updated += len(updated)
+        return created, updated
+
+    def summary(self):
+        return f"{self.created} créés, {self.updated} mis à jour, {self.unchanged} inchangés"
+
+
+# ─── IMPORT COMPLET VIA load() ────────────────────────────────────────────────
+def product_xmlid_name(code):
+    """Nom d'id externe (sans module) d'une offre Airalo : airalo_<package_id>."""
+    return "airalo_" + re.sub(r"[^A-Za-z0-9_-]", "_", str(code))
+
+
+def _load_value(field, value):
+    # load() attend des chaînes ; les many2one sont passés en ids (`champ/.id`)
+    if isinstance(value, bool) and not field.endswith("_id"):
+        return "1" if value else "0"
+    if value is None or value is False:
+        return ""
+    return str(value)
+
+
+class CatalogLoader:
+    def __init__(self, call, fields, chunk_size=LOAD_CHUNK, page_size=PAGE_SIZE):
+        self.call = call
+        self.fields = [f for f in fields if f != "id"]
+        self.chunk_size = max(1, chunk_size)
+        self.page_size = page_size
+        self.xmlids = None         # noms airalo_* déjà enregistrés dans ir.model.data
+        self.orphans = {}          # default_code -> id des produits sans id externe
+
+    def load_fields(self):
+        return ["id"] + [f"{f}/.id" if f.endswith("_id") else f for f in self.fields]
+
+    def ensure_xmlids(self, codes):
+        """
+        Rattache leur id externe aux produits créés avant le mode load (par
+        default_code), sinon load() les dupliquerait. Deux lectures par run, au
+        premier appel ; un create ir.model.data tant qu'il reste des orphelins.
+        """
+        if self.xmlids is None:
+            self.xmlids = {
+                rec["name"] for rec in search_read_paged(
+                    self.call, "ir.model.data",
+                    [("module", "=", XMLID_MODULE), ("model", "=", "product.product")],
+                    ["name"], self.page_size,
+                )
+            }
+            for rec in search_read_paged(
+                self.call, "product.product", [("default_code", "!=", False)], ["default_code"], self.page_size
+            ):
+                if product_xmlid_name(rec["default_code"]) not in self.xmlids:
+                    self.orphans.setdefault(rec["default_code"], rec["id"])
+        missing = [
+            {"module": XMLID_MODULE, "name": product_xmlid_name(code),
+             "model": "product.product", "res_id": self.orphans.pop(code)}
+            for code in codes if code in self.orphans
+        ]
+        for chunk in chunked(missing, self.chunk_size):
+            self.call("ir.model.data", "create", [chunk])
+        self.xmlids.update(vals["name"] for vals in missing)
+        return len(missing)
+
+    def load(self, vals_by_code):
+        """Upsert de tous les produits. Retourne (codes importés, [(code, message)])."""
+        linked = self.ensure_xmlids(vals_by_code)
+        if linked:
+            print(f"🔗 {linked} produits existants rattachés à leur id externe.", flush=True)
+        rows = [
+            (code, [f"{XMLID_MODULE}.{product_xmlid_name(code)}"]
+             + [_load_value(f, vals.get(f)) for f in self.fields])
+            for code, vals in vals_by_code.items()
+        ]
+        loaded, failed = [], []
+        for chunk in chunked(rows, self.chunk_size):
+            ok, errors = self._load_chunk(chunk)
+            loaded += ok
+            failed += errors
+        self.xmlids.update(product_xmlid_name(code) for code in loaded)
+        return loaded, failed
+
+    def _load_chunk(self, rows):
+        try:
+            result = self.call("product.product", "load", [self.load_fields(), [data for _, data in rows]])
+        except Exception as e:
+            if classify(e)[0] is not None:
+                raise              # panne persistante : le load a peut-être abouti
+            lines = str(getattr(e, "faultString", e)).strip().splitlines()
+            result = {"ids": False, "messages": [{"type": "error", "message": lines[-1] if lines else repr(e)}]}
+        errors = [m for m in result.get("messages") or [] if m.get("type") == "error"]
+        if result.get("ids") and not errors:
+            return [code for code, _ in rows], []
+        if len(rows) == 1:
+            message = "; ".join(m.get("message", "") for m in errors) or "load refusé"
+            return [], [(rows[0][0], message)]
+        # Odoo a annulé tout le paquet : on bisecte pour isoler les lignes fautives
+        middle = len(rows) // 2
+        left_ok, left_errors = self._load_chunk(rows[:middle])
+        right_ok, right_errors = self._load_chunk(rows[middle:])
+        return left_ok + right_ok, left_errors + right_errors
@@ -1,37 +1,35 @@
+import argparse
 import os
-import xmlrpc.client
+
+from odoo_reset import ResetEngine, ResetStep
+from odoo_transport import connect
 
 ODOO_URL = os.getenv("ODOO_URL")
 ODOO_DB = os.getenv("ODOO_DB")
 ODOO_USER = os.getenv("ODOO_USER")
 ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
 
+parser = argparse.ArgumentParser(description="Suppression des devis Odoo sans origine")
+parser.add_argument("--restart", action="store_true",
+                    help="ignore la progression enregistrée et reprend depuis le début")
+args = parser.parse_args()
+
 print("🔌 Connexion à Odoo…")
 
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
+uid, models = connect(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
+
+
+def call(model, method, args, kw=None):
+    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
+
 
-print("🔎 Recherche des devis Odoo sans origin…")
+print("🔎 Suppression des devis Odoo sans origin…")
 
-draft_ids = models.execute_kw(
-    ODOO_DB, uid, ODOO_PASSWORD,
-    'sale.order', 'search',
-    [[
+# Ids lus et supprimés par paquets de RESET_CHUNK, reprise possible (odoo_reset)
+ResetEngine(call, "drafts").run([[
+    ResetStep('sale.order', [
         ('state', '=', 'draft'),
         ('origin', '=', False),
         ('create_date', '>=', '2025-11-15')
-    ]]
-)
-
-print(f"🗑 {len(draft_ids)} devis trouvés.")
-
-if draft_ids:
-    models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        'sale.order', 'unlink',
-        [draft_ids]
-    )
-    print("✅ Devis supprimés.")
-else:
-    print("ℹ️ Aucun devis à supprimer.")
+    ], name='devis')
+]], restart=args.restart)
@@ -1,33 +1,31 @@
+import argparse
 import os
-import xmlrpc.client
+
+from odoo_reset import ResetEngine, ResetStep
+from odoo_transport import connect
 
 ODOO_URL = os.getenv("ODOO_URL")
 ODOO_DB = os.getenv("ODOO_DB")
 ODOO_USER = os.getenv("ODOO_USER")
 ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
 
+parser = argparse.ArgumentParser(description="Suppression des commandes Stripe dans Odoo")
+parser.add_argument("--restart", action="store_true",
+                    help="ignore la progression enregistrée et reprend depuis le début")
+args = parser.parse_args()
+
 print("🔌 Connexion à Odoo…")
 
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
-
-print("🔎 Recherche des commandes Stripe…")
-
-order_ids = models.execute_kw(
-    ODOO_DB, uid, ODOO_PASSWORD,
-    'sale.order', 'search',
-    [[('origin', 'ilike', 'Stripe%')]]
-)
-
-print(f"🗑 {len(order_ids)} commandes Stripe trouvées.")
-
-if order_ids:
-    models.execute_kw(
-        ODOO_DB, uid, ODOO_PASSWORD,
-        'sale.order', 'unlink',
-        [order_ids]
-    )
-    print("✅ Commandes Stripe supprimées.")
-else:
-    print("ℹ️ Aucune commande à supprimer.")
+uid, models = connect(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
+
+
+def call(model, method, args, kw=None):
+    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
+
+
+print("🔎 Suppression des commandes Stripe…")
+
+# Ids lus et supprimés par paquets de RESET_CHUNK, reprise possible (odoo_reset)
+ResetEngine(call, "stripe").run([[
+    ResetStep('sale.order', [('origin', 'ilike', 'Stripe%')], name='commandes Stripe')
+]], restart=args.restart)
@@ -0,0 +1,178 @@
+"""
+supabase_reader.py — FENUASIM
+Lecture paginée des tables Supabase, sans charger toute la table en mémoire.
+
+PostgREST plafonne le nombre de lignes renvoyées par requête (1000 par défaut
+sur Supabase) : un simple select("*").execute() tronque silencieusement les
+grosses tables. On lit donc par pages, dans un ordre stable, et la page
+suivante est téléchargée en arrière-plan pendant le traitement de la page
+courante.
+
+Pagination par clé (keyset) sur les colonnes de `order` : chaque page
+demande les lignes qui suivent la dernière ligne lue, par exemple
+  or=(created_at.gt.X,and(created_at.eq.X,id.gt.Y))
+et non un offset. Une ligne qui sort du filtre en cours de run (statut
+modifié) ne décale donc pas les pages suivantes. La lecture ne s'arrête que
+sur une page vide : une page plus courte que demandé (« Max rows » du projet
+inférieur à SUPABASE_PAGE_SIZE) ne tronque plus rien, elle coûte seulement
+une requête de plus. Les colonnes de `order` doivent figurer dans la
+projection et la dernière doit être unique (id) ; les lignes où l'une d'elles
+est nulle (created_at vide) sont exclues par la requête (col=not.is.null),
+faute de pouvoir les situer dans l'ordre. `after=` (clé de départ, ex.
+sync_state.resume_key) reprend strictement après une ligne déjà traitée, dans
+le même unique filtre or=(…) que les pages suivantes.
+
+Usage :
+  for rows in iter_pages(lambda: supabase.table("orders").select("*").eq("status", "completed"),
+                         order=("created_at", "id")):
+      ...                               # une liste de lignes par page
+
+  for row in iter_rows(lambda: supabase.table("leads").select("*")):
+      ...
+
+  async for rows in aiter_pages(...):   # moteur asyncio : même pagination,
+      ...                               # requêtes dans un thread, page suivante en tâche
+
+`build_query` doit renvoyer une requête neuve à chaque appel (les builders
+postgrest sont mutables).
+
+Projection : chaque synchro déclare les colonnes qu'elle utilise, vérifiées
+une fois au démarrage (requête limit 1) avant toute écriture Odoo.
+  orders = select_columns(supabase, "orders", ORDER_COLUMNS)
+  for rows in iter_pages(lambda: orders().eq("status", "completed")): ...
+
+Chaque page lue est comptée dans sync_metrics.METRICS (lignes et durée par table).
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from postgrest.exceptions import APIError
+
+from sync_metrics import METRICS
+
+PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+PREFETCH = os.getenv("SUPABASE_PREFETCH", "1") != "0"
+
+_validated = set()
+
+
+def validate_columns(supabase, table, columns):
+    """Échoue immédiatement si une colonne déclarée n'existe pas dans `table`."""
+    key = (table, tuple(columns))
+    if key in _validated:
+        return
+    try:
+        supabase.table(table).select(",".join(columns)).limit(1).execute()
+    except APIError as e:
+        raise ValueError(
+            f"Colonnes Supabase invalides pour '{table}' ({', '.join(columns)}) : {e.message}"
+        ) from e
+    _validated.add(key)
+
+
+def select_columns(supabase, table, columns):
+    """
+    Valide `columns` puis renvoie une fabrique de requêtes select() limitées à
+    ces colonnes, à compléter par les filtres (eq, in_…) de l'appelant.
+    """
+    validate_columns(supabase, table, columns)
+    projection = ",".join(columns)
+    return lambda: supabase.table(table).select(projection)
+
+
+def table_name(query):
+    """Table visée par un builder postgrest (pour les métriques), '?' si inconnue."""
+    path = str(getattr(getattr(query, "request", None), "path", "") or "")
+    return path.rstrip("/").rsplit("/", 1)[-1] or "?"
+
+
+def _quote(value):
+    # Valeurs d'un or=(…) : guillemets pour les caractères réservés (, . : ( ))
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def after_key(query, order, key):
+    """Restreint `query` aux lignes strictement après `key` (valeurs des colonnes `order`)."""
+    if len(order) == 1:
+        return query.gt(order[0], key[0])
+    terms = []
+    for i, column in enumerate(order):
+        equal = [f"{previous}.eq.{_quote(value)}" for previous, value in zip(order[:i], key)]
+        term = f"{column}.gt.{_quote(key[i])}"
+        terms.append(f"and({','.join(equal + [term])})" if equal else term)
+    return query.or_(",".join(terms))
+
+
+def last_key(page, order):
+    """Clé de pagination de la dernière ligne d'une page."""
+    row = page[-1]
+    missing = [column for column in order if column not in row]
+    if missing:
+        raise ValueError(
+            f"Pagination Supabase impossible : colonne(s) {', '.join(missing)} absente(s) "
+            f"de la projection (ligne {row.get('id')})"
+        )
+    return tuple(row[column] for column in order)
+
+
+def fetch_page(build_query, order, key, page_size):
+    """Page de `page_size` lignes au plus, après la clé `key` (None : première page)."""
+    query = build_query()
+    for column in order:
+        query = query.not_.is_(column, "null")
+    if key is not None:
+        query = after_key(query, order, key)
+    for column in order:
+        query = query.order(column)
+    start = time.monotonic()
+    with METRICS.phase("supabase.fetch"):
+        rows = query.limit(page_size).execute().data or []
+    METRICS.observe_fetch(table_name(query), len(rows), time.monotonic() - start)
+    return rows
+
+
+def iter_pages(build_query, order=("id",), page_size=PAGE_SIZE, prefetch=PREFETCH, after=None):
+    """
+    Génère les lignes page par page (listes), dans l'ordre `order`, jusqu'à une
+    page vide ; `after` : clé (valeurs de `order`) après laquelle commencer.
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="supabase-prefetch") as pool:
+        next_page = pool.submit(fetch_page, build_query, order, after, page_size)
+        while next_page is not None:
+            page = next_page.result()
+            next_page = None
+            if not page:
+                break
+            # Clé relevée avant le yield : l'appelant peut modifier les lignes
+            key = last_key(page, order)
+            if prefetch:
+                next_page = pool.submit(fetch_page, build_query, order, key, page_size)
+            yield page
+            if not prefetch:
+                next_page = pool.submit(fetch_page, build_query, order, key, page_size)
+
+
+def iter_rows(build_query, order=("id",), page_size=PAGE_SIZE, prefetch=PREFETCH, after=None):
+    """Comme iter_pages, mais ligne par ligne."""
+    for page in iter_pages(build_query, order, page_size, prefetch, after):
+        yield from page
+
+
+async def aiter_pages(build_query, order=("id",), page_size=PAGE_SIZE, after=None):
+    """
+    Version asyncio de iter_pages : le client Supabase étant synchrone, chaque
+    page est lue dans un thread et la suivante est lancée en tâche de fond.
+    """
+    next_page = asyncio.create_task(asyncio.to_thread(fetch_page, build_query, order, after, page_size))
+    while next_page is not None:
+        page = await next_page
+        next_page = None
+        if not page:
+            break
+        next_page = asyncio.create_task(
+            asyncio.to_thread(fetch_page, build_query, order, last_key(page, order), page_size)
+        )
+        yield page
@@ -1,7 +1,14 @@
+import argparse
 import os
 import sys
-import xmlrpc.client
 from supabase import create_client, Client
+from odoo_batch import CreateBatch
+from odoo_index import OpportunityIndex, PartnerIndex, normalize_email
+from odoo_refcache import RefCache
+from odoo_transport import connect
+from supabase_reader import iter_pages, iter_rows, select_columns
+from sync_metrics import METRICS
+from sync_profile import profiled
 
 # ============================================================
 #  CONFIGURATION
@@ -20,45 +27,72 @@ ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 try:
-    common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common", allow_none=True)
-    uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-    models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object", allow_none=True)
+    uid, models = connect(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
 except Exception as e:
     print(f"❌ Erreur de connexion Odoo : {e}")
     sys.exit(1)
 
+def call(model, method, args, kw=None):
+    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, model, method, args, kw or {})
+
+PARTNERS = PartnerIndex(call)
+OPPORTUNITIES = OpportunityIndex(call)
+REF = RefCache(ODOO_URL, ODOO_DB, call)
+
 # ============================================================
 # HELPERS
 # ============================================================
 
 def get_tag_id(tag_name: str) -> int:
-    """Récupère ou crée l'étiquette demandée dans Odoo."""
-    ids = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.tag", "search",
-        [[("name", "=", tag_name)]], {"limit": 1})
-    if ids:
-        return ids[0]
-    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.tag", "create", [{"name": tag_name}])
+    """Récupère ou crée l'étiquette demandée dans Odoo (cache de référence REF)."""
+    def lookup():
+        ids = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.tag", "search",
+            [[("name", "=", tag_name)]], {"limit": 1})
+        if ids:
+            return ids[0]
+        return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.tag", "create", [{"name": tag_name}])
+    return REF.resolve(f"crm.tag:{tag_name}", lookup)
+
+def lead_fullname(first_name, last_name, email):
+    return f"{first_name or ''} {last_name or ''}".strip() or email
+
+def partner_vals(first_name, last_name, email, supabase_id):
+    return {
+        "name": lead_fullname(first_name, last_name, email),
+        "email": email,
+        "ref": supabase_id,
+        "customer_rank": 1
+    }
+
+def opportunity_vals(partner_id, first_name, last_name, email, tag_id):
+    fullname = lead_fullname(first_name, last_name, email)
+    return {
+        "name": f"Popup -5% : {fullname}",
+        "type": "opportunity",
+        "partner_id": partner_id,
+        "email_from": email,
+        "contact_name": fullname,
+        "description": "Prospect inscrit via le Pop-up Newsletter. Offre : -5% (Code FIRST)",
+        "tag_ids": [(6, 0, [tag_id])]
+    }
 
 def ensure_partner(first_name, last_name, email, supabase_id):
     """Trouve ou crée le contact client."""
     email = email.strip().lower()
-    ids = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "res.partner", "search",
-        [[("email", "=ilike", email)]], {"limit": 1})
-    if ids:
-        return ids[0]
-
-    fullname = f"{first_name or ''} {last_name or ''}".strip() or email
-    return models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "res.partner", "create", [{
-        "name": fullname,
-        "email": email,
-        "ref": supabase_id,
-        "customer_rank": 1
-    }])
+    existing = PARTNERS.get(email)
+    if existing:
+        return existing
+
+    pid = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "res.partner", "create", [
+        partner_vals(first_name, last_name, email, supabase_id)
+    ])
+    PARTNERS.add(email, pid)
+    return pid
 
 def ensure_opportunity(partner_id, first_name, last_name, email):
     """Crée une Opportunité avec le tag 'FENUA SIM - Popup -5%'."""
     email = email.strip().lower()
-    fullname = f"{first_name or ''} {last_name or ''}".strip() or email
+    fullname = lead_fullname(first_name, last_name, email)
 
     # Vérification anti-doublon (uniquement dans les opportunités)
     existing = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.lead", "search",
@@ -66,20 +100,15 @@ def ensure_opportunity(partner_id, first_name, last_name, email):
     
     if existing:
         print(f"⏭ Opportunité déjà existante pour : {email}")
+        METRICS.count("rows_skipped", table="leads", reason="duplicate")
         return existing[0]
 
     tag_id = get_tag_id(TAG_NAME)
 
     # Création en tant qu'OPPORTUNITÉ (dans le pipeline)
-    opp_id = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.lead", "create", [{
-        "name": f"Popup -5% : {fullname}",
-        "type": "opportunity",
-        "partner_id": partner_id,
-        "email_from": email,
-        "contact_name": fullname,
-        "description": "Prospect inscrit via le Pop-up Newsletter. Offre : -5% (Code FIRST)",
-        "tag_ids": [(6, 0, [tag_id])]
-    }])
+    opp_id = models.execute_kw(ODOO_DB, uid, ODOO_PASSWORD, "crm.lead", "create", [
+        opportunity_vals(partner_id, first_name, last_name, email, tag_id)
+    ])
     print(f"🟢 Opportunité créée : {fullname} avec le tag '{TAG_NAME}'")
     return opp_id
 
@@ -87,18 +116,91 @@ def ensure_opportunity(partner_id, first_name, last_name, email):
 # SYNCHRONISATION
 # ============================================================
 
+LEAD_COLUMNS = ("id", "email", "first_name", "last_name")
+
 def sync_leads():
     print(f"🚀 Synchronisation vers Odoo (Tag: {TAG_NAME})...")
+    leads = select_columns(supabase, "leads", LEAD_COLUMNS)
     # Filtrage sur la source 'popup_newsletter' définie dans votre composant React
-    rows = supabase.table("leads").select("*").eq("source", "popup_newsletter").execute().data or []
-
-    for row in rows:
+    for row in iter_rows(lambda: leads().eq("source", "popup_newsletter")):
         email = row.get("email")
-        if not email: continue
+        if not email:
+            METRICS.count("rows_skipped", table="leads", reason="no_email")
+            continue
 
         # On utilise first_name et last_name exclusivement pour le nom
         pid = ensure_partner(row.get("first_name"), row.get("last_name"), email, row.get("id"))
         ensure_opportunity(pid, row.get("first_name"), row.get("last_name"), email)
 
+def sync_leads_bulk():
+    """
+    Même résultat que sync_leads(), par paquets : emails des opportunités et
+    partenaires chargés une fois (search_read paginés), puis, pour chaque page
+    Supabase, un create res.partner et un create crm.lead par paquet de
+    ODOO_BATCH_SIZE. Les leads déjà dans le pipeline ne coûtent aucun appel.
+    """
+    print(f"🚀 Synchronisation groupée vers Odoo (Tag: {TAG_NAME})...")
+    leads = select_columns(supabase, "leads", LEAD_COLUMNS)
+    with METRICS.phase("references"):
+        tag_id = get_tag_id(TAG_NAME)
+    with METRICS.phase("opportunities.load"):
+        OPPORTUNITIES.load()
+    print(f"📇 {len(OPPORTUNITIES)} opportunités existantes.")
+
+    count = skipped = partners_created = opportunities_created = 0
+    for rows in iter_pages(lambda: leads().eq("source", "popup_newsletter")):
+        count += len(rows)
+        new_leads = {}             # email -> ligne ; un doublon Supabase n'est créé qu'une fois
+        for row in rows:
+            email = normalize_email(row.get("email"))
+            if not email:
+                METRICS.count("rows_skipped", table="leads", reason="no_email")
+                continue
+            if email in OPPORTUNITIES or email in new_leads:
+                skipped += 1
+                METRICS.count("rows_skipped", table="leads", reason="duplicate")
+                continue
+            new_leads[email] = row
+
+        with METRICS.phase("partners.create"):
+            partners = CreateBatch(call, "res.partner")
+            for email, row in new_leads.items():
+                if PARTNERS.get(email) is None:
+                    partners.add(email, partner_vals(row.get("first_name"), row.get("last_name"), email, row.get("id")))
+            for email, pid in partners.flush():
+                PARTNERS.add(email, pid)
+                partners_created += 1
+
+        with METRICS.phase("opportunities.create"):
+            opportunities = CreateBatch(call, "crm.lead")
+            for email, row in new_leads.items():
+                partner_id = PARTNERS.get(email)
+                if partner_id is None:
+                    # Contact refusé par Odoo : pas d'opportunité orpheline, reprise au prochain run
+                    METRICS.count("rows_skipped", table="leads", reason="partner_failed")
+                    continue
+                opportunities.add(email, opportunity_vals(
+                    partner_id, row.get("first_name"), row.get("last_name"), email, tag_id
+                ))
+            for email, _ in opportunities.flush():
+                OPPORTUNITIES.add(email)
+                opportunities_created += 1
+                print(f"🟢 Opportunité créée : {email}")
+
+    print(f"📦 {count} leads lus, {skipped} déjà dans le pipeline.")
+    print(f"📊 {partners_created} contacts et {opportunities_created} opportunités créés.")
+
 if __name__ == "__main__":
-    sync_leads()
+    parser = argparse.ArgumentParser(description="Sync leads popup (Supabase -> opportunités Odoo)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="charge les opportunités existantes une fois et crée contacts / opportunités par paquets")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile le run (cProfile + piles par phase dans SYNC_PROFILE_DIR, voir sync_profile.py)")
+    args = parser.parse_args()
+
+    # Métriques du run : SYNC_METRICS_DIR/sync_leads.prom et .json (sync_metrics)
+    with METRICS.run("sync_leads"), profiled("sync_leads", args.profile):
+        if args.bulk:
+            sync_leads_bulk()
+        else:
+            sync_leads()
@@ -0,0 +1,336 @@
+"""
+sync_metrics.py — FENUASIM
+Métriques structurées d'un run de synchro, exportées en OpenMetrics et en JSON.
+
+Collecté pendant le run :
+  - lignes lues dans Supabase et durée de chaque requête, par table
+    (supabase_reader) ;
+  - latence des appels Odoo par model.method (histogramme, odoo_retry et
+    odoo_async) et enregistrements créés / modifiés / importés / confirmés /
+    validés, déduits des create / write / load / action_* réussis ;
+  - lignes ignorées (doublons, montants invalides, inchangées…), comptées
+    par les scripts : METRICS.count("rows_skipped", table=…, reason=…) ;
+  - durée de chaque phase : with METRICS.phase("orders.dedupe"): … (cumulée
+    sur toutes les pages). Les threads de OdooPool.map héritent de la phase
+    qui les a lancés (sans la chronométrer une seconde fois) : sync_profile
+    range ainsi chaque échantillon de pile sous sa phase, et odoo_budget
+    chaque appel Odoo. La phase courante suit le contexte (contextvars) :
+    chaque tâche asyncio garde la sienne, même sur une boucle partagée ;
+  - fraîcheur : délai entre created_at Supabase et la création du sale.order,
+    par source (stripe, ava, airalo), enregistré par les synchros de commandes
+    au retour du create : METRICS.observe_lag("stripe", row["created_at"]).
+    Exporté en p50 / p95 / max (suivi du SLA « commande payée visible dans
+    Odoo ») ; l'arriéré restant est mesuré par freshness_report.py.
+
+En fin de run, METRICS.run() écrit dans SYNC_METRICS_DIR (défaut metrics/) :
+  <script>.prom  — OpenMetrics, lisible par le collecteur textfile de node_exporter ;
+  <script>.json  — même contenu, plus le détail des appels Odoo par appelant
+                   (odoo_budget), archivé comme artefact par les workflows.
+Les deux fichiers sont écrits même si le run échoue (run_success = 0).
+
+Usage :
+  with METRICS.run("main_fast"):
+      sync_stripe_orders_to_odoo_quotes()
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from odoo_budget import RPC_BUDGET
+from sync_state import parse_ts
+
+METRICS_DIR = os.getenv("SYNC_METRICS_DIR", "metrics")
+PREFIX = "fenuasim_sync"
+# Secondes : appels Odoo Online de quelques dizaines de ms à la minute (gros create)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Méthodes d'écriture -> action comptée dans records_total (les factures créées
+# par sale.order._create_invoices sont comptées par billing.py)
+WRITE_ACTIONS = {
+    "create": "created", "write": "updated", "load": "loaded", "unlink": "deleted",
+    "action_confirm": "confirmed", "action_post": "posted",
+}
+# Quantiles de fraîcheur exportés (1.0 = max)
+LAG_QUANTILES = (0.5, 0.95, 1.0)
+
+HELP = {
+    "rows_fetched": "Lignes lues dans Supabase",
+    "rows_skipped": "Lignes ignorées (doublon, invalide, inchangée…)",
+    "records": "Enregistrements Odoo créés / modifiés / importés / confirmés / validés",
+    "create_failed": "Payloads refusés par Odoo lors d'une création groupée (odoo_batch)",
+    "odoo_rpc_retries": "Reprises d'appels Odoo (odoo_retry)",
+    "odoo_rpc_seconds": "Latence des appels Odoo réussis",
+    "supabase_fetch_seconds": "Durée des requêtes Supabase",
+    "phase_seconds": "Durée cumulée de chaque phase du run",
+    "order_lag_seconds": "Délai created_at Supabase -> création du sale.order, par source",
+    "run_duration_seconds": "Durée totale du run",
+    "run_success": "1 si le run est allé au bout, 0 sinon",
+    "run_timestamp_seconds": "Fin du run (epoch)",
+}
+
+
+def written_records(method, args):
+    """Nombre d'enregistrements touchés par un appel d'écriture réussi."""
+    if not args:
+        return 0
+    if method == "create":
+        return len(args[0]) if isinstance(args[0], list) else 1
+    if method == "load":
+        return len(args[1]) if len(args) > 1 else 0
+    return len(args[0]) if isinstance(args[0], list) else 1
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total, out = 0, []
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "max": round(self.max, 6),
+            "buckets": {str(bound): n for bound, n in self.cumulative()},
+        }
+
+
+def quantile(ordered, q):
+    """Quantile (rang le plus proche) d'une liste triée non vide."""
+    return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+
+def lag_summary(values):
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": round(quantile(ordered, 0.5), 3),
+        "p95": round(quantile(ordered, 0.95), 3),
+        "max": round(ordered[-1], 3),
+        "avg": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}" if labels else ""
+
+
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.script = None
+        self.started = None
+        self.counters = {}         # (nom, labels) -> valeur
+        self.histograms = {}       # (nom, labels) -> Histogram
+        self.phases = {}           # phase -> secondes cumulées
+        self.active = {}           # thread ident -> phases en cours (sync_profile)
+        self.current = contextvars.ContextVar("sync_phase", default=None)
+        self.lags = {}             # source -> délais en secondes (une valeur par commande)
+        self.result = {}
+
+    # ─── COLLECTE ─────────────────────────────────────────────────────────────
+    def count(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_rpc(self, model, method, args, seconds):
+        self.observe("odoo_rpc_seconds", seconds, model=model, method=method)
+        action = WRITE_ACTIONS.get(method)
+        if action:
+            self.count("records", written_records(method, args), model=model, action=action)
+
+    def observe_fetch(self, table, rows, seconds):
+        self.observe("supabase_fetch_seconds", seconds, table=table)
+        self.count("rows_fetched", rows, table=table)
+
+    def observe_lag(self, source, created_at, now=None):
+        """Fraîcheur d'une commande créée dans Odoo : maintenant - created_at Supabase."""
+        if not created_at:
+            return
+        created = parse_ts(created_at)
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        lag = ((now or datetime.now(timezone.utc)) - created).total_seconds()
+        with self.lock:
+            self.lags.setdefault(source, []).append(max(0.0, lag))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            with self.attach(name):
+                yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def attach(self, name):
+        """Marque le thread courant comme travaillant pour la phase `name`, sans la chronométrer."""
+        if name is None:
+            yield
+            return
+        stack = self.active.setdefault(threading.get_ident(), [])
+        stack.append(name)
+        token = self.current.set(name)
+        try:
+            yield
+        finally:
+            self.current.reset(token)
+            stack.remove(name)
+
+    def current_phase(self, ident=None):
+        """Phase du contexte courant, ou (sync_profile) la dernière ouverte dans le thread `ident`."""
+        if ident is None:
+            return self.current.get()
+        stack = self.active.get(ident)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def run(self, script, directory=None):
+        """Délimite le run de `script` ; écrit les métriques à la sortie, même en cas d'erreur."""
+        self.script = script
+        self.started = time.time()
+        success = False
+        try:
+            yield self
+            success = True
+        finally:
+            finished = time.time()
+            self.result = {
+                "run_duration_seconds": round(finished - self.started, 3),
+                "run_success": int(success),
+                "run_timestamp_seconds": round(finished, 3),
+            }
+            with self.lock:
+                freshness = {source: lag_summary(values) for source, values in sorted(self.lags.items())}
+            for source, lag in freshness.items():
+                print(f"⏱️  Fraîcheur {source} : p50 {lag['p50']:.0f}s, p95 {lag['p95']:.0f}s, "
+                      f"max {lag['max']:.0f}s ({lag['count']} commandes)", flush=True)
+            try:
+                self.write(directory or METRICS_DIR)
+            except OSError as e:
+                print(f"⚠️ Métriques non écrites : {e}", flush=True)
+
+    # ─── EXPORT ───────────────────────────────────────────────────────────────
+    def snapshot(self):
+        with self.lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.as_dict()}
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ]
+            phases = {name: round(seconds, 3) for name, seconds in self.phases.items()}
+            freshness = {source: lag_summary(values) for source, values in sorted(self.lags.items())}
+        return {
+            "script": self.script,
+            "started_at": datetime.fromtimestamp(self.started or time.time(), timezone.utc).isoformat(),
+            **self.result,
+            "phases": phases,
+            "freshness": freshness,
+            "counters": counters,
+            "histograms": histograms,
+            "odoo_rpc": RPC_BUDGET.snapshot(),
+        }
+
+    def openmetrics(self):
+        base = (("script", self.script or "?"),)
+        families = {}              # nom -> (type, [lignes])
+
+        def add(name, kind, sample, labels, value):
+            families.setdefault(name, (kind, []))[1].append(
+                f"{PREFIX}_{sample}{_format_labels(base + labels)} {value}"
+            )
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                add(name, "counter", f"{name}_total", labels, value)
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                for bound, n in histogram.cumulative():
+                    add(name, "histogram", f"{name}_bucket", labels + (("le", str(bound)),), n)
+                add(name, "histogram", f"{name}_bucket", labels + (("le", "+Inf"),), histogram.count)
+                add(name, "histogram", f"{name}_sum", labels, round(histogram.sum, 6))
+                add(name, "histogram", f"{name}_count", labels, histogram.count)
+            for phase, seconds in sorted(self.phases.items()):
+                add("phase_seconds", "gauge", "phase_seconds", (("phase", phase),), round(seconds, 3))
+            for source, values in sorted(self.lags.items()):
+                ordered = sorted(values)
+                labels = (("source", source),)
+                for q in LAG_QUANTILES:
+                    add("order_lag_seconds", "summary", "order_lag_seconds",
+                        labels + (("quantile", str(q)),), round(quantile(ordered, q), 3))
+                add("order_lag_seconds", "summary", "order_lag_seconds_sum", labels, round(sum(ordered), 3))
+                add("order_lag_seconds", "summary", "order_lag_seconds_count", labels, len(ordered))
+        add("odoo_rpc_retries", "counter", "odoo_rpc_retries_total", (), RPC_BUDGET.retries)
+        for name, value in self.result.items():
+            add(name, "gauge", name, (), value)
+
+        lines = []
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            if name in HELP:
+                lines.append(f"# HELP {PREFIX}_{name} {HELP[name]}")
+            lines.extend(samples)
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory=METRICS_DIR):
+        """Écrit <script>.prom et <script>.json (remplacement atomique)."""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.script or "sync")
+        for path, content in (
+            (base + ".prom", self.openmetrics()),
+            (base + ".json", json.dumps(self.snapshot(), indent=2, ensure_ascii=False)),
+        ):
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        print(f"📈 Métriques : {base}.prom, {base}.json", flush=True)
+
+
+METRICS = RunMetrics()
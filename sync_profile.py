@@ -0,0 +1,190 @@
+"""
+sync_profile.py — FENUASIM
+Profilage des synchros sans modifier le code : où part le temps d'un run lent ?
+
+Activé par --profile (main_fast, main_products, sync_leads, billing), par
+SYNC_PROFILE=1, ou pour n'importe quel script :
+  python sync_profile.py main_fast.py --full
+  SYNC_PROFILE=1 python billing.py --batch
+  python main_products.py --profile
+
+Produit dans SYNC_PROFILE_DIR (défaut profiles/) :
+  <script>.pstats        — cProfile du thread principal :
+                           python -m pstats profiles/main_fast.pstats
+  <script>.collapsed     — piles échantillonnées de tous les threads (pool Odoo,
+                           préchargement Supabase, boucle asyncio) toutes les
+                           SYNC_PROFILE_INTERVAL s (défaut 0.005), au format
+                           « pile;repliée N » : flamegraph.pl, speedscope…
+                           La racine de chaque pile est la phase en cours
+                           (supabase.fetch, orders.dedupe, orders.partners,
+                           orders.products, orders.create, catchup.invoice…).
+  <script>.profile.json  — répartition des échantillons par phase et par nature.
+
+Nature d'un échantillon (premier cadre reconnu en partant du haut de la pile) :
+  réseau       attente socket / TLS / HTTP (Odoo, Supabase) ;
+  marshalling  sérialisation XML-RPC / JSON ;
+  attente      verrous, futures du pool, limites de concurrence ;
+  code         fonctions des scripts du dépôt (traitement des lignes) ;
+  autre        le reste (bibliothèques, interpréteur).
+Les threads du pool inoccupés ne sont pas comptés.
+"""
+
+import cProfile
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sync_metrics import METRICS
+
+PROFILE = os.getenv("SYNC_PROFILE", "") not in ("", "0")
+PROFILE_DIR = os.getenv("SYNC_PROFILE_DIR", "profiles")
+INTERVAL = float(os.getenv("SYNC_PROFILE_INTERVAL", "0.005"))
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+NETWORK = ("socket", "ssl", "selectors", "select", "http.client", "urllib3", "requests", "httpx", "httpcore", "h11", "anyio")
+MARSHALLING = ("xmlrpc", "json", "xml", "pyexpat")
+WAITING = ("threading", "queue", "concurrent.futures", "asyncio.locks")
+IMPORTS = ("importlib", "zipimport")      # chargement des modules au démarrage : « autre »
+CATEGORIES = ("réseau", "marshalling", "attente", "code", "autre")
+NO_PHASE = "(hors phase)"
+
+_active = False            # un seul profilage à la fois (python sync_profile.py + --profile)
+
+
+def _category(module, filename):
+    for prefixes, category in (
+        (NETWORK, "réseau"), (MARSHALLING, "marshalling"), (WAITING, "attente"), (IMPORTS, "autre"),
+    ):
+        if module.startswith(prefixes):
+            return category
+    if filename.startswith(REPO):
+        return "code"
+    return None
+
+
+class StackSampler(threading.Thread):
+    """Échantillonne les piles de tous les threads (temps réel, pas seulement CPU)."""
+
+    def __init__(self, script, interval=INTERVAL):
+        super().__init__(name="sync-profile", daemon=True)
+        self.script = script
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.stacks = Counter()    # "phase;cadre;…" -> échantillons
+        self.natures = Counter()   # (phase, nature) -> échantillons
+        self.labels = {}           # code -> (libellé, nature)
+
+    def _label(self, frame):
+        code = frame.f_code
+        known = self.labels.get(code)
+        if known is None:
+            module = frame.f_globals.get("__name__", "?")
+            if module == "__main__":
+                module = self.script
+            known = self.labels[code] = (f"{module}:{code.co_name}", _category(module, code.co_filename))
+        return known
+
+    def sample(self):
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels, nature, busy = [], None, False
+            while frame is not None:
+                label, category = self._label(frame)
+                labels.append(label)
+                if nature is None and category is not None:
+                    nature = category
+                busy = busy or category == "code"
+                frame = frame.f_back
+            # Thread du pool en attente de travail : pas un coût du run
+            if not busy and nature == "attente":
+                continue
+            phase = METRICS.current_phase(ident) or NO_PHASE
+            self.stacks[";".join([phase, *reversed(labels)])] += 1
+            self.natures[(phase, nature or "autre")] += 1
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def summary(self):
+        by_phase = {}
+        for (phase, nature), n in self.natures.items():
+            by_phase.setdefault(phase, Counter())[nature] += n
+        total = Counter()
+        for counts in by_phase.values():
+            total.update(counts)
+        return {
+            "interval_s": self.interval,
+            "samples": sum(total.values()),
+            "by_nature": {nature: total[nature] for nature in CATEGORIES if total[nature]},
+            "by_phase": {
+                phase: {nature: counts[nature] for nature in CATEGORIES if counts[nature]}
+                for phase, counts in sorted(by_phase.items(), key=lambda item: -sum(item[1].values()))
+            },
+        }
+
+
+def _shares(counts):
+    total = sum(counts.values()) or 1
+    return ", ".join(f"{100 * n / total:.0f}% {nature}" for nature, n in counts.items())
+
+
+@contextmanager
+def profiled(script, enabled=False, directory=None):
+    """Profile le bloc si `enabled` ou SYNC_PROFILE ; écrit les fichiers à la sortie."""
+    global _active
+    if _active or not (enabled or PROFILE):
+        yield
+        return
+    _active = True
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, script)
+    sampler = StackSampler(script)
+    profiler = cProfile.Profile()
+    start = time.monotonic()
+    print(f"🔬 Profilage actif ({sampler.interval * 1000:.0f} ms) → {base}.*", flush=True)
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        _active = False
+        profiler.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, n in sampler.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        summary = sampler.summary()
+        summary["wall_s"] = round(time.monotonic() - start, 3)
+        with open(base + ".profile.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"🔬 Profil {script} ({summary['wall_s']:.1f}s, {summary['samples']} échantillons) : "
+              f"{_shares(summary['by_nature']) or 'aucun échantillon'}", flush=True)
+        for phase, counts in list(summary["by_phase"].items())[:8]:
+            print(f"   {phase:<22} {sum(counts.values()):>6}  {_shares(counts)}", flush=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not sys.argv[1].endswith(".py"):
+        print("Usage : python sync_profile.py <script.py> [arguments du script]", flush=True)
+        raise SystemExit(2)
+    path = sys.argv[1]
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    # Le module importé (et non ce __main__) : le script qui appelle profiled() voit le profilage en cours
+    import sync_profile
+    with sync_profile.profiled(os.path.splitext(os.path.basename(path))[0], enabled=True):
+        runpy.run_path(path, run_name="__main__")
@@ -0,0 +1,109 @@
+"""
+sync_state.py — FENUASIM
+Marqueurs de reprise (high-water mark) pour la synchro incrémentale Supabase -> Odoo.
+
+Un marqueur par table source : (created_at, id) de la dernière ligne traitée.
+Il est stocké dans un fichier JSON local (SYNC_STATE_FILE, défaut .sync_state.json),
+conservé d'un run GitHub Actions à l'autre par actions/cache.
+
+Sans fichier (premier run, cache expiré) on repart d'une synchro complète :
+l'anti-doublon Odoo (odoo_index.OrderRefIndex) évite alors toute double création.
+
+Usage :
+  state = WatermarkStore()
+  mark = state.get("orders")
+  for rows in iter_pages(lambda: since_mark(supabase.table("orders").select("*"), mark),
+                         order=("created_at", "id"), after=resume_key(mark)):
+      ...
+  state.advance("orders", rows[-1]); state.save()
+
+Curseurs simples (reprise d'un traitement paginé interrompu, ex. billing.py) :
+  last_id = state.cursor("billing_catchup")        # 0 si absent
+  state.set_cursor("billing_catchup", order_id)    # None : efface le curseur
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+STATE_FILE = os.getenv("SYNC_STATE_FILE", ".sync_state.json")
+# Fenêtre de recouvrement : rattrape les lignes écrites en retard (paiement
+# confirmé après la création de la ligne, réplication…)
+OVERLAP_MINUTES = int(os.getenv("SYNC_OVERLAP_MINUTES", "10"))
+
+
+def parse_ts(value):
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def id_key(value):
+    """Id comparable quel que soit son type : absent < entier < texte (uuid)."""
+    if value is None:
+        return (0, 0, "")
+    if isinstance(value, (int, float)):
+        return (1, value, "")
+    return (2, 0, str(value))
+
+
+class WatermarkStore:
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠ Fichier d'état {path} illisible ({e}) — synchro complète", flush=True)
+
+    def get(self, table):
+        """Retourne (created_at, id) du dernier enregistrement traité, ou None."""
+        mark = self.state.get(table)
+        return (mark["created_at"], mark["id"]) if mark else None
+
+    def advance(self, table, row):
+        """Avance le marqueur si `row` est plus récente que le marqueur actuel."""
+        if not row.get("created_at"):
+            return
+        current = self.get(table)
+        if current:
+            if (parse_ts(row["created_at"]), id_key(row.get("id"))) <= (parse_ts(current[0]), id_key(current[1])):
+                return
+        self.state[table] = {"created_at": row["created_at"], "id": row.get("id")}
+
+    def cursor(self, name, default=0):
+        return self.state.get("cursors", {}).get(name, default)
+
+    def set_cursor(self, name, value):
+        cursors = self.state.setdefault("cursors", {})
+        if value is None:
+            cursors.pop(name, None)
+        else:
+            cursors[name] = value
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def since_mark(query, mark, overlap_minutes=OVERLAP_MINUTES):
+    """
+    Restreint une requête Supabase aux lignes postérieures au marqueur, avec
+    recouvrement : created_at >= marqueur - overlap (les doublons sont filtrés
+    côté Odoo). Sans recouvrement, la requête est laissée telle quelle : la
+    reprise stricte après (created_at, id) est la clé de départ de la
+    pagination (resume_key), pour un seul filtre or=(…) par requête.
+    """
+    if not mark or overlap_minutes <= 0:
+        return query
+    since = parse_ts(mark[0]) - timedelta(minutes=overlap_minutes)
+    return query.gte("created_at", since.isoformat())
+
+
+def resume_key(mark, overlap_minutes=OVERLAP_MINUTES):
+    """Clé (created_at, id) pour iter_pages(after=…) sans recouvrement, sinon None."""
+    if not mark or overlap_minutes > 0:
+        return None
+    return tuple(mark)